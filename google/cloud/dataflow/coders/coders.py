@@ -33,6 +33,18 @@ except ImportError:
   import dill
 
 
+def _var_int_size(value):
+  """Returns the number of bytes of the variable-length encoding of an int."""
+  if value < 0:
+    # Negative values are encoded as 64-bit two's complement integers.
+    return 10
+  size = 1
+  while value >= 0x80:
+    value >>= 7
+    size += 1
+  return size
+
+
 def serialize_coder(coder):
   from google.cloud.dataflow.internal import pickler
   return '%s$%s' % (coder.__class__.__name__, pickler.dumps(coder))
@@ -55,6 +67,23 @@ class Coder(object):
     """Decodes the given byte string into the corresponding object."""
     raise NotImplementedError('Decode not implemented: %s.' % self)
 
+  def estimate_size(self, value, nested=False):
+    """Estimates the size of the encoding of a value, in bytes.
+
+    The default implementation encodes the value. Coders for which the size
+    can be computed more cheaply than by encoding override this method.
+
+    Args:
+      value: the value whose encoded size is estimated.
+      nested: whether the value is encoded as part of a larger value (e.g. a
+        tuple component), in which case its length is encoded too.
+
+    Returns:
+      The estimated number of bytes.
+    """
+    size = len(self.encode(value))
+    return size + _var_int_size(size) if nested else size
+
   def is_deterministic(self):
     """Whether this coder is guaranteed to encode values deterministically.
 
@@ -208,6 +237,10 @@ class BytesCoder(FastCoder):
   def _create_impl(self):
     return coder_impl.BytesCoderImpl()
 
+  def estimate_size(self, value, nested=False):
+    size = len(value)
+    return size + _var_int_size(size) if nested else size
+
   def is_deterministic(self):
     return True
 
@@ -218,6 +251,10 @@ class VarIntCoder(FastCoder):
   def _create_impl(self):
     return coder_impl.VarIntCoderImpl()
 
+  def estimate_size(self, value, nested=False):
+    # The encoding delimits itself: nested values have the same size.
+    return _var_int_size(value)
+
   def is_deterministic(self):
     return True
 
@@ -232,6 +269,9 @@ class FloatCoder(Coder):
   def decode(self, encoded):
     return struct.unpack('<d', encoded)[0]
 
+  def estimate_size(self, value, nested=False):
+    return 9 if nested else 8
+
   def is_deterministic(self):
     return True
 
@@ -339,6 +379,12 @@ class TupleCoder(FastCoder):
   def is_deterministic(self):
     return all(c.is_deterministic() for c in self._coders)
 
+  def estimate_size(self, value, nested=False):
+    # Components are always encoded nested, and the tuple itself is not
+    # prefixed by its length.
+    return sum(c.estimate_size(v, nested=True)
+               for c, v in zip(self._coders, value))
+
   @staticmethod
   def from_type_hint(typehint, registry):
     return TupleCoder([registry.get_coder(t) for t in typehint.tuple_types])
@@ -411,6 +457,11 @@ class WindowedValueCoder(FastCoder):
                                               self.timestamp_coder,
                                               self.window_coder])
 
+  def estimate_size(self, value, nested=False):
+    return (self.wrapped_value_coder.estimate_size(value.value, nested=True) +
+            self.timestamp_coder.estimate_size(value.timestamp, nested=True) +
+            self.window_coder.estimate_size(value.windows, nested=True))
+
   def as_cloud_object(self):
     value = super(WindowedValueCoder, self).as_cloud_object()
     value['is_wrapper'] = True
@@ -59,6 +59,7 @@ class CodersTest(unittest.TestCase):
     self._observe(coder)
     for v in values:
       self.assertEqual(v, coder.decode(coder.encode(v)))
+      self.assertEqual(len(coder.encode(v)), coder.estimate_size(v))
 
   def test_custom_coder(self):
     class CustomCoder(coders.Coder):
@@ -109,6 +110,9 @@ class CodersTest(unittest.TestCase):
         ((1, 2), 'a'),
         ((-2, 5), u'a\u0101' * 100),
         ((300, 1), 'abc\0' * 5))
+    self.check_coder(
+        coders.TupleCoder((coders.FloatCoder(), coders.BytesCoder())),
+        (1.5, 'a'), (-2.0, 'b' * 200))
 
   def test_base64_pickle_coder(self):
     self.check_coder(coders.Base64PickleCoder(), 'a', 1, 1.5, (1, 2, 3))
@@ -24,6 +24,7 @@ from google.cloud.dataflow.pipeline import Pipeline
 from google.cloud.dataflow.pvalue import AsDict
 from google.cloud.dataflow.pvalue import AsIter as AllOf
 from google.cloud.dataflow.pvalue import AsList
+from google.cloud.dataflow.pvalue import AsMultimap
 from google.cloud.dataflow.pvalue import AsSingleton
 from google.cloud.dataflow.pvalue import EmptySideInput
 from google.cloud.dataflow.pvalue import SideOutputValue
@@ -285,19 +286,38 @@ class DataflowTest(unittest.TestCase):
     assert_that(results, matcher(1, a_list))
     pipeline.run()
 
-  def test_as_dict_without_unique_labels(self):
+  def test_as_dict_twice(self):
     some_kvs = [('a', 1), ('b', 2)]
     pipeline = Pipeline('DirectPipelineRunner')
     main_input = pipeline | Create('main input', [1])
     side_kvs = pipeline | Create('side kvs', some_kvs)
-    with self.assertRaises(RuntimeError) as e:
-      _ = main_input | FlatMap(
-          'test',
-          lambda x, dct1, dct2: [[x, dct1, dct2]],
-          AsDict(side_kvs), AsDict(side_kvs))
-    self.assertTrue(
-        e.exception.message.startswith(
-            'Transform with label AsDict already applied.'))
+    results = main_input | FlatMap(
+        'test',
+        lambda x, dct1, dct2: [[x, dct1, dct2]],
+        AsDict(side_kvs), AsDict(side_kvs))
+
+    def  matcher(expected_elem, expected_kvs):
+      def match(actual):
+        [[actual_elem, actual_dict1, actual_dict2]] = actual
+        equal_to([expected_elem])([actual_elem])
+        equal_to(expected_kvs)(actual_dict1.iteritems())
+        equal_to(expected_kvs)(actual_dict2.iteritems())
+      return match
+
+    assert_that(results, matcher(1, some_kvs))
+    pipeline.run()
+
+  def test_as_multimap(self):
+    some_kvs = [('a', 1), ('b', 2), ('a', 3)]
+    pipeline = Pipeline('DirectPipelineRunner')
+    main_input = pipeline | Create('main input', ['a', 'b', 'c'])
+    side_kvs = pipeline | Create('side kvs', some_kvs)
+    results = main_input | Map(
+        'test',
+        lambda x, multimap: (x, sorted(multimap.get(x, []))),
+        AsMultimap(side_kvs))
+    assert_that(results, equal_to([('a', [1, 3]), ('b', [2]), ('c', [])]))
+    pipeline.run()
 
   def test_as_dict_with_unique_labels(self):
     some_kvs = [('a', 1), ('b', 2)]
@@ -30,6 +30,7 @@ from google.cloud.dataflow.utils import dependency
 from google.cloud.dataflow.utils import retry
 from google.cloud.dataflow.utils.names import PropertyNames
 from google.cloud.dataflow.utils.options import GoogleCloudOptions
+from google.cloud.dataflow.utils.options import ProfilingOptions
 from google.cloud.dataflow.utils.options import StandardOptions
 from google.cloud.dataflow.utils.options import WorkerOptions
 
@@ -175,6 +176,7 @@ class Environment(object):
     self.standard_options = options.view_as(StandardOptions)
     self.google_cloud_options = options.view_as(GoogleCloudOptions)
     self.worker_options = options.view_as(WorkerOptions)
+    self.profiling_options = options.view_as(ProfilingOptions)
     self.proto = dataflow.Environment()
     self.proto.clusterManagerApiService = COMPUTE_API_SERVICE
     self.proto.dataset = '%s/cloud_dataflow' % BIGQUERY_API_SERVICE
@@ -205,6 +207,18 @@ class Environment(object):
             value=to_json_value(job_type)),
         dataflow.Environment.VersionValue.AdditionalProperty(
             key='major', value=to_json_value(environment_version))])
+    # Pipeline options read by the worker, which gets them as the JSON
+    # sdk_pipeline_options property (see batchworker.BatchWorker).
+    worker_pipeline_options = {
+        'profile_fraction': self.profiling_options.profile_fraction}
+    if self.profiling_options.profile_location:
+      worker_pipeline_options['profile_location'] = (
+          self.profiling_options.profile_location)
+    self.proto.sdkPipelineOptions = (
+        dataflow.Environment.SdkPipelineOptionsValue())
+    self.proto.sdkPipelineOptions.additionalProperties.append(
+        dataflow.Environment.SdkPipelineOptionsValue.AdditionalProperty(
+            key='options', value=to_json_value(worker_pipeline_options)))
     # Worker pool(s) information.
     package_descriptors = []
     for package in packages:
@@ -681,18 +695,12 @@ class DataflowWorkerClient(object):
       work_item_status.requestedLeaseDuration = worker.desired_lease_duration()
 
     if progress is not None:
-      work_item_progress = dataflow.ApproximateProgress()
-      work_item_status.progress = work_item_progress
-
-      if progress.position is not None:
-        work_item_progress.position = (
-            reader_position_to_cloud_position(progress.position))
-      elif progress.percent_complete is not None:
-        work_item_progress.percentComplete = progress.percent_complete
-      elif progress.remaining_time is not None:
-        work_item_progress.remainingTime = progress.remaining_time
-      else:
+      if (progress.position is None and progress.percent_complete is None and
+          progress.remaining_time is None):
         raise TypeError('Unknown type of progress')
+      # All the measures of progress are reported, e.g. the service splits at
+      # positions but estimates the remaining work from the percent complete.
+      work_item_status.progress = reader_progress_to_cloud_progress(progress)
 
     if dynamic_split_result_to_report is not None:
       assert isinstance(dynamic_split_result_to_report,
@@ -724,6 +732,8 @@ class DataflowWorkerClient(object):
     for op in work_item.map_task.executed_operations:
       for counter in op.itercounters():
         append_counter(work_item_status, counter, tentative=not completed)
+    for counter in work_item.counters:
+      append_counter(work_item_status, counter, tentative=not completed)
 
     report_request = dataflow.ReportWorkItemStatusRequest()
     report_request.currentWorkerTime = worker.current_time
@@ -778,8 +788,10 @@ def reader_position_to_cloud_position(reader_position):
   if reader_position.concat_position is not None:
     concat_position = dataflow.ConcatPosition()
     concat_position.index = reader_position.concat_position.index
-    concat_position.position = reader_position_to_cloud_position(
-        reader_position.concat_position.position)
+    # The inner position is not set for a position at the start of a source.
+    if reader_position.concat_position.position is not None:
+      concat_position.position = reader_position_to_cloud_position(
+          reader_position.concat_position.position)
     cloud_position.concatPosition = concat_position
 
   return cloud_position
@@ -802,10 +814,12 @@ def cloud_progress_to_reader_progress(cloud_progress):
 def cloud_position_to_reader_position(cloud_position):
   concat_position = None
   if cloud_position.concatPosition is not None:
-    inner_position = cloud_position_to_reader_position(
-        cloud_position.concatPosition.position)
-    concat_position = iobase.ConcatPosition(cloud_position.index,
-                                            inner_position)
+    inner_position = None
+    if cloud_position.concatPosition.position is not None:
+      inner_position = cloud_position_to_reader_position(
+          cloud_position.concatPosition.position)
+    concat_position = iobase.ConcatPosition(
+        cloud_position.concatPosition.index, inner_position)
 
   return iobase.ReaderPosition(cloud_position.end, cloud_position.key,
                                cloud_position.byteOffset,
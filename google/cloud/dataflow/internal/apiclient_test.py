@@ -93,6 +93,31 @@ class UtilTest(unittest.TestCase):
     self.assertIsInstance(reader_position, iobase.ReaderPosition)
     self.assertEqual(9999, reader_position.byte_offset)
 
+  def test_cloud_position_to_reader_position_concat_position(self):
+    cloud_position = dataflow.Position()
+    cloud_position.concatPosition = dataflow.ConcatPosition()
+    cloud_position.concatPosition.index = 3
+    cloud_position.concatPosition.position = dataflow.Position()
+    cloud_position.concatPosition.position.recordIndex = 7
+
+    reader_position = apiclient.cloud_position_to_reader_position(
+        cloud_position)
+    self.assertEqual(3, reader_position.concat_position.index)
+    self.assertEqual(7, reader_position.concat_position.position.record_index)
+
+  def test_concat_position_at_start_of_source(self):
+    reader_position = iobase.ReaderPosition(
+        concat_position=iobase.ConcatPosition(2, None))
+
+    cloud_position = apiclient.reader_position_to_cloud_position(
+        reader_position)
+    self.assertEqual(2, cloud_position.concatPosition.index)
+    self.assertIsNone(cloud_position.concatPosition.position)
+    reader_position = apiclient.cloud_position_to_reader_position(
+        cloud_position)
+    self.assertEqual(2, reader_position.concat_position.index)
+    self.assertIsNone(reader_position.concat_position.position)
+
   def test_approximate_progress_to_dynamic_split_request(self):
     approximate_progress = dataflow.ApproximateProgress()
     approximate_progress.percentComplete = 0.123
@@ -15,6 +15,7 @@
 """A package defining several input sources and output sinks."""
 
 # pylint: disable=wildcard-import
+from google.cloud.dataflow.io.avroio import *
 from google.cloud.dataflow.io.bigquery import *
 from google.cloud.dataflow.io.fileio import *
 from google.cloud.dataflow.io.iobase import Read
@@ -0,0 +1,796 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sources and sinks for Avro container files.
+
+Records are encoded with the Avro binary encoding described by the schema
+stored in the header of each file. Schemas are compiled once into encoding and
+decoding functions, so reading and writing does not interpret the schema for
+every record. Only the 'null' and 'deflate' codecs are supported.
+
+Files are split on block boundaries: a block belongs to the byte range that
+contains the offset of its first byte, and a reader starting in the middle of
+a file finds its first block by scanning for the sync marker of the file.
+"""
+
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import struct
+import zlib
+
+from google.cloud.dataflow.io import fileio
+from google.cloud.dataflow.io import iobase
+from google.cloud.dataflow.io import range_trackers
+
+
+__all__ = ['AvroFileSource', 'AvroFileSink']
+
+
+_MAGIC = 'Obj\x01'
+_SYNC_SIZE = 16
+_SCHEMA_KEY = 'avro.schema'
+_CODEC_KEY = 'avro.codec'
+_CODECS = ('null', 'deflate')
+
+_FLOAT = struct.Struct('<f')
+_DOUBLE = struct.Struct('<d')
+
+
+# -----------------------------------------------------------------------------
+# Binary encoding of primitive values.
+
+
+def _encode_long(n):
+  """Returns the zig-zag variable length encoding of an int or long."""
+  n = (n << 1) ^ (n >> 63)
+  if n < 0x80:
+    return chr(n)
+  chunks = []
+  while n >= 0x80:
+    chunks.append(chr((n & 0x7f) | 0x80))
+    n >>= 7
+  chunks.append(chr(n))
+  return ''.join(chunks)
+
+
+def _decode_long(buf, pos):
+  """Decodes an int or long at position pos of buf.
+
+  Returns:
+    A (value, position after the value) tuple.
+  """
+  b = ord(buf[pos])
+  pos += 1
+  n = b & 0x7f
+  shift = 7
+  while b & 0x80:
+    b = ord(buf[pos])
+    pos += 1
+    n |= (b & 0x7f) << shift
+    shift += 7
+  return (n >> 1) ^ -(n & 1), pos
+
+
+def _read_long(f):
+  """Reads an int or long from a file, returning None at end of file."""
+  b = f.read(1)
+  if not b:
+    return None
+  b = ord(b)
+  n = b & 0x7f
+  shift = 7
+  while b & 0x80:
+    b = f.read(1)
+    if not b:
+      raise ValueError('Unexpected end of file while reading a long.')
+    b = ord(b)
+    n |= (b & 0x7f) << shift
+    shift += 7
+  return (n >> 1) ^ -(n & 1)
+
+
+def _read_exactly(f, num_bytes):
+  data = f.read(num_bytes)
+  if len(data) != num_bytes:
+    raise ValueError('Unexpected end of file: expected %d bytes, got %d.' %
+                     (num_bytes, len(data)))
+  return data
+
+
+# -----------------------------------------------------------------------------
+# Schema compilation.
+
+
+_PRIMITIVE_TYPES = frozenset(
+    ['null', 'boolean', 'int', 'long', 'float', 'double', 'bytes', 'string'])
+
+
+def _encode_null(unused_datum, unused_out):
+  pass
+
+
+def _decode_null(unused_buf, pos):
+  return None, pos
+
+
+def _encode_boolean(datum, out):
+  out.append('\x01' if datum else '\x00')
+
+
+def _decode_boolean(buf, pos):
+  return buf[pos] != '\x00', pos + 1
+
+
+def _encode_int(datum, out):
+  out.append(_encode_long(datum))
+
+
+def _encode_float(datum, out):
+  out.append(_FLOAT.pack(datum))
+
+
+def _decode_float(buf, pos):
+  return _FLOAT.unpack_from(buf, pos)[0], pos + 4
+
+
+def _encode_double(datum, out):
+  out.append(_DOUBLE.pack(datum))
+
+
+def _decode_double(buf, pos):
+  return _DOUBLE.unpack_from(buf, pos)[0], pos + 8
+
+
+def _encode_bytes(datum, out):
+  out.append(_encode_long(len(datum)))
+  out.append(datum)
+
+
+def _decode_bytes(buf, pos):
+  size, pos = _decode_long(buf, pos)
+  end = pos + size
+  return buf[pos:end], end
+
+
+def _encode_string(datum, out):
+  if isinstance(datum, unicode):
+    datum = datum.encode('utf-8')
+  out.append(_encode_long(len(datum)))
+  out.append(datum)
+
+
+def _decode_string(buf, pos):
+  size, pos = _decode_long(buf, pos)
+  end = pos + size
+  return buf[pos:end].decode('utf-8'), end
+
+
+_PRIMITIVE_CODECS = {
+    'null': (_encode_null, _decode_null),
+    'boolean': (_encode_boolean, _decode_boolean),
+    'int': (_encode_int, _decode_long),
+    'long': (_encode_int, _decode_long),
+    'float': (_encode_float, _decode_float),
+    'double': (_encode_double, _decode_double),
+    'bytes': (_encode_bytes, _decode_bytes),
+    'string': (_encode_string, _decode_string),
+}
+
+
+def _is_integer(datum):
+  return isinstance(datum, (int, long)) and not isinstance(datum, bool)
+
+
+def _is_number(datum):
+  return isinstance(datum, (int, long, float)) and not isinstance(datum, bool)
+
+
+# Predicates used to pick the branch of a union a datum is written with.
+_PRIMITIVE_MATCHERS = {
+    'null': lambda datum: datum is None,
+    'boolean': lambda datum: isinstance(datum, bool),
+    'int': _is_integer,
+    'long': _is_integer,
+    'float': _is_number,
+    'double': _is_number,
+    'bytes': lambda datum: isinstance(datum, str),
+    'string': lambda datum: isinstance(datum, basestring),
+}
+
+
+class _NamedType(object):
+  """A compiled named type, which may be referenced before it is complete."""
+
+  def __init__(self):
+    self.encode = None
+    self.decode = None
+    self.matches = None
+
+
+class _SchemaCompiler(object):
+  """Compiles a parsed Avro schema into encoding and decoding functions.
+
+  Encoding functions are called as encode(datum, out) and append the encoded
+  datum to the list out. Decoding functions are called as decode(buf, pos) and
+  return a (datum, position after the datum) tuple. Records are represented
+  as dicts, enums as their symbol strings, arrays as lists and maps as dicts.
+  """
+
+  def __init__(self):
+    self._named_types = {}
+
+  def compile(self, schema, namespace=None):
+    """Returns an (encode, decode, matches) tuple for a parsed schema."""
+    if isinstance(schema, basestring):
+      if schema in _PRIMITIVE_TYPES:
+        encode, decode = _PRIMITIVE_CODECS[schema]
+        return encode, decode, _PRIMITIVE_MATCHERS[schema]
+      return self._reference(schema, namespace)
+    elif isinstance(schema, list):
+      return self._compile_union(schema, namespace)
+    elif isinstance(schema, dict):
+      schema_type = schema.get('type')
+      if schema_type in ('record', 'error'):
+        return self._compile_record(schema, namespace)
+      elif schema_type == 'enum':
+        return self._compile_enum(schema, namespace)
+      elif schema_type == 'fixed':
+        return self._compile_fixed(schema, namespace)
+      elif schema_type == 'array':
+        return self._compile_array(schema, namespace)
+      elif schema_type == 'map':
+        return self._compile_map(schema, namespace)
+      elif schema_type is not None:
+        # Primitive types may be written as {"type": "string"}, possibly with
+        # extra attributes (e.g. logical types) that do not change the encoding.
+        return self.compile(schema_type, namespace)
+    raise ValueError('Invalid Avro schema: %r' % (schema,))
+
+  def _full_name(self, schema, namespace):
+    name = schema.get('name')
+    if not isinstance(name, basestring):
+      raise ValueError('Named Avro type without a name: %r' % (schema,))
+    if '.' in name:
+      return name, name.rsplit('.', 1)[0]
+    namespace = schema.get('namespace', namespace)
+    if namespace:
+      return '%s.%s' % (namespace, name), namespace
+    return name, namespace
+
+  def _define(self, schema, namespace):
+    full_name, namespace = self._full_name(schema, namespace)
+    if full_name in self._named_types:
+      raise ValueError('Avro type %s is defined more than once.' % full_name)
+    named_type = _NamedType()
+    self._named_types[full_name] = named_type
+    return named_type, namespace
+
+  def _reference(self, name, namespace):
+    named_type = None
+    if namespace and '.' not in name:
+      named_type = self._named_types.get('%s.%s' % (namespace, name))
+    if named_type is None:
+      named_type = self._named_types.get(name)
+    if named_type is None:
+      raise ValueError('Unknown Avro type: %s' % name)
+    if named_type.encode is not None:
+      return named_type.encode, named_type.decode, named_type.matches
+    # A recursive reference to a type that is still being compiled.
+    return (lambda datum, out: named_type.encode(datum, out),
+            lambda buf, pos: named_type.decode(buf, pos),
+            lambda datum: named_type.matches(datum))
+
+  def _compile_record(self, schema, namespace):
+    named_type, namespace = self._define(schema, namespace)
+    fields = []
+    for field in schema.get('fields', ()):
+      encode, decode, _ = self.compile(field['type'], namespace)
+      fields.append((field['name'], encode, decode, field.get('default')))
+    field_names = frozenset(name for name, _, _, _ in fields)
+
+    def encode_record(datum, out):
+      for name, encode_field, _, default in fields:
+        encode_field(datum.get(name, default), out)
+
+    def decode_record(buf, pos):
+      record = {}
+      for name, _, decode_field, _ in fields:
+        record[name], pos = decode_field(buf, pos)
+      return record, pos
+
+    def matches_record(datum):
+      return isinstance(datum, dict) and field_names.issuperset(datum)
+
+    named_type.encode = encode_record
+    named_type.decode = decode_record
+    named_type.matches = matches_record
+    return encode_record, decode_record, matches_record
+
+  def _compile_enum(self, schema, namespace):
+    named_type, _ = self._define(schema, namespace)
+    symbols = list(schema['symbols'])
+    indices = dict((symbol, _encode_long(index))
+                   for index, symbol in enumerate(symbols))
+
+    def encode_enum(datum, out):
+      try:
+        out.append(indices[datum])
+      except KeyError:
+        raise ValueError('%r is not a symbol of Avro enum %s' %
+                         (datum, schema['name']))
+
+    def decode_enum(buf, pos):
+      index, pos = _decode_long(buf, pos)
+      return symbols[index], pos
+
+    named_type.encode = encode_enum
+    named_type.decode = decode_enum
+    named_type.matches = lambda datum: datum in indices
+    return named_type.encode, named_type.decode, named_type.matches
+
+  def _compile_fixed(self, schema, namespace):
+    named_type, _ = self._define(schema, namespace)
+    size = schema['size']
+
+    def encode_fixed(datum, out):
+      if len(datum) != size:
+        raise ValueError('Avro fixed %s requires %d bytes, got %d' %
+                         (schema['name'], size, len(datum)))
+      out.append(datum)
+
+    def decode_fixed(buf, pos):
+      end = pos + size
+      return buf[pos:end], end
+
+    named_type.encode = encode_fixed
+    named_type.decode = decode_fixed
+    named_type.matches = (
+        lambda datum: isinstance(datum, str) and len(datum) == size)
+    return named_type.encode, named_type.decode, named_type.matches
+
+  def _compile_array(self, schema, namespace):
+    encode_item, decode_item, _ = self.compile(schema['items'], namespace)
+
+    def encode_array(datum, out):
+      if datum:
+        out.append(_encode_long(len(datum)))
+        for item in datum:
+          encode_item(item, out)
+      out.append('\x00')
+
+    def decode_array(buf, pos):
+      items = []
+      while True:
+        count, pos = _decode_long(buf, pos)
+        if count == 0:
+          return items, pos
+        if count < 0:
+          # A negative count is followed by the size of the block in bytes.
+          count = -count
+          _, pos = _decode_long(buf, pos)
+        for _ in xrange(count):
+          item, pos = decode_item(buf, pos)
+          items.append(item)
+
+    return (encode_array, decode_array,
+            lambda datum: isinstance(datum, (list, tuple)))
+
+  def _compile_map(self, schema, namespace):
+    encode_value, decode_value, _ = self.compile(schema['values'], namespace)
+
+    def encode_map(datum, out):
+      if datum:
+        out.append(_encode_long(len(datum)))
+        for key, value in datum.iteritems():
+          _encode_string(key, out)
+          encode_value(value, out)
+      out.append('\x00')
+
+    def decode_map(buf, pos):
+      result = {}
+      while True:
+        count, pos = _decode_long(buf, pos)
+        if count == 0:
+          return result, pos
+        if count < 0:
+          count = -count
+          _, pos = _decode_long(buf, pos)
+        for _ in xrange(count):
+          key, pos = _decode_string(buf, pos)
+          result[key], pos = decode_value(buf, pos)
+
+    return encode_map, decode_map, lambda datum: isinstance(datum, dict)
+
+  def _compile_union(self, schema, namespace):
+    branches = [self.compile(branch, namespace) for branch in schema]
+    indices = [_encode_long(index) for index in xrange(len(branches))]
+
+    def encode_union(datum, out):
+      for index, (encode, _, matches) in enumerate(branches):
+        if matches(datum):
+          out.append(indices[index])
+          encode(datum, out)
+          return
+      raise ValueError('%r does not match any branch of Avro union %s' %
+                       (datum, json.dumps(schema)))
+
+    def decode_union(buf, pos):
+      index, pos = _decode_long(buf, pos)
+      return branches[index][1](buf, pos)
+
+    def matches_union(datum):
+      return any(matches(datum) for _, _, matches in branches)
+
+    return encode_union, decode_union, matches_union
+
+
+def parse_schema(schema):
+  """Parses an Avro schema given as a JSON string or as parsed JSON."""
+  if isinstance(schema, basestring) and schema not in _PRIMITIVE_TYPES:
+    try:
+      schema = json.loads(schema)
+    except ValueError:
+      # A bare reference to a type name is not valid JSON.
+      pass
+  return schema
+
+
+class _DatumCodec(object):
+  """Encodes and decodes data described by an Avro schema."""
+
+  def __init__(self, schema):
+    self.schema = parse_schema(schema)
+    self._encode, self._decode, _ = _SchemaCompiler().compile(self.schema)
+
+  def encode(self, datum):
+    out = []
+    self._encode(datum, out)
+    return ''.join(out)
+
+  def encode_to(self, datum, out):
+    self._encode(datum, out)
+
+  def decode_block(self, buf, count):
+    """Decodes count consecutive data from a string."""
+    decode = self._decode
+    data = []
+    pos = 0
+    for _ in xrange(count):
+      datum, pos = decode(buf, pos)
+      data.append(datum)
+    if pos != len(buf):
+      raise ValueError('Avro block has %d trailing bytes.' % (len(buf) - pos))
+    return data
+
+
+# -----------------------------------------------------------------------------
+# Container files.
+
+
+def _compress(data, codec):
+  if codec == 'deflate':
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+  return data
+
+
+def _decompress(data, codec):
+  if codec == 'deflate':
+    return zlib.decompress(data, -zlib.MAX_WBITS)
+  return data
+
+
+def _read_header(f):
+  """Reads the header of an Avro container file from the current position.
+
+  Returns:
+    A (metadata dict, sync marker) tuple.
+  """
+  if f.read(len(_MAGIC)) != _MAGIC:
+    raise ValueError('Not an Avro container file.')
+  metadata = {}
+  while True:
+    count = _read_long(f)
+    if not count:
+      break
+    if count < 0:
+      count = -count
+      _read_long(f)
+    for _ in xrange(count):
+      key = _read_exactly(f, _read_long(f))
+      metadata[key] = _read_exactly(f, _read_long(f))
+  return metadata, _read_exactly(f, _SYNC_SIZE)
+
+
+def _encode_header(metadata, sync_marker):
+  out = [_MAGIC, _encode_long(len(metadata))]
+  for key, value in sorted(metadata.iteritems()):
+    _encode_bytes(key, out)
+    _encode_bytes(value, out)
+  out.append('\x00')
+  out.append(sync_marker)
+  return ''.join(out)
+
+
+# -----------------------------------------------------------------------------
+# AvroFileSource, AvroFileSink.
+
+
+class AvroFileSource(fileio.FileBasedSource):
+  """A source for a GCS or local Avro container file."""
+
+  def __init__(self, file_path, start_offset=None, end_offset=None,
+               coder=None):
+    """Initialize an AvroFileSource.
+
+    Args:
+      file_path: The file path to read from as a local file path or a GCS
+        gs:// path. The path can contain glob characters (*, ?, and [...]
+        sets).
+      start_offset: The byte offset in the source file that the reader
+        should start reading. By default is 0 (beginning of file).
+      end_offset: The byte offset in the file that the reader should stop
+        reading. By default it is the end of the file.
+      coder: Optional coder used to decode each record. If specified, the
+        records of the file must be Avro bytes. Otherwise records are returned
+        as decoded using the schema of the file (records as dicts, arrays as
+        lists, etc.).
+
+    Raises:
+      TypeError: if file_path is not a string.
+
+    If the file_path contains glob characters then the start_offset and
+    end_offset must not be specified.
+
+    A reader returns the records of all the blocks starting at an offset in
+    [start_offset, end_offset), hence byte ranges can be cut at arbitrary
+    offsets.
+    """
+    super(AvroFileSource, self).__init__(file_path, start_offset, end_offset)
+    self.coder = coder
+
+  @property
+  def format(self):
+    """Source format name required for remote execution."""
+    return 'avro'
+
+  def __eq__(self, other):
+    return (self.file_path == other.file_path and
+            self.start_offset == other.start_offset and
+            self.end_offset == other.end_offset and
+            self.coder == other.coder)
+
+  def _file_source(self, file_path, start_offset=None, end_offset=None):
+    return AvroFileSource(file_path, start_offset=start_offset,
+                          end_offset=end_offset, coder=self.coder)
+
+  def _file_reader(self):
+    return AvroFileReader(self)
+
+
+class AvroFileSink(iobase.NativeSink):
+  """A sink to a GCS or local Avro container file."""
+
+  def __init__(self, file_path, schema=None, codec='deflate', coder=None):
+    """Initialize an AvroFileSink.
+
+    Args:
+      file_path: The file path to write to as a local file path or a GCS
+        gs:// path.
+      schema: The Avro schema of the records written, as a JSON string or as
+        parsed JSON. Defaults to "bytes" if a coder is specified.
+      codec: The codec used to compress blocks: 'deflate' or 'null'.
+      coder: Optional coder used to encode each value into an Avro bytes
+        record.
+
+    Raises:
+      TypeError: if file_path is not a string.
+      ValueError: if the codec is not supported or no schema is specified.
+    """
+    if not isinstance(file_path, basestring):
+      raise TypeError(
+          '%s: file_path must be a string; got %r instead' %
+          (self.__class__.__name__, file_path))
+    if codec not in _CODECS:
+      raise ValueError('Unsupported Avro codec %r; expected one of %s' %
+                       (codec, ', '.join(_CODECS)))
+    if schema is None:
+      if coder is None:
+        raise ValueError('An Avro sink requires a schema or a coder.')
+      schema = 'bytes'
+    self.file_path = file_path
+    self.schema = parse_schema(schema)
+    self.codec = codec
+    self.coder = coder
+
+    self.is_gcs_sink = file_path.startswith('gs://')
+
+  @property
+  def format(self):
+    """Sink format name required for remote execution."""
+    return 'avro'
+
+  @property
+  def path(self):
+    return self.file_path
+
+  def writer(self):
+    return AvroFileWriter(self)
+
+  def __eq__(self, other):
+    return (self.file_path == other.file_path and
+            self.schema == other.schema and
+            self.codec == other.codec and
+            self.coder == other.coder)
+
+
+# -----------------------------------------------------------------------------
+# AvroFileReader.
+
+
+class AvroFileReader(fileio.FileBasedReader):
+  """A reader for an Avro file source."""
+
+  # Number of bytes read at a time while looking for a sync marker.
+  read_block_size = 64 * 1024
+
+  def __enter__(self):
+    self._file = self._open_file()
+    metadata, self._sync_marker = _read_header(self._file)
+    header_end = self._file.tell()
+    self.codec = metadata.get(_CODEC_KEY, 'null')
+    if self.codec not in _CODECS:
+      raise ValueError('Avro file %s uses unsupported codec %r' %
+                       (self.source.file_path, self.codec))
+    self._datum_codec = _DatumCodec(metadata[_SCHEMA_KEY])
+
+    if self.end_offset is None:
+      self._file.seek(0, os.SEEK_END)
+      self.end_offset = self._file.tell()
+
+    # The first block to read is the first one starting at or after the start
+    # offset. Every block (including the first one) follows a sync marker.
+    if self.start_offset <= header_end:
+      self._first_block_offset = header_end
+      self._file.seek(header_end)
+    else:
+      self._first_block_offset = self._seek_past_sync_marker(
+          self.start_offset - _SYNC_SIZE)
+    if self._first_block_offset is not None:
+      self.current_offset = max(self.start_offset, self._first_block_offset)
+
+    self.range_tracker = range_trackers.OffsetRangeTracker(self.start_offset,
+                                                           self.end_offset)
+    return self
+
+  def _seek_past_sync_marker(self, offset):
+    """Positions the file after the first sync marker starting at offset.
+
+    Returns:
+      The offset following the sync marker, or None if there is no block
+      starting in the range of the reader.
+    """
+    self._file.seek(offset)
+    buf = ''
+    buf_offset = offset
+    while buf_offset < self.end_offset:
+      data = self._file.read(self.read_block_size)
+      if not data:
+        break
+      buf += data
+      index = buf.find(self._sync_marker)
+      if index >= 0:
+        block_offset = buf_offset + index + _SYNC_SIZE
+        self._file.seek(block_offset)
+        return block_offset
+      # Keep enough bytes to find a marker straddling two reads.
+      keep = _SYNC_SIZE - 1
+      buf_offset += len(buf) - keep
+      buf = buf[-keep:]
+    return None
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    self._file.close()
+
+  def _iter_records(self):
+    block_offset = self._first_block_offset
+    if block_offset is None:
+      return
+    decode = self.source.coder.decode if self.source.coder else None
+    while True:
+      count = _read_long(self._file)
+      if count is None:
+        return
+      # Only the first record of a block is a split point. The other records
+      # have the same position and returning them from the range tracker
+      # would not change its state, hence they are not reported.
+      if not self.range_tracker.try_return_record_at(
+          is_at_split_point=True, record_start=block_offset):
+        return
+      self.current_offset = block_offset
+      data = _read_exactly(self._file, _read_long(self._file))
+      if _read_exactly(self._file, _SYNC_SIZE) != self._sync_marker:
+        raise ValueError('Invalid sync marker after the block at offset %d '
+                         'of Avro file %s' % (block_offset,
+                                              self.source.file_path))
+      block_offset = self._file.tell()
+      records = self._datum_codec.decode_block(
+          _decompress(data, self.codec), count)
+      if decode is not None:
+        records = [decode(record) for record in records]
+      for record in records:
+        yield record
+
+
+# -----------------------------------------------------------------------------
+# AvroFileWriter.
+
+
+class AvroFileWriter(iobase.NativeSinkWriter):
+  """The sink writer for an AvroFileSink."""
+
+  # Approximate number of uncompressed bytes written per block. Blocks are the
+  # unit of splitting when the file is read.
+  block_size = 64 * 1024
+
+  def __init__(self, sink):
+    self.sink = sink
+    self._datum_codec = _DatumCodec(sink.schema)
+    self._encode = self.sink.coder.encode if self.sink.coder else None
+
+  def __enter__(self):
+    self._file = fileio.open_file(self.sink.file_path, 'wb')
+    self._sync_marker = os.urandom(_SYNC_SIZE)
+    self._file.write(_encode_header(
+        {_SCHEMA_KEY: json.dumps(self._datum_codec.schema),
+         _CODEC_KEY: self.sink.codec},
+        self._sync_marker))
+    self._block = []
+    self._block_count = 0
+    self._block_bytes = 0
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    try:
+      if exception_type is None:
+        self._flush_block()
+    finally:
+      self._file.close()
+
+  def _flush_block(self):
+    if not self._block_count:
+      return
+    data = _compress(''.join(self._block), self.sink.codec)
+    self._file.write(''.join([_encode_long(self._block_count),
+                              _encode_long(len(data)),
+                              data,
+                              self._sync_marker]))
+    self._block = []
+    self._block_count = 0
+    self._block_bytes = 0
+
+  def Write(self, value):
+    if self._encode is not None:
+      value = self._encode(value)
+    start = len(self._block)
+    self._datum_codec.encode_to(value, self._block)
+    self._block_count += 1
+    for i in xrange(start, len(self._block)):
+      self._block_bytes += len(self._block[i])
+    if self._block_bytes >= self.block_size:
+      self._flush_block()
@@ -0,0 +1,243 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for Avro sources and sinks."""
+
+import logging
+import os
+import tempfile
+import unittest
+
+from google.cloud.dataflow import coders
+from google.cloud.dataflow.io import avroio
+from google.cloud.dataflow.io import iobase
+
+
+RECORD_SCHEMA = {
+    'type': 'record',
+    'name': 'Person',
+    'namespace': 'example',
+    'fields': [
+        {'name': 'name', 'type': 'string'},
+        {'name': 'age', 'type': 'int'},
+        {'name': 'score', 'type': 'double'},
+        {'name': 'active', 'type': 'boolean'},
+        {'name': 'tags', 'type': {'type': 'array', 'items': 'string'}},
+        {'name': 'attributes', 'type': {'type': 'map', 'values': 'long'}},
+        {'name': 'color', 'type': {'type': 'enum', 'name': 'Color',
+                                   'symbols': ['RED', 'GREEN']}},
+        {'name': 'nickname', 'type': ['null', 'string'], 'default': None},
+        {'name': 'digest', 'type': {'type': 'fixed', 'name': 'MD5',
+                                    'size': 4}},
+        {'name': 'friend', 'type': ['null', 'Person'], 'default': None},
+    ]}
+
+
+def make_person(i):
+  return {'name': u'person %d' % i, 'age': i, 'score': i / 2.0,
+          'active': i % 2 == 0, 'tags': [u'tag%d' % j for j in range(i % 3)],
+          'attributes': {u'height': i * 10, u'weight': -i},
+          'color': u'RED' if i % 2 else u'GREEN',
+          'nickname': None if i % 2 else u'nick %d' % i,
+          'digest': 'abcd',
+          'friend': None}
+
+
+class TestAvroDatumCodec(unittest.TestCase):
+
+  def test_long_encoding(self):
+    for n in (0, 1, -1, 63, -64, 64, 1 << 31, -(1 << 31), (1 << 63) - 1,
+              -(1 << 63)):
+      encoded = avroio._encode_long(n)
+      self.assertEqual((n, len(encoded)), avroio._decode_long(encoded, 0))
+    # Examples from the Avro specification.
+    self.assertEqual('\x00', avroio._encode_long(0))
+    self.assertEqual('\x01', avroio._encode_long(-1))
+    self.assertEqual('\x80\x01', avroio._encode_long(64))
+
+  def test_record_round_trip(self):
+    codec = avroio._DatumCodec(RECORD_SCHEMA)
+    people = [make_person(i) for i in range(5)]
+    people[1]['friend'] = make_person(10)
+    encoded = ''.join(codec.encode(person) for person in people)
+    self.assertEqual(people, codec.decode_block(encoded, len(people)))
+
+  def test_missing_field_uses_default(self):
+    codec = avroio._DatumCodec(RECORD_SCHEMA)
+    person = make_person(3)
+    del person['nickname']
+    decoded = codec.decode_block(codec.encode(person), 1)[0]
+    self.assertIsNone(decoded['nickname'])
+
+  def test_schema_as_json_string(self):
+    codec = avroio._DatumCodec('{"type": "array", "items": "float"}')
+    self.assertEqual([[1.5, -2.0]],
+                     codec.decode_block(codec.encode([1.5, -2.0]), 1))
+
+  def test_invalid_data(self):
+    codec = avroio._DatumCodec(RECORD_SCHEMA)
+    person = make_person(1)
+    person['color'] = 'BLUE'
+    with self.assertRaises(ValueError):
+      codec.encode(person)
+    with self.assertRaises(ValueError):
+      avroio._DatumCodec(['null', 'long']).encode('not a long')
+    with self.assertRaises(ValueError):
+      avroio._DatumCodec({'type': 'record', 'name': 'R',
+                          'fields': [{'name': 'f', 'type': 'Unknown'}]})
+
+
+class TestAvroFileSource(unittest.TestCase):
+
+  def create_temp_file_path(self):
+    temp = tempfile.NamedTemporaryFile(delete=False)
+    temp.close()
+    return temp.name
+
+  def write_file(self, records, schema=None, codec='deflate', coder=None,
+                 block_size=None):
+    file_path = self.create_temp_file_path()
+    writer = avroio.AvroFileSink(
+        file_path, schema=schema, codec=codec, coder=coder).writer()
+    if block_size is not None:
+      writer.block_size = block_size
+    with writer:
+      for record in records:
+        writer.Write(record)
+    return file_path
+
+  def read_all(self, source):
+    with source.reader() as reader:
+      return list(reader)
+
+  def test_read_write_records(self):
+    people = [make_person(i) for i in range(100)]
+    for codec in ('null', 'deflate'):
+      file_path = self.write_file(people, schema=RECORD_SCHEMA, codec=codec,
+                                  block_size=500)
+      self.assertEqual(people,
+                       self.read_all(avroio.AvroFileSource(file_path)))
+
+  def test_read_write_with_coder(self):
+    elements = [('key', i, {'x': [1.5]}) for i in range(50)]
+    file_path = self.write_file(elements, coder=coders.PickleCoder())
+    self.assertEqual(elements, self.read_all(
+        avroio.AvroFileSource(file_path, coder=coders.PickleCoder())))
+
+  def test_read_empty_file(self):
+    file_path = self.write_file([], coder=coders.PickleCoder())
+    self.assertEqual([], self.read_all(avroio.AvroFileSource(file_path)))
+
+  def test_deflate_is_smaller(self):
+    records = ['x' * 100] * 1000
+    null_size = os.path.getsize(
+        self.write_file(records, schema='bytes', codec='null'))
+    deflate_size = os.path.getsize(
+        self.write_file(records, schema='bytes', codec='deflate'))
+    self.assertLess(deflate_size * 10, null_size)
+
+  def test_sink_requires_schema_or_coder(self):
+    with self.assertRaises(ValueError):
+      avroio.AvroFileSink('/tmp/out')
+    with self.assertRaises(ValueError):
+      avroio.AvroFileSink('/tmp/out', schema='bytes', codec='snappy')
+
+  def test_not_an_avro_file(self):
+    file_path = self.create_temp_file_path()
+    with open(file_path, 'wb') as f:
+      f.write('some text\n')
+    with self.assertRaises(ValueError):
+      self.read_all(avroio.AvroFileSource(file_path))
+
+  def test_split_into_bundles(self):
+    records = ['record %d' % i for i in range(1000)]
+    file_path = self.write_file(records, schema='string', block_size=100)
+    source = avroio.AvroFileSource(file_path)
+    self.assertEqual(os.path.getsize(file_path), source.estimate_size())
+    for bundle_size in (1, 13, 100, 1000, 1 << 20):
+      bundles = source.split(bundle_size)
+      read = []
+      for bundle in bundles:
+        read.extend(self.read_all(bundle))
+      self.assertEqual(records, read)
+    self.assertEqual(1, len(source.split(1 << 20)))
+
+  def test_read_multi_file_glob(self):
+    temp_dir = tempfile.mkdtemp()
+    for i in range(3):
+      writer = avroio.AvroFileSink(
+          os.path.join(temp_dir, 'part-%d.avro' % i), schema='long').writer()
+      with writer:
+        for j in range(10):
+          writer.Write(i * 10 + j)
+    source = avroio.AvroFileSource(os.path.join(temp_dir, 'part-*.avro'))
+    self.assertEqual(range(30), sorted(self.read_all(source)))
+    self.assertEqual(range(30), sorted(
+        r for bundle in source.split(50) for r in self.read_all(bundle)))
+
+  def test_progress_reports_block_offsets(self):
+    records = ['record %d' % i for i in range(100)]
+    file_path = self.write_file(records, schema='string', block_size=50)
+    offsets = []
+    with avroio.AvroFileSource(file_path).reader() as reader:
+      for _ in reader:
+        offsets.append(reader.get_progress().position.byte_offset)
+    self.assertEqual(sorted(offsets), offsets)
+    self.assertLess(1, len(set(offsets)))
+    self.assertLess(len(set(offsets)), len(records))
+
+  def test_dynamic_split_by_percent_complete(self):
+    records = ['record %d' % i for i in range(200)]
+    file_path = self.write_file(records, schema='string', block_size=100)
+    size = os.path.getsize(file_path)
+    with avroio.AvroFileSource(file_path).reader() as reader:
+      reader_iter = iter(reader)
+      first = [next(reader_iter)]
+      self.assertIsNone(reader.request_dynamic_split(
+          iobase.DynamicSplitRequest(iobase.ReaderProgress(
+              percent_complete=1))))
+      response = reader.request_dynamic_split(
+          iobase.DynamicSplitRequest(iobase.ReaderProgress(
+              percent_complete=0.5)))
+      self.assertEqual(size / 2, response.stop_position.byte_offset)
+      primary = first + list(reader_iter)
+    residual = self.read_all(avroio.AvroFileSource(
+        file_path, start_offset=response.stop_position.byte_offset))
+    self.assertEqual(records, primary + residual)
+    self.assertLess(len(primary), len(records))
+
+  def test_dynamic_split_exhaustive(self):
+    records = ['record %d' % i for i in range(20)]
+    file_path = self.write_file(records, schema='string', block_size=20)
+    size = os.path.getsize(file_path)
+    for records_to_read in range(len(records)):
+      for split_offset in range(0, size + 1, 7):
+        with avroio.AvroFileSource(file_path).reader() as reader:
+          reader_iter = iter(reader)
+          primary = [next(reader_iter) for _ in range(records_to_read)]
+          response = reader.request_dynamic_split(
+              iobase.DynamicSplitRequest(iobase.ReaderProgress(
+                  position=iobase.ReaderPosition(byte_offset=split_offset))))
+          primary.extend(reader_iter)
+        if response is None:
+          self.assertEqual(records, primary)
+        else:
+          residual = self.read_all(avroio.AvroFileSource(
+              file_path, start_offset=split_offset))
+          self.assertEqual(records, primary + residual)
+
+
+if __name__ == '__main__':
+  logging.getLogger().setLevel(logging.INFO)
+  unittest.main()
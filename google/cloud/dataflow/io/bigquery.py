@@ -100,10 +100,13 @@ TableCell: Holds the value for one cell (or field).  Has one attribute,
 
 from __future__ import absolute_import
 
+import calendar
 import collections
 import json
 import logging
+from multiprocessing.pool import ThreadPool
 import re
+import threading
 import time
 import uuid
 
@@ -111,10 +114,13 @@ from google.cloud.dataflow import coders
 from google.cloud.dataflow.internal import auth
 from google.cloud.dataflow.internal.json_value import from_json_value
 from google.cloud.dataflow.internal.json_value import to_json_value
+from google.cloud.dataflow.io import fileio
 from google.cloud.dataflow.io import iobase
 from google.cloud.dataflow.utils import retry
+from google.cloud.dataflow.utils.counters import Counter
 from google.cloud.dataflow.utils.options import GoogleCloudOptions
 
+from apitools.base.py import http_wrapper
 from apitools.base.py.exceptions import HttpError
 
 # Protect against environments where bigquery library is not available.
@@ -131,9 +137,42 @@ __all__ = [
     'BigQueryDisposition',
     'BigQuerySource',
     'BigQuerySink',
+    'BigQueryLoadJobSink',
     ]
 
 
+# Maximum number of pages of query results fetched concurrently.
+MAX_QUERY_PAGE_FETCH_THREADS = 8
+
+# Number of seconds to wait between checks of the status of a BigQuery job.
+JOB_STATUS_POLL_INTERVAL_SECS = 2.0
+
+# Maximum number of files loaded by a single load job. BigQuery rejects load
+# jobs with more than 10,000 source URIs.
+MAX_LOAD_JOB_SOURCE_URIS = 10000
+
+# Number of seconds for which the table returned by get_or_create_table is
+# reused by the later writers of the same sink within the process.
+TABLE_CACHE_TTL_SECS = 60
+
+# Limits for the rows sent in a single streaming insert request. BigQuery
+# rejects requests larger than 10MB and recommends 500 rows per request.
+MAX_INSERT_ROWS_PER_REQUEST = 500
+MAX_INSERT_BYTES_PER_REQUEST = 8 * 1024 * 1024
+
+# Number of streaming insert requests a writer keeps in flight, and number of
+# threads of the process sending them.
+MAX_CONCURRENT_INSERT_REQUESTS = 4
+
+# Number of attempts at inserting rows rejected with a transient error.
+MAX_INSERT_ATTEMPTS = 5
+
+# Reasons of row insert errors for which inserting the row again may succeed.
+# Rows are 'stopped' when another row of the same request is invalid.
+_RETRYABLE_INSERT_ERROR_REASONS = frozenset(
+    ['backendError', 'internalError', 'timeout', 'stopped'])
+
+
 class RowAsDictJsonCoder(coders.Coder):
   """A coder for a table row (represented as a dict) to/from a JSON string.
 
@@ -211,6 +250,88 @@ class BigQueryDisposition(object):
     return disposition
 
 
+class _TableCache(object):
+  """A thread-safe cache of tables whose entries expire after a TTL.
+
+  Concurrent lookups of a missing key are coalesced: a single caller computes
+  the value while the others wait for it.
+  """
+
+  def __init__(self, ttl_secs):
+    self.ttl_secs = ttl_secs
+    self._entries = {}
+    self._pending = {}
+    self._lock = threading.Lock()
+
+  def get_or_compute(self, key, compute):
+    while True:
+      with self._lock:
+        entry = self._entries.get(key)
+        if entry is not None:
+          expiration_time, value = entry
+          if time.time() < expiration_time:
+            return value
+          del self._entries[key]
+        done = self._pending.get(key)
+        if done is None:
+          done = self._pending[key] = threading.Event()
+          break
+      # Another thread is computing the value. Look it up again once done, or
+      # compute it here if that thread failed.
+      done.wait()
+    try:
+      value = compute()
+      with self._lock:
+        self._entries[key] = (time.time() + self.ttl_secs, value)
+      return value
+    finally:
+      with self._lock:
+        del self._pending[key]
+      done.set()
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+
+# Tables returned by get_or_create_table, shared by all BigQueryWrapper
+# instances of the process.
+_table_cache = _TableCache(TABLE_CACHE_TTL_SECS)
+
+
+def clear_table_cache():
+  """Drops all cached tables."""
+  _table_cache.clear()
+
+
+# Threads sending the streaming insert requests of all the BigQueryWriter
+# instances of the process, created when first needed. The pool is terminated
+# when the process exits.
+_insert_pool = None
+_insert_pool_lock = threading.Lock()
+
+
+def _get_insert_pool():
+  global _insert_pool  # pylint: disable=global-statement
+  with _insert_pool_lock:
+    if _insert_pool is None:
+      _insert_pool = ThreadPool(MAX_CONCURRENT_INSERT_REQUESTS)
+    return _insert_pool
+
+
+# BigQuery clients of the threads of the process, shared by all the
+# BigQueryWrapper instances. A client is tagged with the generation in which
+# it was created, and clients of older generations are not used.
+_thread_clients = threading.local()
+_thread_clients_generation = 0
+
+
+def _clear_thread_clients():
+  """Makes every thread create a new client when it next needs one."""
+  global _thread_clients_generation  # pylint: disable=global-statement
+  _thread_clients_generation += 1
+
+
 def _parse_table_reference(table, dataset=None, project=None):
   """Parses a table reference into a (project, dataset, table) tuple.
 
@@ -260,6 +381,205 @@ def _parse_table_reference(table, dataset=None, project=None):
   return table_reference
 
 
+def _parse_table_schema(schema):
+  """Transforms a sink schema argument into a bigquery.TableSchema or None."""
+  if isinstance(schema, basestring):
+    # TODO(silviuc): Should add a regex-based validation of the format.
+    table_schema = bigquery.TableSchema()
+    schema_list = [s.strip(' ') for s in schema.split(',')]
+    for field_and_type in schema_list:
+      field_name, field_type = field_and_type.split(':')
+      field_schema = bigquery.TableFieldSchema()
+      field_schema.name = field_name
+      field_schema.type = field_type
+      field_schema.mode = 'NULLABLE'
+      table_schema.fields.append(field_schema)
+    return table_schema
+  elif schema is None or isinstance(schema, bigquery.TableSchema):
+    return schema
+  else:
+    raise TypeError('Unexpected schema argument: %s.' % schema)
+
+
+def _get_executing_project(source):
+  """Returns the project running the pipeline reading a source, or None."""
+  if auth.is_running_in_gce:
+    return auth.executing_project
+  elif hasattr(source, 'pipeline_options'):
+    return source.pipeline_options.view_as(GoogleCloudOptions).project
+  else:
+    return None
+
+
+# -----------------------------------------------------------------------------
+# Conversion of table rows to dictionaries.
+
+
+def _convert_boolean(value):
+  # The JSON values returned by BigQuery for table fields in a row have
+  # always set the string_value attribute. Boolean values are the strings
+  # 'true' or 'false', which cannot be converted by simply calling bool() (it
+  # will return True for both!).
+  if isinstance(value, basestring):
+    return value == 'true'
+  return bool(value)
+
+
+def _convert_timestamp(value):
+  # Query results return timestamps as seconds since the epoch, while extract
+  # jobs write them as e.g. '2016-01-01 12:34:56.789 UTC'.
+  if isinstance(value, basestring) and value.endswith(' UTC'):
+    date_time, _, fraction = value[:-len(' UTC')].partition('.')
+    seconds = calendar.timegm(time.strptime(date_time, '%Y-%m-%d %H:%M:%S'))
+    return seconds + float('0.' + fraction) if fraction else float(seconds)
+  return float(value)
+
+
+def _identity(value):
+  return value
+
+
+_SCALAR_CONVERTERS = {
+    'STRING': _identity,
+    'BYTES': _identity,
+    'BOOLEAN': _convert_boolean,
+    'INTEGER': int,
+    'FLOAT': float,
+    'TIMESTAMP': _convert_timestamp,
+}
+
+
+def _unexpected_type_converter(field_type):
+  def convert(unused_value):
+    raise RuntimeError('Unexpected field type: %s' % field_type)
+  return convert
+
+
+class _RowConverter(object):
+  """Converts TableRow instances with a given schema to Python dicts.
+
+  The schema is compiled once into a list of per-column conversion functions,
+  so converting a row does not dispatch on the type of each of its cells.
+  RECORD fields become nested dicts and REPEATED fields become lists, as they
+  are represented in the JSON encoding of rows used for inserts. Fields with
+  null values are omitted from the dicts.
+  """
+
+  def __init__(self, schema):
+    self.schema = schema
+    self._columns = self._compile_fields(schema.fields)
+
+  def _compile_fields(self, fields):
+    return [(field.name, self._compile_field(field)) for field in fields]
+
+  def _compile_field(self, field):
+    """Returns a function converting the plain JSON value of a field."""
+    if field.type in ('RECORD', 'STRUCT'):
+      columns = self._compile_fields(field.fields)
+
+      def convert_record(value):
+        # A nested record is returned as {'f': [{'v': cell_value}, ...]}.
+        result = {}
+        for (name, convert), cell in zip(columns, value['f']):
+          cell_value = cell.get('v')
+          # Nested null values are converted from JSON as empty lists.
+          if cell_value is not None and cell_value != []:
+            result[name] = convert(cell_value)
+        return result
+      convert_value = convert_record
+    else:
+      convert_value = _SCALAR_CONVERTERS.get(field.type)
+      if convert_value is None:
+        convert_value = _unexpected_type_converter(field.type)
+
+    if field.mode == 'REPEATED':
+      # Repeated values are returned as [{'v': value}, ...].
+      def convert_repeated(value):
+        return [convert_value(entry['v']) for entry in value]
+      return convert_repeated
+    return convert_value
+
+  def __call__(self, row):
+    result = {}
+    for (name, convert), cell in zip(self._columns, row.f):
+      v = cell.v
+      if v is None:
+        continue  # Field not present in the row.
+      # Scalar values are always returned as strings, which avoids the more
+      # general (and slower) conversion of the JSON value.
+      value = v.string_value
+      if value is None:
+        if v.is_null:
+          continue
+        value = from_json_value(v)
+      result[name] = convert(value)
+    return result
+
+
+def _schema_fields(fields):
+  """Returns TableFieldSchema instances as (name, type, mode, fields) tuples."""
+  return tuple((field.name, field.type, field.mode, _schema_fields(field.fields))
+               for field in fields)
+
+
+class _ExportedRowJsonCoder(coders.Coder):
+  """A coder for the rows of tables exported as newline-delimited JSON.
+
+  The rows are decoded to the same dicts as the rows returned by a
+  BigQueryReader: extract jobs write INTEGER and TIMESTAMP values as strings,
+  which are converted with the conversions used for query results. The schema
+  is kept as plain tuples (see _schema_fields) so that the coder can be
+  pickled.
+  """
+
+  def __init__(self, fields):
+    self.fields = fields
+    self._convert = None
+
+  def __getstate__(self):
+    return {'fields': self.fields}
+
+  def __setstate__(self, state):
+    self.__init__(state['fields'])
+
+  def __eq__(self, other):
+    return (isinstance(other, _ExportedRowJsonCoder) and
+            self.fields == other.fields)
+
+  def _compile_fields(self, fields):
+    return [(name, self._compile_field(field_type, mode, sub_fields))
+            for name, field_type, mode, sub_fields in fields]
+
+  def _compile_field(self, field_type, mode, sub_fields):
+    if field_type in ('RECORD', 'STRUCT'):
+      convert_value = self._compile_row(self._compile_fields(sub_fields))
+    else:
+      convert_value = _SCALAR_CONVERTERS.get(field_type)
+      if convert_value is None:
+        convert_value = _unexpected_type_converter(field_type)
+    if mode == 'REPEATED':
+      return lambda values: [convert_value(value) for value in values]
+    return convert_value
+
+  def _compile_row(self, columns):
+    def convert_row(row):
+      result = {}
+      for name, convert in columns:
+        value = row.get(name)
+        if value is not None:
+          result[name] = convert(value)
+      return result
+    return convert_row
+
+  def encode(self, table_row):
+    return json.dumps(table_row)
+
+  def decode(self, encoded_table_row):
+    if self._convert is None:
+      self._convert = self._compile_row(self._compile_fields(self.fields))
+    return self._convert(json.loads(encoded_table_row))
+
+
 # -----------------------------------------------------------------------------
 # BigQuerySource, BigQuerySink.
 
@@ -318,12 +638,71 @@ class BigQuerySource(iobase.Source):
 
     self.validate = validate
     self.coder = coder or RowAsDictJsonCoder()
+    # The directories of the files exported by split().
+    self._export_directories = []
 
   @property
   def format(self):
     """Source format name required for remote execution."""
     return 'bigquery'
 
+  def split(self, desired_bundle_size, test_bigquery_client=None):
+    """Splits a table source by exporting the table to sharded files.
+
+    A table source whose pipeline options specify a GCS temp_location is
+    exported by a BigQuery extract job to newline-delimited JSON files under
+    a bigquery-export-<id>/ directory of that location, which are then split
+    like any other text files. With the default coder the exported rows are
+    converted using the schema of the table to the same dicts as returned by
+    the reader of an unsplit source. Other coders decode each line, the same
+    way the service reads tables used as main inputs. Query sources and
+    sources without a GCS temp location are read by a single reader.
+
+    The exported files are deleted by finish_split(), which runners call once
+    all the bundles have been read. Otherwise they are left under the temp
+    location.
+
+    Args:
+      desired_bundle_size: the desired size (in bytes) of each bundle.
+      test_bigquery_client: a client to use instead of the default one.
+
+    Returns:
+      A list of sources.
+    """
+    if self.table_reference is None or not hasattr(self, 'pipeline_options'):
+      return [self]
+    temp_location = self.pipeline_options.view_as(
+        GoogleCloudOptions).temp_location
+    project_id = _get_executing_project(self)
+    if not (temp_location and temp_location.startswith('gs://') and
+            project_id):
+      return [self]
+    export_directory = '%s/bigquery-export-%s/' % (
+        temp_location.rstrip('/'), uuid.uuid4().hex)
+    destination_uri = '%s%s-*.json' % (export_directory,
+                                       self.table_reference.tableId)
+    client = BigQueryWrapper(client=test_bigquery_client)
+    coder = self.coder
+    if isinstance(coder, RowAsDictJsonCoder):
+      table = client._get_table(  # pylint: disable=protected-access
+          self.table_reference.projectId or project_id,
+          self.table_reference.datasetId, self.table_reference.tableId)
+      coder = _ExportedRowJsonCoder(_schema_fields(table.schema.fields))
+    self._export_directories.append(export_directory)
+    client.export_table(project_id, self.table_reference, destination_uri)
+    return fileio.TextFileSource(
+        destination_uri, coder=coder).split(desired_bundle_size)
+
+  def finish_split(self):
+    """Deletes the files exported when the source was split."""
+    # pylint: disable=g-import-not-at-top
+    from google.cloud.dataflow.io import gcsio
+    while self._export_directories:
+      export_directory = self._export_directories.pop()
+      gcs = gcsio.GcsIO()
+      for path in gcs.glob(export_directory + '*'):
+        gcs.delete(path)
+
   def reader(self, test_bigquery_client=None):
     return BigQueryReader(
         source=self, test_bigquery_client=test_bigquery_client)
@@ -377,33 +756,17 @@ class BigQuerySink(iobase.NativeSink):
       format.
     """
     self.table_reference = _parse_table_reference(table, dataset, project)
-    # Transform the table schema into a bigquery.TableSchema instance.
-    if isinstance(schema, basestring):
-      # TODO(silviuc): Should add a regex-based validation of the format.
-      table_schema = bigquery.TableSchema()
-      schema_list = [s.strip(' ') for s in schema.split(',')]
-      for field_and_type in schema_list:
-        field_name, field_type = field_and_type.split(':')
-        field_schema = bigquery.TableFieldSchema()
-        field_schema.name = field_name
-        field_schema.type = field_type
-        field_schema.mode = 'NULLABLE'
-        table_schema.fields.append(field_schema)
-      self.table_schema = table_schema
-    elif schema is None:
-      # TODO(silviuc): Should check that table exists if no schema specified.
-      self.table_schema = schema
-    elif isinstance(schema, bigquery.TableSchema):
-      self.table_schema = schema
-    else:
-      raise TypeError('Unexpected schema argument: %s.' % schema)
-
+    # TODO(silviuc): Should check that table exists if no schema specified.
+    self.table_schema = _parse_table_schema(schema)
     self.create_disposition = BigQueryDisposition.validate_create(
         create_disposition)
     self.write_disposition = BigQueryDisposition.validate_write(
         write_disposition)
     self.validate = validate
     self.coder = coder or RowAsDictJsonCoder()
+    # Identifies the writes of this sink in the table cache, so that the
+    # dispositions are applied once per sink rather than once per writer.
+    self.write_id = uuid.uuid4().hex
 
   def schema_as_json(self):
     """Returns the TableSchema associated with the sink as a JSON string."""
@@ -436,8 +799,111 @@ class BigQuerySink(iobase.NativeSink):
         buffer_size=buffer_size)
 
 
+class BigQueryLoadJobSink(iobase.Sink):
+  """A sink loading rows into a BigQuery table with load jobs.
+
+  Unlike BigQuerySink, which streams rows into the table, each bundle of rows
+  is written as a file of newline-delimited JSON under temp_location and, once
+  all bundles are written, the files are imported into the table by a load
+  job. Load jobs are much cheaper and faster than streaming inserts for large
+  batch outputs, but rows only become visible once the whole write finishes.
+
+  Writes of more than MAX_LOAD_JOB_SOURCE_URIS bundles are loaded by several
+  jobs run one after another. Only the first one applies the write
+  disposition, the others append to the table, hence a failure of a later job
+  leaves the rows of the earlier ones in the table.
+
+  Use with the 'df.io.Write' transform:
+
+      rows | df.io.Write(df.io.BigQueryLoadJobSink(
+          'dataset.table', temp_location='gs://bucket/tmp', schema=...))
+
+  The create and write dispositions are applied by the load job, with the
+  same semantics as for BigQuerySink.
+  """
+
+  def __init__(self, table, dataset=None, project=None, schema=None,
+               create_disposition=BigQueryDisposition.CREATE_IF_NEEDED,
+               write_disposition=BigQueryDisposition.WRITE_EMPTY,
+               temp_location=None, coder=None):
+    """Initialize a BigQueryLoadJobSink.
+
+    Args:
+      table: The ID of the table, as for BigQuerySink. If the project is not
+        part of the table reference the project argument must be specified.
+      dataset: The ID of the dataset containing this table or null if the table
+        reference is specified entirely by the table argument.
+      project: The ID of the project containing this table or null if the table
+        reference is specified entirely by the table argument. The load job
+        runs in this project.
+      schema: A bigquery.TableSchema instance or a string of comma separated
+        'name:TYPE' fields (e.g., 'month:STRING, count:INTEGER'). Required if
+        the table may have to be created.
+      create_disposition: BigQueryDisposition.CREATE_IF_NEEDED or
+        BigQueryDisposition.CREATE_NEVER.
+      write_disposition: BigQueryDisposition.WRITE_TRUNCATE, WRITE_APPEND or
+        WRITE_EMPTY.
+      temp_location: A GCS path (gs://...) under which the files to load are
+        written. The files are deleted once they are all loaded.
+      coder: The coder encoding each row as a line of JSON. Defaults to
+        RowAsDictJsonCoder, which writes rows represented as dictionaries.
+
+    Raises:
+      TypeError: if the schema argument is not a string or a TableSchema object.
+      ValueError: if the table reference does not include a project or if
+        temp_location is not specified.
+    """
+    self.table_reference = _parse_table_reference(table, dataset, project)
+    if self.table_reference.projectId is None:
+      raise ValueError(
+          'The table reference %s must specify a project.' % table)
+    if not temp_location:
+      raise ValueError('A temp_location is required to write files to load.')
+    self.table_schema = _parse_table_schema(schema)
+    self.create_disposition = BigQueryDisposition.validate_create(
+        create_disposition)
+    self.write_disposition = BigQueryDisposition.validate_write(
+        write_disposition)
+    self.temp_location = temp_location
+    self.coder = coder or RowAsDictJsonCoder()
+
+  def initialize_write(self):
+    # A file name prefix unique to this write, so that the files of concurrent
+    # or previous writes are never loaded.
+    return '%s/bigquery-load-%s' % (self.temp_location.rstrip('/'),
+                                    uuid.uuid4().hex)
+
+  def open_writer(self, init_result, uid):
+    return BigQueryLoadFileWriter(self, '%s-%s.json' % (init_result, uid))
+
+  def finalize_write(self, init_result, writer_results,
+                     test_bigquery_client=None):
+    # Only the files of the bundles whose results were committed are loaded;
+    # files of failed or redundant bundle executions are ignored.
+    source_uris = [uri for uri in writer_results if uri is not None]
+    client = BigQueryWrapper(client=test_bigquery_client)
+    if source_uris:
+      write_disposition = self.write_disposition
+      for start in xrange(0, len(source_uris), MAX_LOAD_JOB_SOURCE_URIS):
+        client.load_table(
+            self.table_reference.projectId, self.table_reference,
+            source_uris[start:start + MAX_LOAD_JOB_SOURCE_URIS],
+            self.table_schema, self.create_disposition, write_disposition)
+        # The rows loaded by the previous jobs belong to this write.
+        write_disposition = BigQueryDisposition.WRITE_APPEND
+      for uri in source_uris:
+        fileio.delete_file(uri)
+    else:
+      # A load job needs at least one file. Apply the dispositions to the table
+      # (e.g. create or truncate it) as the load of no rows would have.
+      client.get_or_create_table(
+          self.table_reference.projectId, self.table_reference.datasetId,
+          self.table_reference.tableId, self.table_schema,
+          self.create_disposition, self.write_disposition)
+
+
 # -----------------------------------------------------------------------------
-# BigQueryReader, BigQueryWriter.
+# BigQueryReader, BigQueryWriter, BigQueryLoadFileWriter.
 
 
 class BigQueryReader(iobase.SourceReader):
@@ -446,13 +912,7 @@ class BigQueryReader(iobase.SourceReader):
   def __init__(self, source, test_bigquery_client=None):
     self.source = source
     self.test_bigquery_client = test_bigquery_client
-    if auth.is_running_in_gce:
-      self.executing_project = auth.executing_project
-    elif hasattr(source, 'pipeline_options'):
-      self.executing_project = (
-          source.pipeline_options.view_as(GoogleCloudOptions).project)
-    else:
-      self.executing_project = None
+    self.executing_project = _get_executing_project(source)
 
     # TODO(silviuc): Try to automatically get it from gcloud config info.
     if not self.executing_project and test_bigquery_client is None:
@@ -485,24 +945,40 @@ class BigQueryReader(iobase.SourceReader):
         project_id=self.executing_project, query=self.query):
       if self.schema is None:
         self.schema = schema
-      for row in rows:
-        if self.row_as_dict:
-          yield self.client.convert_row_to_dict(row, schema)
-        else:
+      if self.row_as_dict:
+        convert = self.client.get_row_converter(schema)
+        for row in rows:
+          yield convert(row)
+      else:
+        for row in rows:
           yield row
 
 
 class BigQueryWriter(iobase.NativeSinkWriter):
-  """The sink writer for a BigQuerySink."""
+  """The sink writer for a BigQuerySink.
+
+  Rows are batched into insert requests of at most buffer_size rows and
+  MAX_INSERT_BYTES_PER_REQUEST bytes. Up to MAX_CONCURRENT_INSERT_REQUESTS
+  requests are sent concurrently while further rows are written, by a pool of
+  threads shared by all the writers of the process, each thread sending them
+  with its own client. Rows that
+  BigQuery rejects with a transient error are inserted again (with the same
+  insert IDs so that BigQuery can drop duplicates); any other row error fails
+  the writer.
+  """
 
   def __init__(self, sink, test_bigquery_client=None, buffer_size=None):
     self.sink = sink
     self.test_bigquery_client = test_bigquery_client
     self.row_as_dict = isinstance(self.sink.coder, RowAsDictJsonCoder)
     # Buffer used to batch written rows so we reduce communication with the
-    # BigQuery service.
+    # BigQuery service. Rows are buffered already encoded as insert request
+    # entries so that their size is known.
     self.rows_buffer = []
-    self.rows_buffer_flush_threshold = buffer_size or 1000
+    self.rows_buffer_bytes = 0
+    self.rows_buffer_flush_threshold = (
+        buffer_size or MAX_INSERT_ROWS_PER_REQUEST)
+    self.max_concurrent_requests = MAX_CONCURRENT_INSERT_REQUESTS
     # Figure out the project, dataset, and table used for the sink.
     self.project_id = self.sink.table_reference.projectId
     assert self.project_id is not None
@@ -510,36 +986,139 @@ class BigQueryWriter(iobase.NativeSinkWriter):
     self.dataset_id = self.sink.table_reference.datasetId
     self.table_id = self.sink.table_reference.tableId
 
+    counter_prefix = 'bigquery-%s:%s.%s' % (
+        self.project_id, self.dataset_id, self.table_id)
+    self.rows_counter = Counter(
+        '%s-InsertedRows' % counter_prefix, Counter.SUM)
+    self.bytes_counter = Counter(
+        '%s-InsertedBytes' % counter_prefix, Counter.SUM)
+    self.retried_rows_counter = Counter(
+        '%s-RetriedRows' % counter_prefix, Counter.SUM)
+    self.request_msecs_counter = Counter(
+        '%s-InsertRequestMsecs' % counter_prefix, Counter.MEAN)
+    self._counters_lock = threading.Lock()
+    self._pool = None
+    self._pending_requests = collections.deque()
+
+  def itercounters(self):
+    yield self.rows_counter
+    yield self.bytes_counter
+    yield self.retried_rows_counter
+    yield self.request_msecs_counter
+
+  def _insert_rows(self, encoded_rows):
+    """Inserts encoded rows, inserting again the rows failing transiently."""
+    for attempt in xrange(MAX_INSERT_ATTEMPTS):
+      start_time = time.time()
+      passed, errors = self.client.insert_encoded_rows(
+          self.project_id, self.dataset_id, self.table_id, encoded_rows)
+      request_msecs = int((time.time() - start_time) * 1000)
+      failed_indices = set(error['index'] for error in errors)
+      inserted = [row for index, row in enumerate(encoded_rows)
+                  if index not in failed_indices]
+      with self._counters_lock:
+        self.request_msecs_counter.update(request_msecs)
+        self.rows_counter.update(len(inserted))
+        self.bytes_counter.update(sum(len(row) for row in inserted))
+        if attempt > 0:
+          self.retried_rows_counter.update(len(encoded_rows))
+      if passed:
+        return
+      reasons = set(entry.get('reason')
+                    for error in errors for entry in error.get('errors', []))
+      if not reasons.issubset(_RETRYABLE_INSERT_ERROR_REASONS):
+        break
+      logging.warning('Inserting again %d rows into %s:%s.%s table after '
+                      'errors: %s', len(failed_indices), self.project_id,
+                      self.dataset_id, self.table_id, errors)
+      encoded_rows = [encoded_rows[index] for index in sorted(failed_indices)]
+      time.sleep(min(2 ** attempt, 30))
+    raise RuntimeError('Could not successfully insert rows to BigQuery'
+                       ' table [%s:%s.%s]. Errors: %s'%
+                       (self.project_id, self.dataset_id,
+                        self.table_id, errors))
+
   def _flush_rows_buffer(self):
     if self.rows_buffer:
-      logging.info('Writing %d rows to %s:%s.%s table.', len(self.rows_buffer),
-                   self.project_id, self.dataset_id, self.table_id)
-      passed, errors = self.client.insert_rows(
-          project_id=self.project_id, dataset_id=self.dataset_id,
-          table_id=self.table_id, rows=self.rows_buffer)
+      logging.debug('Writing %d rows (%d bytes) to %s:%s.%s table.',
+                    len(self.rows_buffer), self.rows_buffer_bytes,
+                    self.project_id, self.dataset_id, self.table_id)
+      # Wait for the oldest request if too many are in flight. This also
+      # raises the errors of finished requests while rows are being written.
+      while len(self._pending_requests) >= self.max_concurrent_requests:
+        self._pending_requests.popleft().get()
+      self._pending_requests.append(
+          self._pool.apply_async(self._insert_rows, (self.rows_buffer,)))
       self.rows_buffer = []
-      if not passed:
-        raise RuntimeError('Could not successfully insert rows to BigQuery'
-                           ' table [%s:%s.%s]. Errors: %s'%
-                           (self.project_id, self.dataset_id,
-                            self.table_id, errors))
+      self.rows_buffer_bytes = 0
 
   def __enter__(self):
     self.client = BigQueryWrapper(client=self.test_bigquery_client)
-    self.client.get_or_create_table(
+    table = self.client.get_or_create_table(
         self.project_id, self.dataset_id, self.table_id, self.sink.table_schema,
-        self.sink.create_disposition, self.sink.write_disposition)
+        self.sink.create_disposition, self.sink.write_disposition,
+        write_id=self.sink.write_id)
+    if not self.row_as_dict:
+      # TableRow instances are converted to the dicts sent to BigQuery using
+      # the schema of the table, which gives the names of their cells.
+      self.convert_row = self.client.get_row_converter(
+          self.sink.table_schema or table.schema)
+    self._pool = _get_insert_pool()
+    self._start_time = time.time()
     return self
 
   def __exit__(self, exception_type, exception_value, traceback):
-    self._flush_rows_buffer()
+    try:
+      if exception_type is None:
+        self._flush_rows_buffer()
+        while self._pending_requests:
+          self._pending_requests.popleft().get()
+    finally:
+      # The pool is shared, hence the requests of a failed bundle are waited
+      # for rather than left running after the bundle.
+      while self._pending_requests:
+        self._pending_requests.popleft().wait()
+    elapsed_secs = max(time.time() - self._start_time, 1e-3)
+    logging.info('Inserted %d rows (%d bytes) into %s:%s.%s table in %.1f '
+                 'seconds (%.0f rows/s, %d rows inserted again).',
+                 self.rows_counter.total, self.bytes_counter.total,
+                 self.project_id, self.dataset_id, self.table_id, elapsed_secs,
+                 self.rows_counter.total / elapsed_secs,
+                 self.retried_rows_counter.total)
 
   def Write(self, row):
-    self.rows_buffer.append(row)
-    if len(self.rows_buffer) > self.rows_buffer_flush_threshold:
+    if not self.row_as_dict:
+      row = self.convert_row(row)
+    encoded_row = self.client.encode_insert_row(row)
+    if (self.rows_buffer and self.rows_buffer_bytes + len(encoded_row) >
+        MAX_INSERT_BYTES_PER_REQUEST):
+      self._flush_rows_buffer()
+    self.rows_buffer.append(encoded_row)
+    self.rows_buffer_bytes += len(encoded_row)
+    if len(self.rows_buffer) >= self.rows_buffer_flush_threshold:
       self._flush_rows_buffer()
 
 
+class BigQueryLoadFileWriter(iobase.Writer):
+  """Writes a bundle of rows for a BigQueryLoadJobSink to a JSON file."""
+
+  def __init__(self, sink, file_path):
+    self.file_path = file_path
+    self.rows_written = 0
+    self.file_writer = fileio.TextFileSink(
+        file_path, coder=sink.coder).writer()
+    self.file_writer.__enter__()
+
+  def write(self, row):
+    self.file_writer.Write(row)
+    self.rows_written += 1
+
+  def close(self):
+    self.file_writer.__exit__(None, None, None)
+    logging.debug('Wrote %d rows to %s.', self.rows_written, self.file_path)
+    return self.file_path
+
+
 # -----------------------------------------------------------------------------
 # BigQueryWrapper.
 
@@ -551,15 +1130,42 @@ class BigQueryWrapper(object):
   offer a common place where retry logic for failures can be controlled.
   In addition it offers various functions used both in sources and sinks
   (e.g., find and create tables, query a table, etc.).
+
+  API clients and their HTTP connections are not thread-safe, hence each thread
+  using a wrapper (e.g. the threads sending insert requests or fetching query
+  result pages) gets a client of its own, shared by all the wrappers used by
+  the thread. A client passed to the constructor (e.g. in tests) is used by
+  all threads instead.
   """
 
   def __init__(self, client=None):
-    self.client = client or bigquery.BigqueryV2(
-        credentials=auth.get_service_credentials())
+    self._test_client = client
+    if client is None:
+      # The client of the creating thread is created right away so that
+      # credential errors are raised here.
+      self._thread_client()
     self._unique_row_id = 0
     # For testing scenarios where we pass in a client we do not want a
     # randomized prefix for row IDs.
     self._row_id_prefix = '' if client else uuid.uuid4()
+    self._row_converter = None
+
+  @staticmethod
+  def _new_client():
+    return bigquery.BigqueryV2(credentials=auth.get_service_credentials())
+
+  @classmethod
+  def _thread_client(cls):
+    generation, client = getattr(_thread_clients, 'client', (None, None))
+    if client is None or generation != _thread_clients_generation:
+      client = cls._new_client()
+      _thread_clients.client = (_thread_clients_generation, client)
+    return client
+
+  @property
+  def client(self):
+    """The BigQuery client of the current thread."""
+    return self._test_client or self._thread_client()
 
   @property
   def unique_row_id(self):
@@ -590,27 +1196,152 @@ class BigQueryWrapper(object):
 
   @retry.with_exponential_backoff()  # Using retry defaults from utils/retry.py
   def _get_query_results(self, project_id, job_id,
-                         page_token=None, max_results=10000):
+                         page_token=None, max_results=10000, start_index=None):
     request = bigquery.BigqueryJobsGetQueryResultsRequest(
         jobId=job_id, pageToken=page_token, projectId=project_id,
-        maxResults=max_results)
+        maxResults=max_results, startIndex=start_index)
     response = self.client.jobs.GetQueryResults(request)
     return response
 
   @retry.with_exponential_backoff()  # Using retry defaults from utils/retry.py
-  def _insert_all_rows(self, project_id, dataset_id, table_id, rows):
-    # The rows argument is a list of
-    # bigquery.TableDataInsertAllRequest.RowsValueListEntry instances as
-    # required bu the InsertAll() method.
-    request = bigquery.BigqueryTabledataInsertAllRequest(
-        projectId=project_id, datasetId=dataset_id, tableId=table_id,
-        tableDataInsertAllRequest=bigquery.TableDataInsertAllRequest(
-            # TODO(silviuc): Should have an option for skipInvalidRows?
-            # TODO(silviuc): Should have an option for ignoreUnknownValues?
-            rows=rows))
-    response = self.client.tabledata.InsertAll(request)
-    # response.insertErrors is not [] if errors encountered.
-    return not response.insertErrors, response.insertErrors
+  def _start_extract_job(self, project_id, table_reference, destination_uri):
+    request = bigquery.BigqueryJobsInsertRequest(
+        projectId=project_id,
+        job=bigquery.Job(
+            configuration=bigquery.JobConfiguration(
+                extract=bigquery.JobConfigurationExtract(
+                    sourceTable=table_reference,
+                    destinationUris=[destination_uri],
+                    destinationFormat='NEWLINE_DELIMITED_JSON'))))
+    response = self.client.jobs.Insert(request)
+    return response.jobReference.jobId
+
+  @retry.with_exponential_backoff()  # Using retry defaults from utils/retry.py
+  def _get_job(self, project_id, job_id):
+    request = bigquery.BigqueryJobsGetRequest(
+        projectId=project_id, jobId=job_id)
+    response = self.client.jobs.Get(request)
+    # The response is a bigquery.Job instance.
+    return response
+
+  def wait_for_job(self, project_id, job_id):
+    """Waits until a job is done and returns it.
+
+    Raises:
+      RuntimeError: if the job failed.
+    """
+    while True:
+      job = self._get_job(project_id, job_id)
+      if job.status is not None and job.status.state == 'DONE':
+        if job.status.errorResult is not None:
+          raise RuntimeError(
+              'BigQuery job %s failed. Error: %s' %
+              (job_id, job.status.errorResult))
+        return job
+      logging.info('Waiting on BigQuery job %s ...', job_id)
+      time.sleep(JOB_STATUS_POLL_INTERVAL_SECS)
+
+  def export_table(self, project_id, table_reference, destination_uri):
+    """Exports a table as newline-delimited JSON files and waits for it.
+
+    Args:
+      project_id: The project id running the extract job.
+      table_reference: A bigquery.TableReference for the table to export.
+      destination_uri: A GCS path containing a single '*' wildcard, which
+        BigQuery replaces with a shard number so large tables are exported as
+        several files.
+
+    Returns:
+      The bigquery.Job instance of the finished extract job.
+    """
+    if table_reference.projectId is None:
+      table_reference = bigquery.TableReference(
+          projectId=project_id, datasetId=table_reference.datasetId,
+          tableId=table_reference.tableId)
+    job_id = self._start_extract_job(
+        project_id, table_reference, destination_uri)
+    logging.info('Exporting table %s:%s.%s to %s (job %s).',
+                 table_reference.projectId, table_reference.datasetId,
+                 table_reference.tableId, destination_uri, job_id)
+    return self.wait_for_job(project_id, job_id)
+
+  @retry.with_exponential_backoff()  # Using retry defaults from utils/retry.py
+  def _start_load_job(self, project_id, table_reference, source_uris, schema,
+                      create_disposition, write_disposition):
+    request = bigquery.BigqueryJobsInsertRequest(
+        projectId=project_id,
+        job=bigquery.Job(
+            configuration=bigquery.JobConfiguration(
+                load=bigquery.JobConfigurationLoad(
+                    destinationTable=table_reference,
+                    sourceUris=source_uris,
+                    schema=schema,
+                    sourceFormat='NEWLINE_DELIMITED_JSON',
+                    createDisposition=create_disposition,
+                    writeDisposition=write_disposition))))
+    response = self.client.jobs.Insert(request)
+    return response.jobReference.jobId
+
+  def load_table(self, project_id, table_reference, source_uris, schema,
+                 create_disposition, write_disposition):
+    """Loads newline-delimited JSON files into a table and waits for it.
+
+    Args:
+      project_id: The project id running the load job.
+      table_reference: A bigquery.TableReference for the table to load into.
+      source_uris: A list of GCS paths of the files to load.
+      schema: A bigquery.TableSchema instance or None. Required if the table
+        gets created.
+      create_disposition: CREATE_NEVER or CREATE_IF_NEEDED.
+      write_disposition: WRITE_APPEND, WRITE_EMPTY or WRITE_TRUNCATE.
+
+    Returns:
+      The bigquery.Job instance of the finished load job.
+
+    Raises:
+      RuntimeError: if the load job failed, for instance because the table is
+        not empty and the write disposition is WRITE_EMPTY.
+    """
+    job_id = self._start_load_job(
+        project_id, table_reference, source_uris, schema,
+        create_disposition, write_disposition)
+    logging.info('Loading %d files into table %s:%s.%s (job %s).',
+                 len(source_uris), table_reference.projectId,
+                 table_reference.datasetId, table_reference.tableId, job_id)
+    return self.wait_for_job(project_id, job_id)
+
+  @retry.with_exponential_backoff()  # Using retry defaults from utils/retry.py
+  def _insert_all_rows_json(self, project_id, dataset_id, table_id,
+                            encoded_rows):
+    """Inserts rows already encoded as JSON insert request entries.
+
+    The request is sent without building apitools messages for the rows:
+    serializing a JsonObject message per row costs far more than dumping the
+    rows as JSON directly.
+
+    Args:
+      project_id: The project id owning the table.
+      dataset_id: The dataset id owning the table.
+      table_id: The table id.
+      encoded_rows: A list of JSON strings encoding {'insertId': ...,
+        'json': row_dict} objects (see encode_insert_row).
+
+    Returns:
+      A tuple (bool, errors) where errors is the list of insertErrors of the
+      response as dicts.
+    """
+    url = '%sprojects/%s/datasets/%s/tables/%s/insertAll' % (
+        self.client.url, project_id, dataset_id, table_id)
+    http_request = http_wrapper.Request(
+        url=url, http_method='POST',
+        headers={'content-type': 'application/json',
+                 'accept': 'application/json'},
+        body='{"rows": [%s]}' % ', '.join(encoded_rows))
+    http_response = http_wrapper.MakeRequest(self.client.http, http_request)
+    if http_response.status_code != 200:
+      raise HttpError.FromResponse(http_response)
+    insert_errors = json.loads(http_response.content).get('insertErrors', [])
+    return not insert_errors, insert_errors
 
   @retry.with_exponential_backoff()  # Using retry defaults from utils/retry.py
   def _get_table(self, project_id, dataset_id, table_id):
@@ -649,12 +1380,19 @@ class BigQueryWrapper(object):
 
   def get_or_create_table(
       self, project_id, dataset_id, table_id, schema,
-      create_disposition, write_disposition):
+      create_disposition, write_disposition, write_id=None):
     """Gets or creates a table based on create and write dispositions.
 
     The function mimics the behavior of BigQuery import jobs when using the
     same create and write dispositions.
 
+    If a write_id is given, the table is cached by the process for
+    TABLE_CACHE_TTL_SECS, so that the writers of the following bundles of the
+    same write do not look up the table again (and, e.g., do not truncate the
+    rows written by the first ones). Concurrent calls for the same write wait
+    for a single lookup. Calls without a write_id, or from another write, always
+    apply the dispositions.
+
     Args:
       project_id: The project id owning the table.
       dataset_id: The dataset id owning the table.
@@ -662,6 +1400,8 @@ class BigQueryWrapper(object):
       schema: A bigquery.TableSchema instance or None.
       create_disposition: CREATE_NEVER or CREATE_IF_NEEDED.
       write_disposition: WRITE_APPEND, WRITE_EMPTY or WRITE_TRUNCATE.
+      write_id: A string identifying the write the table is looked up for, or
+        None to not cache the table.
 
     Returns:
       A bigquery.Table instance if table was found or created.
@@ -672,6 +1412,21 @@ class BigQueryWrapper(object):
         empty and WRITE_EMPTY was specified then an error will be raised since
         the table was expected to be empty.
     """
+    if write_id is None:
+      return self._get_or_create_table(
+          project_id, dataset_id, table_id, schema,
+          create_disposition, write_disposition)
+    return _table_cache.get_or_compute(
+        (write_id, project_id, dataset_id, table_id,
+         None if schema is None else repr(schema),
+         create_disposition, write_disposition),
+        lambda: self._get_or_create_table(
+            project_id, dataset_id, table_id, schema,
+            create_disposition, write_disposition))
+
+  def _get_or_create_table(
+      self, project_id, dataset_id, table_id, schema,
+      create_disposition, write_disposition):
     found_table = None
     try:
       found_table = self._get_table(project_id, dataset_id, table_id)
@@ -721,23 +1476,75 @@ class BigQueryWrapper(object):
       # If this was a dry run then the fact that we get here means the
       # query has no errors. The start_query_job would raise an error otherwise.
       return
-    page_token = None
     while True:
-      response = self._get_query_results(project_id, job_id, page_token)
-      if not response.jobComplete:
-        # The jobComplete field can be False if the query request times out
-        # (default is 10 seconds). Note that this is a timeout for the query
-        # request not for the actual execution of the query in the service.  If
-        # the request times out we keep trying. This situation is quite possible
-        # if the query will return a large number of rows.
-        logging.info('Waiting on response from query: %s ...', query)
-        time.sleep(1.0)
-        continue
-      # We got some results. The last page is signalled by a missing pageToken.
-      yield response.rows, response.schema
-      if not response.pageToken:
+      response = self._get_query_results(project_id, job_id)
+      if response.jobComplete:
         break
-      page_token = response.pageToken
+      # The jobComplete field can be False if the query request times out
+      # (default is 10 seconds). Note that this is a timeout for the query
+      # request not for the actual execution of the query in the service. The
+      # request already waits on the service side hence we retry right away.
+      # This situation is quite possible if the query will return a large
+      # number of rows.
+      logging.info('Waiting on response from query: %s ...', query)
+    # We got some results. The last page is signalled by a missing pageToken.
+    yield response.rows, response.schema
+    if not response.pageToken:
+      return
+    page_size = len(response.rows or [])
+    if response.totalRows is None or not page_size:
+      # The pages can only be fetched one after another.
+      while response.pageToken:
+        response = self._get_query_results(
+            project_id, job_id, page_token=response.pageToken)
+        yield response.rows, response.schema
+      return
+    # Once the job is complete the number of rows is known and the remaining
+    # pages can be fetched concurrently by row offset.
+    for page in self._get_query_result_pages(
+        project_id, job_id, page_size, len(response.rows),
+        response.totalRows):
+      yield page
+
+  def _get_query_result_pages(self, project_id, job_id, page_size,
+                              start_index, total_rows):
+    """Yields (rows, schema) tuples for the rows from start_index on, in order.
+
+    Up to MAX_QUERY_PAGE_FETCH_THREADS pages are fetched at the same time and
+    at most that many pages are buffered ahead of the caller.
+    """
+    def fetch_page(page_start):
+      page_end = min(page_start + page_size, total_rows)
+      rows = []
+      schema = None
+      # A page can come back short if its rows exceed the maximum response
+      # size. The rest of the page is requested right away.
+      while page_start + len(rows) < page_end:
+        response = self._get_query_results(
+            project_id, job_id, max_results=page_end - page_start - len(rows),
+            start_index=page_start + len(rows))
+        if not response.rows:
+          break
+        rows.extend(response.rows)
+        schema = response.schema
+      return rows, schema
+
+    page_starts = iter(xrange(start_index, total_rows, page_size))
+    pending = collections.deque()
+    pool = ThreadPool(MAX_QUERY_PAGE_FETCH_THREADS)
+    try:
+      for page_start in page_starts:
+        pending.append(pool.apply_async(fetch_page, (page_start,)))
+        if len(pending) >= MAX_QUERY_PAGE_FETCH_THREADS:
+          break
+      while pending:
+        page = pending.popleft().get()
+        for page_start in page_starts:
+          pending.append(pool.apply_async(fetch_page, (page_start,)))
+          break
+        yield page
+    finally:
+      pool.terminate()
 
   def insert_rows(self, project_id, dataset_id, table_id, rows):
     """Inserts rows into the specified table.
@@ -751,59 +1558,46 @@ class BigQueryWrapper(object):
 
     Returns:
       A tuple (bool, errors). If first element is False then the second element
-      will be a bigquery.InserttErrorsValueListEntry instance containing
-      specific errors.
+      will be a list of the insertErrors entries of the response (as dicts)
+      containing specific errors.
     """
+    return self.insert_encoded_rows(
+        project_id, dataset_id, table_id,
+        [self.encode_insert_row(row) for row in rows])
 
-    # Prepare rows for insertion. Of special note is the row ID that we add to
-    # each row in order to help BigQuery avoid inserting a row multiple times.
-    # BigQuery will do a best-effort if unique IDs are provided. This situation
-    # can happen during retries on failures.
-    # TODO(silviuc): Must add support to writing TableRow's instead of dicts.
-    final_rows = []
-    for row in rows:
-      json_object = bigquery.JsonObject()
-      for k, v in row.iteritems():
-        json_object.additionalProperties.append(
-            bigquery.JsonObject.AdditionalProperty(
-                key=k, value=to_json_value(v)))
-      final_rows.append(
-          bigquery.TableDataInsertAllRequest.RowsValueListEntry(
-              insertId=str(self.unique_row_id),
-              json=json_object))
-    result, errors = self._insert_all_rows(
-        project_id, dataset_id, table_id, final_rows)
-    return result, errors
+  def encode_insert_row(self, row):
+    """Encodes a row (a dict) as a JSON entry of an insert request.
+
+    Of special note is the row ID that we add to each row in order to help
+    BigQuery avoid inserting a row multiple times. BigQuery will do a
+    best-effort if unique IDs are provided. This situation can happen during
+    retries on failures.
+    """
+    return json.dumps({'insertId': str(self.unique_row_id), 'json': row})
+
+  def insert_encoded_rows(self, project_id, dataset_id, table_id,
+                          encoded_rows):
+    """Inserts rows encoded by encode_insert_row() into the specified table.
+
+    Returns:
+      A tuple (bool, errors) as for insert_rows(). The index of each error
+      refers to the position of the row in encoded_rows.
+    """
+    return self._insert_all_rows_json(
+        project_id, dataset_id, table_id, encoded_rows)
+
+  def get_row_converter(self, schema):
+    """Returns a function converting TableRows with a schema to dicts.
+
+    The converter for the last schema used is reused, since all the rows read
+    from a query or written to a table share the same schema.
+    """
+    if (self._row_converter is None or
+        (self._row_converter.schema is not schema and
+         self._row_converter.schema != schema)):
+      self._row_converter = _RowConverter(schema)
+    return self._row_converter
 
   def convert_row_to_dict(self, row, schema):
     """Converts a TableRow instance using the schema to a Python dict."""
-    result = {}
-    for index, field in enumerate(schema.fields):
-      cell = row.f[index]
-      if cell.v is None:
-        continue  # Field not present in the row.
-      # The JSON values returned by BigQuery for table fields in a row have
-      # always set the string_value attribute, which means the value below will
-      # be a string. Converting to the appropriate type is not tricky except
-      # for boolean values. For such values the string values are 'true' or
-      # 'false', which cannot be converted by simply calling bool() (it will
-      # return True for both!).
-      value = from_json_value(cell.v)
-      if field.type == 'STRING':
-        value = value
-      elif field.type == 'BOOLEAN':
-        value = value == 'true'
-      elif field.type == 'INTEGER':
-        value = int(value)
-      elif field.type == 'FLOAT':
-        value = float(value)
-      elif field.type == 'TIMESTAMP':
-        value = float(value)
-      else:
-        # Note that a schema field object supports also a RECORD type. However
-        # when querying, the repeated and/or record fields always come
-        # flattened.  For more details please read:
-        # https://cloud.google.com/bigquery/docs/data
-        raise RuntimeError('Unexpected field type: %s' % field.type)
-      result[field.name] = value
-    return result
+    return self.get_row_converter(schema)(row)
@@ -16,15 +16,24 @@
 
 import json
 import logging
+import os
+import pickle
+import tempfile
+import threading
 import time
 import unittest
 
 import mock
 import google.cloud.dataflow as df
 from google.cloud.dataflow.internal.json_value import to_json_value
+from google.cloud.dataflow.io import bigquery as bigquery_io
+from google.cloud.dataflow.io import fileio
 from google.cloud.dataflow.io.bigquery import RowAsDictJsonCoder
 from google.cloud.dataflow.io.bigquery import TableRowJsonCoder
+from google.cloud.dataflow.utils.options import PipelineOptions
 
+from apitools.base.py import extra_types
+from apitools.base.py import http_wrapper
 from apitools.base.py.exceptions import HttpError
 from apitools.clients import bigquery
 
@@ -270,9 +279,216 @@ class TestBigQueryReader(unittest.TestCase):
     # adjust our expectation below accordingly.
     self.assertEqual(actual_rows, expected_rows * 2)
 
+  def make_paged_query_client(self, total_rows, max_page_rows=None):
+    """Returns a client serving rows [0, total_rows) by row offset."""
+    schema = bigquery.TableSchema(fields=[
+        bigquery.TableFieldSchema(name='i', type='INTEGER', mode='REQUIRED')])
+
+    def get_query_results(request):
+      start = request.startIndex or 0
+      count = request.maxResults
+      if max_page_rows is not None:
+        count = min(count, max_page_rows)
+      end = min(start + count, total_rows)
+      return bigquery.GetQueryResultsResponse(
+          jobComplete=True, schema=schema, totalRows=total_rows,
+          pageToken='token' if end < total_rows else None,
+          rows=[bigquery.TableRow(f=[bigquery.TableCell(
+              v=to_json_value(str(i)))]) for i in range(start, end)])
+
+    client = mock.Mock()
+    client.jobs.Insert.return_value = bigquery.Job(
+        jobReference=bigquery.JobReference(jobId='somejob'))
+    client.jobs.GetQueryResults.side_effect = get_query_results
+    return client
+
+  def test_read_pages_concurrently_by_offset(self):
+    client = self.make_paged_query_client(total_rows=25005)
+    with df.io.BigQuerySource('dataset.table').reader(client) as reader:
+      actual_rows = list(reader)
+    self.assertEqual([{'i': i} for i in range(25005)], actual_rows)
+    start_indices = sorted(
+        call[0][0].startIndex or 0
+        for call in client.jobs.GetQueryResults.call_args_list)
+    self.assertEqual([0, 10000, 20000], start_indices)
+
+  def test_page_fetching_threads_do_not_share_clients(self):
+    lock = threading.Lock()
+    requests = []
+
+    def new_client():
+      client = self.make_paged_query_client(total_rows=50005)
+      get_query_results = client.jobs.GetQueryResults.side_effect
+
+      def record_request(request):
+        with lock:
+          requests.append((client, threading.current_thread()))
+        return get_query_results(request)
+      client.jobs.GetQueryResults.side_effect = record_request
+      return client
+
+    source = df.io.BigQuerySource('dataset.table')
+    source.pipeline_options = PipelineOptions(['--project', 'myproject'])
+    bigquery_io._clear_thread_clients()
+    with mock.patch.object(bigquery_io.BigQueryWrapper, '_new_client',
+                           side_effect=new_client):
+      with source.reader() as reader:
+        self.assertEqual(50005, len(list(reader)))
+    threads_by_client = {}
+    for client, thread in requests:
+      threads_by_client.setdefault(client, set()).add(thread)
+    self.assertGreater(len(threads_by_client), 1)
+    self.assertTrue(all(len(threads) == 1
+                        for threads in threads_by_client.values()))
+
+  def test_read_short_pages_by_offset(self):
+    client = self.make_paged_query_client(total_rows=100, max_page_rows=7)
+    with df.io.BigQuerySource('dataset.table').reader(client) as reader:
+      actual_rows = list(reader)
+    self.assertEqual([{'i': i} for i in range(100)], actual_rows)
+
+
+class TestBigQuerySourceSplitting(unittest.TestCase):
+
+  def make_source(self, options=None, **kwargs):
+    source = df.io.BigQuerySource(**kwargs)
+    if options is not None:
+      source.pipeline_options = PipelineOptions(options)
+    return source
+
+  def test_split_exports_table(self):
+    client = mock.Mock()
+    client.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema(fields=[
+            bigquery.TableFieldSchema(name='i', type='INTEGER')]))
+    client.jobs.Insert.return_value = bigquery.Job(
+        jobReference=bigquery.JobReference(jobId='exportjob'))
+    client.jobs.Get.side_effect = [
+        bigquery.Job(status=bigquery.JobStatus(state='RUNNING')),
+        bigquery.Job(status=bigquery.JobStatus(state='DONE'))]
+    source = self.make_source(
+        ['--project', 'myproject', '--temp_location', 'gs://bucket/tmp'],
+        table='dataset.table')
+    bundles = [fileio.TextFileSource('gs://bucket/tmp/x-000.json')]
+    with mock.patch.object(fileio.TextFileSource, 'split', autospec=True,
+                           return_value=bundles) as split:
+      with mock.patch('time.sleep'):
+        self.assertEqual(bundles, source.split(1 << 20, client))
+    exported_source, desired_bundle_size = split.call_args[0]
+    self.assertEqual(1 << 20, desired_bundle_size)
+    self.assertTrue(exported_source.file_path.startswith(
+        'gs://bucket/tmp/bigquery-export-'))
+    self.assertTrue(exported_source.file_path.endswith('/table-*.json'))
+    self.assertEqual(
+        bigquery_io._ExportedRowJsonCoder((('i', 'INTEGER', None, ()),)),
+        exported_source.coder)
+    request = client.jobs.Insert.call_args[0][0]
+    self.assertEqual('myproject', request.projectId)
+    extract = request.job.configuration.extract
+    self.assertEqual([exported_source.file_path], extract.destinationUris)
+    self.assertEqual('NEWLINE_DELIMITED_JSON', extract.destinationFormat)
+    self.assertEqual('myproject', extract.sourceTable.projectId)
+    self.assertEqual('table', extract.sourceTable.tableId)
+
+  def test_split_with_custom_coder(self):
+    client = mock.Mock()
+    client.jobs.Insert.return_value = bigquery.Job(
+        jobReference=bigquery.JobReference(jobId='exportjob'))
+    client.jobs.Get.return_value = bigquery.Job(
+        status=bigquery.JobStatus(state='DONE'))
+    coder = TableRowJsonCoder()
+    source = self.make_source(
+        ['--project', 'myproject', '--temp_location', 'gs://bucket/tmp'],
+        table='dataset.table', coder=coder)
+    with mock.patch.object(fileio.TextFileSource, 'split', autospec=True,
+                           return_value=[]) as split:
+      source.split(1 << 20, client)
+    self.assertIs(coder, split.call_args[0][0].coder)
+    self.assertFalse(client.tables.Get.called)
+
+  def test_exported_rows_are_converted_like_read_rows(self):
+    schema = bigquery.TableSchema(fields=[
+        bigquery.TableFieldSchema(name='i', type='INTEGER'),
+        bigquery.TableFieldSchema(name='f', type='FLOAT'),
+        bigquery.TableFieldSchema(name='b', type='BOOLEAN'),
+        bigquery.TableFieldSchema(name='t', type='TIMESTAMP'),
+        bigquery.TableFieldSchema(name='n', type='STRING'),
+        bigquery.TableFieldSchema(name='r', type='RECORD', mode='REPEATED',
+                                  fields=[bigquery.TableFieldSchema(
+                                      name='x', type='INTEGER')])])
+    coder = pickle.loads(pickle.dumps(bigquery_io._ExportedRowJsonCoder(
+        bigquery_io._schema_fields(schema.fields))))
+    # The JSON written by extract jobs.
+    line = json.dumps({'i': '12', 'f': 1.5, 'b': True,
+                       't': '2016-01-02 03:04:05.25 UTC', 'n': None,
+                       'r': [{'x': '1'}, {'x': '2'}]})
+    self.assertEqual(
+        {'i': 12, 'f': 1.5, 'b': True, 't': 1451703845.25,
+         'r': [{'x': 1}, {'x': 2}]},
+        coder.decode(line))
+    self.assertEqual(
+        1451703845.0,
+        coder.decode(json.dumps({'t': '2016-01-02 03:04:05 UTC'}))['t'])
+
+  def test_finish_split_deletes_exported_files(self):
+    client = mock.Mock()
+    client.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema(fields=[]))
+    client.jobs.Insert.return_value = bigquery.Job(
+        jobReference=bigquery.JobReference(jobId='exportjob'))
+    client.jobs.Get.return_value = bigquery.Job(
+        status=bigquery.JobStatus(state='DONE'))
+    source = self.make_source(
+        ['--project', 'myproject', '--temp_location', 'gs://bucket/tmp'],
+        table='dataset.table')
+    with mock.patch.object(fileio.TextFileSource, 'split', autospec=True,
+                           return_value=[]) as split:
+      source.split(1 << 20, client)
+    export_directory = split.call_args[0][0].file_path.rsplit('/', 1)[0]
+    gcs = mock.Mock()
+    gcs.glob.return_value = [export_directory + '/table-000.json',
+                             export_directory + '/table-001.json']
+    with mock.patch('google.cloud.dataflow.io.gcsio.GcsIO',
+                    return_value=gcs):
+      source.finish_split()
+      # The files are deleted once.
+      source.finish_split()
+    gcs.glob.assert_called_once_with(export_directory + '/*')
+    self.assertEqual(
+        [mock.call(path) for path in gcs.glob.return_value],
+        gcs.delete.call_args_list)
+
+  def test_split_failed_export(self):
+    client = mock.Mock()
+    client.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema(fields=[]))
+    client.jobs.Insert.return_value = bigquery.Job(
+        jobReference=bigquery.JobReference(jobId='exportjob'))
+    client.jobs.Get.return_value = bigquery.Job(status=bigquery.JobStatus(
+        state='DONE', errorResult=bigquery.ErrorProto(reason='invalid')))
+    source = self.make_source(
+        ['--project', 'myproject', '--temp_location', 'gs://bucket/tmp'],
+        table='dataset.table')
+    with self.assertRaises(RuntimeError):
+      source.split(1 << 20, client)
+
+  def test_split_without_export(self):
+    client = mock.Mock()
+    for source in (
+        self.make_source(table='dataset.table'),
+        self.make_source(['--project', 'myproject'], table='dataset.table'),
+        self.make_source(
+            ['--project', 'myproject', '--temp_location', 'gs://bucket/tmp'],
+            query='query')):
+      self.assertEqual([source], source.split(1 << 20, client))
+    self.assertFalse(client.jobs.Insert.called)
+
 
 class TestBigQueryWriter(unittest.TestCase):
 
+  def setUp(self):
+    bigquery_io.clear_table_cache()
+
   def test_no_table_and_create_never(self):
     client = mock.Mock()
     client.tables.Get.side_effect = HttpError(
@@ -392,8 +608,14 @@ class TestBigQueryWriter(unittest.TestCase):
     self.assertFalse(client.tables.Delete.called)
     self.assertFalse(client.tables.Insert.called)
 
+  def make_insert_response(self, content='{}', status='200'):
+    return http_wrapper.Response(
+        info={'status': status}, content=content,
+        request_url='https://www.googleapis.com/bigquery/v2/insertAll')
+
   def test_rows_are_written(self):
     client = mock.Mock()
+    client.url = 'https://www.googleapis.com/bigquery/v2/'
     table = bigquery.Table(
         tableReference=bigquery.TableReference(
             projectId='project', datasetId='dataset', tableId='table'),
@@ -401,32 +623,564 @@ class TestBigQueryWriter(unittest.TestCase):
     client.tables.Get.return_value = table
     write_disposition = df.io.BigQueryDisposition.WRITE_APPEND
 
-    insert_response = mock.Mock()
-    insert_response.insertErrors = []
-    client.tabledata.InsertAll.return_value = insert_response
+    with mock.patch.object(http_wrapper, 'MakeRequest',
+                           return_value=self.make_insert_response()) as send:
+      with df.io.BigQuerySink(
+          'project:dataset.table',
+          write_disposition=write_disposition).writer(client) as writer:
+        writer.Write({'i': 1, 'b': True, 's': 'abc', 'f': 3.14})
+
+    sample_row = {'i': 1, 'b': True, 's': 'abc', 'f': 3.14}
+    http, request = send.call_args[0]
+    self.assertIs(client.http, http)
+    self.assertEqual('POST', request.http_method)
+    self.assertEqual(
+        'https://www.googleapis.com/bigquery/v2/projects/project/datasets/'
+        'dataset/tables/table/insertAll', request.url)
+    self.assertEqual(
+        {'rows': [{'insertId': '_1',  # First row ID generated with prefix ''
+                   'json': sample_row}]},
+        json.loads(request.body))
+    self.assertFalse(client.tabledata.InsertAll.called)
+
+  def test_insert_errors(self):
+    client = mock.Mock()
+    client.url = 'https://www.googleapis.com/bigquery/v2/'
+    client.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema())
+    errors = [{'index': 0, 'errors': [{'reason': 'invalid'}]}]
+    with mock.patch.object(
+        http_wrapper, 'MakeRequest',
+        return_value=self.make_insert_response(
+            json.dumps({'insertErrors': errors}))):
+      with self.assertRaises(RuntimeError) as exn:
+        with df.io.BigQuerySink(
+            'project:dataset.table',
+            write_disposition=df.io.BigQueryDisposition.WRITE_APPEND).writer(
+                client) as writer:
+          writer.Write({'i': 1})
+    self.assertIn('invalid', exn.exception.message)
+
+  def test_table_rows_are_written_as_dicts(self):
+    client = mock.Mock()
+    client.url = 'https://www.googleapis.com/bigquery/v2/'
+    schema = bigquery.TableSchema(fields=[
+        bigquery.TableFieldSchema(name='s', type='STRING'),
+        bigquery.TableFieldSchema(name='i', type='INTEGER')])
+    client.tables.Get.return_value = bigquery.Table(schema=schema)
+    with mock.patch.object(http_wrapper, 'MakeRequest',
+                           return_value=self.make_insert_response()) as send:
+      with df.io.BigQuerySink(
+          'project:dataset.table',
+          write_disposition=df.io.BigQueryDisposition.WRITE_APPEND,
+          coder=TableRowJsonCoder()).writer(client) as writer:
+        writer.Write(bigquery.TableRow(f=[
+            bigquery.TableCell(v=to_json_value('abc')),
+            bigquery.TableCell(v=to_json_value('12'))]))
+    self.assertEqual(
+        [{'s': 'abc', 'i': 12}],
+        [row['json'] for row in json.loads(send.call_args[0][1].body)['rows']])
+
+
+class TestBigQueryStreamingInserts(unittest.TestCase):
+
+  def setUp(self):
+    bigquery_io.clear_table_cache()
+    self.client = mock.Mock()
+    self.client.url = 'https://www.googleapis.com/bigquery/v2/'
+    self.client.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema())
+    self.requests = []
+    self.request_threads = []
+    self.lock = threading.Lock()
+
+  def make_response(self, insert_errors=None):
+    content = json.dumps({'insertErrors': insert_errors or []})
+    return http_wrapper.Response(
+        info={'status': '200'}, content=content,
+        request_url='https://www.googleapis.com/bigquery/v2/insertAll')
+
+  def write_rows(self, rows, make_request, buffer_size=None):
+    def record_request(http, request):
+      rows = json.loads(request.body)['rows']
+      with self.lock:
+        self.requests.append(rows)
+        self.request_threads.append((http, threading.current_thread()))
+      return make_request(rows)
+    with mock.patch.object(http_wrapper, 'MakeRequest',
+                           side_effect=record_request):
+      with mock.patch('time.sleep'):
+        writer = df.io.BigQuerySink(
+            'project:dataset.table',
+            write_disposition=df.io.BigQueryDisposition.WRITE_APPEND).writer(
+                self.client, buffer_size=buffer_size)
+        with writer:
+          for row in rows:
+            writer.Write(row)
+    return writer
+
+  def test_batches_by_row_count(self):
+    rows = [{'i': i} for i in range(25)]
+    writer = self.write_rows(rows, lambda _: self.make_response(),
+                             buffer_size=10)
+    self.assertEqual([5, 10, 10], sorted(len(r) for r in self.requests))
+    self.assertEqual(rows, sorted([row['json'] for request in self.requests
+                                   for row in request]))
+    self.assertEqual(25, writer.rows_counter.total)
+    self.assertEqual(3, writer.request_msecs_counter.elements)
+
+  def test_batches_by_size(self):
+    rows = [{'s': 'x' * 100} for _ in range(10)]
+    # Each encoded row takes about 140 bytes.
+    with mock.patch.object(df.io.bigquery, 'MAX_INSERT_BYTES_PER_REQUEST',
+                           450):
+      self.write_rows(rows, lambda _: self.make_response())
+    self.assertEqual([1, 3, 3, 3], sorted(len(r) for r in self.requests))
+
+  def test_requests_are_concurrent(self):
+    both_in_flight = threading.Event()
+    in_flight = []
+
+    def make_request(rows):
+      with self.lock:
+        in_flight.append(rows)
+        if len(in_flight) == 2:
+          both_in_flight.set()
+      both_in_flight.wait(10)
+      return self.make_response()
+
+    self.write_rows([{'i': i} for i in range(2)], make_request, buffer_size=1)
+    self.assertTrue(both_in_flight.is_set())
+
+  def test_threads_do_not_share_clients(self):
+    clients = []
+
+    def new_client():
+      client = mock.Mock()
+      client.url = 'https://www.googleapis.com/bigquery/v2/'
+      client.tables.Get.return_value = bigquery.Table(
+          schema=bigquery.TableSchema())
+      with self.lock:
+        clients.append(client)
+      return client
+
+    both_in_flight = threading.Event()
+
+    def make_request(unused_rows):
+      with self.lock:
+        if len(self.requests) == 2:
+          both_in_flight.set()
+      both_in_flight.wait(10)
+      return self.make_response()
+
+    self.client = None
+    bigquery_io._clear_thread_clients()
+    with mock.patch.object(bigquery_io.BigQueryWrapper, '_new_client',
+                           side_effect=new_client):
+      self.write_rows([{'i': i} for i in range(4)], make_request,
+                      buffer_size=1)
+    self.assertTrue(both_in_flight.is_set())
+    threads_by_http = {}
+    for http, thread in self.request_threads:
+      threads_by_http.setdefault(http, set()).add(thread)
+    # Every client is used by a single thread, and the threads sending the
+    # requests do not use the client of the thread creating the writer.
+    self.assertGreater(len(threads_by_http), 1)
+    self.assertTrue(all(len(threads) == 1
+                        for threads in threads_by_http.values()))
+    self.assertNotIn(clients[0].http, threads_by_http)
+
+  def test_writers_share_threads_and_clients(self):
+    new_client = mock.Mock()
+    new_client.return_value.url = 'https://www.googleapis.com/bigquery/v2/'
+    new_client.return_value.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema())
+    self.client = None
+    bigquery_io._clear_thread_clients()
+    with mock.patch.object(bigquery_io.BigQueryWrapper, '_new_client',
+                           new_client):
+      for _ in range(5):
+        self.write_rows([{'i': i} for i in range(8)],
+                        lambda _: self.make_response(), buffer_size=1)
+    # Clients are created once per thread, not once per bundle.
+    self.assertEqual(40, len(self.requests))
+    self.assertLessEqual(
+        len(set(thread for _, thread in self.request_threads)),
+        bigquery_io.MAX_CONCURRENT_INSERT_REQUESTS)
+    self.assertLessEqual(
+        new_client.call_count, bigquery_io.MAX_CONCURRENT_INSERT_REQUESTS + 1)
 
+  def test_failed_rows_are_inserted_again(self):
+    def make_request(rows):
+      if len(self.requests) == 1:
+        return self.make_response([
+            {'index': 1, 'errors': [{'reason': 'backendError'}]},
+            {'index': 2, 'errors': [{'reason': 'timeout'}]}])
+      return self.make_response()
+
+    writer = self.write_rows([{'i': i} for i in range(4)], make_request)
+    first, second = self.requests
+    self.assertEqual(4, len(first))
+    self.assertEqual(first[1:3], second)
+    self.assertEqual(4, writer.rows_counter.total)
+    self.assertEqual(2, writer.retried_rows_counter.total)
+
+  def test_invalid_rows_fail_the_writer(self):
+    def make_request(unused_rows):
+      return self.make_response([
+          {'index': 0, 'errors': [{'reason': 'invalid'}]},
+          {'index': 1, 'errors': [{'reason': 'stopped'}]}])
+
+    with self.assertRaises(RuntimeError) as exn:
+      self.write_rows([{'i': i} for i in range(2)], make_request)
+    self.assertIn('invalid', exn.exception.message)
+    self.assertEqual(1, len(self.requests))
+
+  def test_transient_errors_give_up_eventually(self):
+    def make_request(unused_rows):
+      return self.make_response(
+          [{'index': 0, 'errors': [{'reason': 'backendError'}]}])
+
+    with self.assertRaises(RuntimeError):
+      self.write_rows([{'i': 0}], make_request)
+    self.assertEqual(df.io.bigquery.MAX_INSERT_ATTEMPTS, len(self.requests))
+
+class TestBigQueryLoadJobSink(unittest.TestCase):
+
+  def setUp(self):
+    bigquery_io.clear_table_cache()
+
+  def make_sink(self, **kwargs):
+    return df.io.BigQueryLoadJobSink(
+        'project:dataset.table', schema='name:STRING, count:INTEGER',
+        temp_location=tempfile.mkdtemp(), **kwargs)
+
+  def make_client(self, state='DONE', error_result=None):
+    client = mock.Mock()
+    client.jobs.Insert.return_value = bigquery.Job(
+        jobReference=bigquery.JobReference(jobId='loadjob'))
+    client.jobs.Get.return_value = bigquery.Job(status=bigquery.JobStatus(
+        state=state, errorResult=error_result))
+    return client
+
+  def write_bundles(self, sink, bundles):
+    init_result = sink.initialize_write()
+    writer_results = []
+    for i, rows in enumerate(bundles):
+      writer = sink.open_writer(init_result, 'bundle%d' % i)
+      for row in rows:
+        writer.write(row)
+      writer_results.append(writer.close())
+    return init_result, writer_results
+
+  def test_bundles_are_written_as_json_files(self):
+    sink = self.make_sink()
+    bundles = [[{'name': 'a', 'count': 1}, {'name': 'b', 'count': 2}],
+               [{'name': 'c', 'count': 3}]]
+    init_result, writer_results = self.write_bundles(sink, bundles)
+    self.assertTrue(init_result.startswith(sink.temp_location))
+    self.assertEqual(2, len(set(writer_results)))
+    for rows, file_path in zip(bundles, writer_results):
+      self.assertTrue(file_path.startswith(init_result))
+      with open(file_path) as f:
+        self.assertEqual(rows, [json.loads(line) for line in f])
+
+  def test_finalize_runs_a_single_load_job(self):
+    sink = self.make_sink(
+        write_disposition=df.io.BigQueryDisposition.WRITE_TRUNCATE)
+    client = self.make_client()
+    init_result, writer_results = self.write_bundles(
+        sink, [[{'name': 'a', 'count': 1}], [{'name': 'b', 'count': 2}]])
+    sink.finalize_write(init_result, writer_results, client)
+    self.assertEqual(1, client.jobs.Insert.call_count)
+    request = client.jobs.Insert.call_args[0][0]
+    self.assertEqual('project', request.projectId)
+    load = request.job.configuration.load
+    self.assertEqual(writer_results, load.sourceUris)
+    self.assertEqual('NEWLINE_DELIMITED_JSON', load.sourceFormat)
+    self.assertEqual('CREATE_IF_NEEDED', load.createDisposition)
+    self.assertEqual('WRITE_TRUNCATE', load.writeDisposition)
+    self.assertEqual('table', load.destinationTable.tableId)
+    self.assertEqual(['name', 'count'],
+                     [field.name for field in load.schema.fields])
+    self.assertFalse(client.tabledata.InsertAll.called)
+
+  def test_finalize_deletes_loaded_files(self):
+    sink = self.make_sink()
+    init_result, writer_results = self.write_bundles(
+        sink, [[{'name': 'a', 'count': 1}], [{'name': 'b', 'count': 2}]])
+    sink.finalize_write(init_result, writer_results, self.make_client())
+    self.assertFalse(any(os.path.exists(path) for path in writer_results))
+
+  def test_finalize_splits_large_loads(self):
+    sink = self.make_sink(
+        write_disposition=df.io.BigQueryDisposition.WRITE_TRUNCATE)
+    client = self.make_client()
+    init_result, writer_results = self.write_bundles(
+        sink, [[{'name': str(i), 'count': i}] for i in range(5)])
+    with mock.patch.object(bigquery_io, 'MAX_LOAD_JOB_SOURCE_URIS', 2):
+      sink.finalize_write(init_result, writer_results, client)
+    loads = [call[0][0].job.configuration.load
+             for call in client.jobs.Insert.call_args_list]
+    self.assertEqual([writer_results[0:2], writer_results[2:4],
+                      writer_results[4:]],
+                     [load.sourceUris for load in loads])
+    # Only the first job truncates the table.
+    self.assertEqual(['WRITE_TRUNCATE', 'WRITE_APPEND', 'WRITE_APPEND'],
+                     [load.writeDisposition for load in loads])
+
+  def test_failed_load_job(self):
+    sink = self.make_sink()
+    client = self.make_client(
+        error_result=bigquery.ErrorProto(reason='invalid'))
+    init_result, writer_results = self.write_bundles(sink, [[{'count': 1}]])
+    with self.assertRaises(RuntimeError):
+      sink.finalize_write(init_result, writer_results, client)
+    # The files are kept when the load fails.
+    self.assertTrue(os.path.exists(writer_results[0]))
+
+  def test_finalize_without_rows(self):
+    sink = self.make_sink(
+        create_disposition=df.io.BigQueryDisposition.CREATE_NEVER)
+    client = self.make_client()
+    client.tables.Get.side_effect = HttpError(
+        response={'status': '404'}, url='', content='')
+    with self.assertRaises(RuntimeError):
+      sink.finalize_write(sink.initialize_write(), [], client)
+    self.assertFalse(client.jobs.Insert.called)
+
+  def test_finalize_without_rows_applies_dispositions_each_time(self):
+    sink = self.make_sink(
+        write_disposition=df.io.BigQueryDisposition.WRITE_TRUNCATE)
+    client = self.make_client()
+    client.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema())
+    for _ in range(2):
+      sink.finalize_write(sink.initialize_write(), [], client)
+    self.assertEqual(2, client.tables.Delete.call_count)
+
+  def test_invalid_arguments(self):
+    with self.assertRaises(ValueError):
+      df.io.BigQueryLoadJobSink('dataset.table', temp_location='gs://b/tmp')
+    with self.assertRaises(ValueError):
+      df.io.BigQueryLoadJobSink('project:dataset.table')
+    with self.assertRaises(ValueError):
+      df.io.BigQueryLoadJobSink('project:dataset.table',
+                                temp_location='gs://b/tmp',
+                                write_disposition='WRITE_SOMETIMES')
+
+  def test_write_transform(self):
+    sink = self.make_sink()
+    with mock.patch.object(df.io.BigQueryLoadJobSink, 'finalize_write',
+                           autospec=True) as finalize_write:
+      p = df.Pipeline('DirectPipelineRunner')
+      _ = (p | df.Create([{'name': 'a', 'count': 1}])
+           | df.io.Write(sink))
+      p.run()
+    _, init_result, writer_results = finalize_write.call_args[0]
+    writer_results = list(writer_results)
+    self.assertEqual(1, len(writer_results))
+    with open(writer_results[0]) as f:
+      self.assertEqual([{'name': 'a', 'count': 1}],
+                       [json.loads(line) for line in f])
+
+
+class TestTableCache(unittest.TestCase):
+
+  def setUp(self):
+    bigquery_io.clear_table_cache()
+
+  def test_writers_share_the_table_lookup(self):
+    client = mock.Mock()
+    client.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema())
+    client.tabledata.List.return_value = bigquery.TableDataList(totalRows=0)
+    sink = df.io.BigQuerySink('project:dataset.table')
+    for _ in range(3):
+      with sink.writer(client):
+        pass
+    self.assertEqual(1, client.tables.Get.call_count)
+    self.assertEqual(1, client.tabledata.List.call_count)
+    # Other dispositions are not served by the cached lookup.
     with df.io.BigQuerySink(
         'project:dataset.table',
-        write_disposition=write_disposition).writer(client) as writer:
-      writer.Write({'i': 1, 'b': True, 's': 'abc', 'f': 3.14})
+        write_disposition=df.io.BigQueryDisposition.WRITE_APPEND).writer(
+            client):
+      pass
+    self.assertEqual(2, client.tables.Get.call_count)
 
-    sample_row = {'i': 1, 'b': True, 's': 'abc', 'f': 3.14}
-    expected_rows = []
-    json_object = bigquery.JsonObject()
-    for k, v in sample_row.iteritems():
-      json_object.additionalProperties.append(
-          bigquery.JsonObject.AdditionalProperty(
-              key=k, value=to_json_value(v)))
-    expected_rows.append(
-        bigquery.TableDataInsertAllRequest.RowsValueListEntry(
-            insertId='_1',  # First row ID generated with prefix ''
-            json=json_object))
-    client.tabledata.InsertAll.assert_called_with(
-        bigquery.BigqueryTabledataInsertAllRequest(
-            projectId='project', datasetId='dataset', tableId='table',
-            tableDataInsertAllRequest=bigquery.TableDataInsertAllRequest(
-                rows=expected_rows)))
+  def test_entries_expire(self):
+    cache = bigquery_io._TableCache(ttl_secs=10)
+    compute = mock.Mock(side_effect=['first', 'second'])
+    with mock.patch('time.time', return_value=100):
+      self.assertEqual('first', cache.get_or_compute('key', compute))
+    with mock.patch('time.time', return_value=109):
+      self.assertEqual('first', cache.get_or_compute('key', compute))
+    with mock.patch('time.time', return_value=110):
+      self.assertEqual('second', cache.get_or_compute('key', compute))
+
+  def test_truncate_applied_once_per_sink(self):
+    client = mock.Mock()
+    client.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema())
+    sink = df.io.BigQuerySink(
+        'project:dataset.table',
+        write_disposition=df.io.BigQueryDisposition.WRITE_TRUNCATE)
+    # A later bundle does not truncate the rows written by the first one.
+    for _ in range(2):
+      with sink.writer(client):
+        pass
+    self.assertEqual(1, client.tables.Delete.call_count)
+    # Another write to the same table truncates it again.
+    with df.io.BigQuerySink(
+        'project:dataset.table',
+        write_disposition=df.io.BigQueryDisposition.WRITE_TRUNCATE).writer(
+            client):
+      pass
+    self.assertEqual(2, client.tables.Delete.call_count)
+
+  def test_truncated_tables_expire(self):
+    client = mock.Mock()
+    client.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema())
+    sink = df.io.BigQuerySink(
+        'project:dataset.table',
+        write_disposition=df.io.BigQueryDisposition.WRITE_TRUNCATE)
+    with mock.patch('time.time', return_value=100):
+      with sink.writer(client):
+        pass
+    with mock.patch(
+        'time.time', return_value=100 + bigquery_io.TABLE_CACHE_TTL_SECS + 1):
+      with sink.writer(client):
+        pass
+    self.assertEqual(2, client.tables.Get.call_count)
+
+  def test_lookups_without_write_id_are_not_cached(self):
+    client = mock.Mock()
+    client.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema())
+    wrapper = bigquery_io.BigQueryWrapper(client)
+    for _ in range(2):
+      wrapper.get_or_create_table(
+          'project', 'dataset', 'table', None,
+          df.io.BigQueryDisposition.CREATE_NEVER,
+          df.io.BigQueryDisposition.WRITE_TRUNCATE)
+    self.assertEqual(2, client.tables.Delete.call_count)
+
+  def test_schema_is_part_of_the_key(self):
+    client = mock.Mock()
+    client.tables.Get.return_value = bigquery.Table(
+        schema=bigquery.TableSchema())
+    client.tabledata.List.return_value = bigquery.TableDataList(totalRows=0)
+    wrapper = bigquery_io.BigQueryWrapper(client)
+    for schema in ('a:STRING', 'a:STRING', 'b:INTEGER'):
+      wrapper.get_or_create_table(
+          'project', 'dataset', 'table',
+          bigquery_io._parse_table_schema(schema),
+          df.io.BigQueryDisposition.CREATE_IF_NEEDED,
+          df.io.BigQueryDisposition.WRITE_APPEND, write_id='write')
+    self.assertEqual(2, client.tables.Get.call_count)
+
+  def test_failures_are_not_cached(self):
+    cache = bigquery_io._TableCache(ttl_secs=10)
+    compute = mock.Mock(side_effect=[RuntimeError('failed'), 'value'])
+    with self.assertRaises(RuntimeError):
+      cache.get_or_compute('key', compute)
+    self.assertEqual('value', cache.get_or_compute('key', compute))
+
+  def test_concurrent_lookups_are_coalesced(self):
+    cache = bigquery_io._TableCache(ttl_secs=10)
+    computing = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+      calls.append(1)
+      computing.set()
+      release.wait(10)
+      return 'value'
+
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(cache.get_or_compute('key', compute)))
+               for _ in range(5)]
+    threads[0].start()
+    self.assertTrue(computing.wait(10))
+    for thread in threads[1:]:
+      thread.start()
+    release.set()
+    for thread in threads:
+      thread.join(10)
+    self.assertEqual(['value'] * 5, results)
+    self.assertEqual(1, len(calls))
+
+
+class TestRowConverter(unittest.TestCase):
+
+  def json_value(self, obj):
+    """Like to_json_value() but also converts None to a null JSON value."""
+    if obj is None:
+      return extra_types.JsonValue(is_null=True)
+    elif isinstance(obj, list):
+      return extra_types.JsonValue(array_value=extra_types.JsonArray(
+          entries=[self.json_value(e) for e in obj]))
+    elif isinstance(obj, dict):
+      return extra_types.JsonValue(object_value=extra_types.JsonObject(
+          properties=[extra_types.JsonObject.Property(
+              key=k, value=self.json_value(v)) for k, v in obj.iteritems()]))
+    return to_json_value(obj)
+
+  def test_nested_and_repeated_fields(self):
+    schema = bigquery.TableSchema(fields=[
+        bigquery.TableFieldSchema(name='i', type='INTEGER'),
+        bigquery.TableFieldSchema(name='tags', type='STRING', mode='REPEATED'),
+        bigquery.TableFieldSchema(
+            name='point', type='RECORD', fields=[
+                bigquery.TableFieldSchema(name='x', type='FLOAT'),
+                bigquery.TableFieldSchema(name='ok', type='BOOLEAN'),
+                bigquery.TableFieldSchema(name='missing', type='STRING')]),
+        bigquery.TableFieldSchema(
+            name='events', type='RECORD', mode='REPEATED', fields=[
+                bigquery.TableFieldSchema(name='t', type='TIMESTAMP')]),
+        bigquery.TableFieldSchema(name='n', type='STRING')])
+    row = bigquery.TableRow(f=[
+        bigquery.TableCell(v=self.json_value('7')),
+        bigquery.TableCell(v=self.json_value([{'v': 'a'}, {'v': 'b'}])),
+        bigquery.TableCell(v=self.json_value(
+            {'f': [{'v': '1.5'}, {'v': 'true'}, {'v': None}]})),
+        bigquery.TableCell(v=self.json_value(
+            [{'v': {'f': [{'v': '10.0'}]}}, {'v': {'f': [{'v': '20.0'}]}}])),
+        bigquery.TableCell(v=None)])
+    wrapper = df.io.bigquery.BigQueryWrapper(client=mock.Mock())
+    self.assertEqual(
+        {'i': 7, 'tags': ['a', 'b'], 'point': {'x': 1.5, 'ok': True},
+         'events': [{'t': 10.0}, {'t': 20.0}]},
+        wrapper.convert_row_to_dict(row, schema))
+
+  def test_unexpected_type(self):
+    schema = bigquery.TableSchema(fields=[
+        bigquery.TableFieldSchema(name='x', type='GEOGRAPHY')])
+    wrapper = df.io.bigquery.BigQueryWrapper(client=mock.Mock())
+    self.assertEqual(
+        {}, wrapper.convert_row_to_dict(
+            bigquery.TableRow(f=[bigquery.TableCell(v=None)]), schema))
+    with self.assertRaises(RuntimeError):
+      wrapper.convert_row_to_dict(
+          bigquery.TableRow(f=[bigquery.TableCell(v=to_json_value('x'))]),
+          schema)
 
+  def test_converter_is_reused(self):
+    schema = bigquery.TableSchema(fields=[
+        bigquery.TableFieldSchema(name='x', type='STRING')])
+    wrapper = df.io.bigquery.BigQueryWrapper(client=mock.Mock())
+    converter = wrapper.get_row_converter(schema)
+    self.assertIs(converter, wrapper.get_row_converter(schema))
+    self.assertIs(converter, wrapper.get_row_converter(
+        bigquery.TableSchema(fields=[
+            bigquery.TableFieldSchema(name='x', type='STRING')])))
+    self.assertIsNot(converter, wrapper.get_row_converter(
+        bigquery.TableSchema(fields=[
+            bigquery.TableFieldSchema(name='y', type='STRING')])))
 
 if __name__ == '__main__':
   logging.getLogger().setLevel(logging.INFO)
@@ -16,20 +16,23 @@
 
 from __future__ import absolute_import
 
+import bz2
 import glob
 import logging
 import os
 import re
 import tempfile
+import zlib
 
 from google.cloud.dataflow import coders
 from google.cloud.dataflow.io import iobase
+from google.cloud.dataflow.io import prefetch
 from google.cloud.dataflow.io import range_trackers
 from google.cloud.dataflow.utils import processes
 from google.cloud.dataflow.utils import retry
 
 
-__all__ = ['TextFileSource', 'TextFileSink']
+__all__ = ['TextFileSource', 'TextFileSink', 'CompressionTypes']
 
 
 # Retrying is needed because there are transient errors that can happen.
@@ -50,13 +53,470 @@ def _gcs_file_copy(from_path, to_path, encoding=''):
     raise ValueError(
         'Failed to copy GCS file from %s to %s (stdout=%s, stderr=%s).' % (
             from_path, to_path, stdoutdata, stderrdata))
+  # pylint: disable=g-import-not-at-top
+  from google.cloud.dataflow.io import gcsio
+  gcsio.invalidate_glob_cache(to_path)
+
+
+def _is_multi_file_pattern(file_path):
+  """Returns True if the path contains glob characters (*, ?, [...] sets)."""
+  return re.search(r'[*?\[\]]', file_path) is not None
+
+
+def _expand_file_pattern(file_pattern):
+  """Returns the local or GCS file paths matching a glob pattern."""
+  if file_pattern.startswith('gs://'):
+    # pylint: disable=g-import-not-at-top
+    from google.cloud.dataflow.io import gcsio
+    return gcsio.GcsIO().glob(file_pattern, use_cache=True)
+  else:
+    return glob.glob(file_pattern)
+
+
+def _expand_file_pattern_with_sizes(file_pattern):
+  """Returns (path, size) tuples for the files matching a glob pattern."""
+  if file_pattern.startswith('gs://'):
+    # pylint: disable=g-import-not-at-top
+    from google.cloud.dataflow.io import gcsio
+    return gcsio.GcsIO().glob(file_pattern, return_sizes=True, use_cache=True)
+  else:
+    return [(file_path, os.path.getsize(file_path))
+            for file_path in glob.glob(file_pattern)]
+
+
+def _file_size(file_path):
+  """Returns the size in bytes of a local or GCS file."""
+  if file_path.startswith('gs://'):
+    # pylint: disable=g-import-not-at-top
+    from google.cloud.dataflow.io import gcsio
+    return gcsio.GcsIO().size(file_path)
+  else:
+    return os.path.getsize(file_path)
+
+
+def open_file(file_path, mode='rb'):
+  """Opens a local or GCS file."""
+  if file_path.startswith('gs://'):
+    # pylint: disable=g-import-not-at-top
+    from google.cloud.dataflow.io import gcsio
+    return gcsio.GcsIO().open(file_path, mode)
+  else:
+    return open(file_path, mode)
+
+
+def delete_file(file_path):
+  """Deletes a local or GCS file."""
+  if file_path.startswith('gs://'):
+    # pylint: disable=g-import-not-at-top
+    from google.cloud.dataflow.io import gcsio
+    gcsio.GcsIO().delete(file_path)
+  else:
+    os.remove(file_path)
+
+
+# -----------------------------------------------------------------------------
+# CompressionTypes, _CompressedFile.
+
+
+class CompressionTypes(object):
+  """Class holding standard strings used for compression types."""
+
+  AUTO = 'AUTO'
+  UNCOMPRESSED = 'UNCOMPRESSED'
+  GZIP = 'GZIP'
+  BZIP2 = 'BZIP2'
+  DEFLATE = 'DEFLATE'
+
+  # Maps file name extensions to the compression type used when the
+  # compression type is AUTO.
+  _EXTENSIONS = {
+      '.gz': GZIP,
+      '.gzip': GZIP,
+      '.bz2': BZIP2,
+      '.bzip2': BZIP2,
+      '.deflate': DEFLATE,
+      '.zz': DEFLATE,
+      '.zlib': DEFLATE,
+  }
+
+  @staticmethod
+  def validate(compression_type):
+    values = (CompressionTypes.AUTO,
+              CompressionTypes.UNCOMPRESSED,
+              CompressionTypes.GZIP,
+              CompressionTypes.BZIP2,
+              CompressionTypes.DEFLATE)
+    if compression_type not in values:
+      raise ValueError(
+          'Invalid compression type %s. Expecting %s' % (
+              compression_type, values))
+    return compression_type
+
+  @staticmethod
+  def detect_compression_type(file_path, compression_type=AUTO):
+    """Returns the compression type to use for reading a file.
+
+    Args:
+      file_path: The path of the file to be read.
+      compression_type: One of the CompressionTypes values. If AUTO the
+        compression type is inferred from the file name extension.
+
+    Returns:
+      One of the CompressionTypes values except AUTO.
+    """
+    if compression_type != CompressionTypes.AUTO:
+      return compression_type
+    _, extension = os.path.splitext(file_path)
+    return CompressionTypes._EXTENSIONS.get(
+        extension.lower(), CompressionTypes.UNCOMPRESSED)
+
+
+class _CompressedFile(object):
+  """A read-only file-like object decompressing a raw file on the fly.
+
+  The raw file can be a local file or a gcsio.GcsBufferedReader. Data is
+  decompressed in a streaming fashion so that only a bounded amount of
+  compressed and uncompressed data is kept in memory. Concatenated gzip
+  members and bzip2 streams are supported.
+  """
+
+  def __init__(self, fileobj, compression_type,
+               read_size=1024 * 1024):
+    if compression_type not in (CompressionTypes.GZIP,
+                                CompressionTypes.BZIP2,
+                                CompressionTypes.DEFLATE):
+      raise ValueError(
+          'Unsupported compression type for a compressed file: %s' %
+          compression_type)
+    self._file = fileobj
+    self._compression_type = compression_type
+    self._read_size = read_size
+    self._data = ''
+    self._read_position = 0
+    self._uncompressed_position = 0
+    self._raw_eof = False
+    self._decompressor = self._new_decompressor()
+
+  def _new_decompressor(self):
+    if self._compression_type == CompressionTypes.BZIP2:
+      return bz2.BZ2Decompressor()
+    elif self._compression_type == CompressionTypes.GZIP:
+      # Adding 16 to the window size makes zlib expect a gzip header.
+      return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    else:
+      return zlib.decompressobj(zlib.MAX_WBITS)
+
+  def _decompress(self, compressed):
+    """Decompresses a chunk, starting a new stream if one just ended."""
+    chunks = []
+    while compressed:
+      try:
+        chunks.append(self._decompressor.decompress(compressed))
+      except EOFError:
+        # A bz2 decompressor refuses any input past the end of its stream.
+        self._decompressor = self._new_decompressor()
+        continue
+      compressed = self._decompressor.unused_data
+      if compressed:
+        # The current stream ended in the middle of the chunk and another
+        # stream (e.g. a concatenated gzip member) follows it.
+        self._decompressor = self._new_decompressor()
+    return ''.join(chunks)
+
+  def _fetch_to_buffer(self, num_bytes):
+    """Makes at least num_bytes of uncompressed data available, if possible."""
+    # Drop data that has already been consumed before growing the buffer.
+    if self._read_position:
+      self._data = self._data[self._read_position:]
+      self._read_position = 0
+    chunks = [self._data]
+    available = len(self._data)
+    while available < num_bytes and not self._raw_eof:
+      compressed = self._file.read(self._read_size)
+      if not compressed:
+        self._raw_eof = True
+        if self._compression_type != CompressionTypes.BZIP2:
+          chunks.append(self._decompressor.flush())
+        break
+      uncompressed = self._decompress(compressed)
+      chunks.append(uncompressed)
+      available += len(uncompressed)
+    self._data = ''.join(chunks)
+
+  def _consume(self, num_bytes):
+    result = self._data[self._read_position:self._read_position + num_bytes]
+    self._read_position += len(result)
+    self._uncompressed_position += len(result)
+    return result
+
+  def read(self, num_bytes=-1):
+    if num_bytes is None or num_bytes < 0:
+      self._fetch_to_buffer(float('inf'))
+      return self._consume(len(self._data))
+    if len(self._data) - self._read_position < num_bytes:
+      self._fetch_to_buffer(num_bytes)
+    return self._consume(num_bytes)
+
+  def readline(self):
+    """Reads a line including its trailing newline, if present."""
+    newline = self._data.find('\n', self._read_position)
+    while newline == -1 and not self._raw_eof:
+      searched = len(self._data) - self._read_position
+      self._fetch_to_buffer(searched + self._read_size)
+      newline = self._data.find('\n', searched)
+    if newline == -1:
+      return self._consume(len(self._data) - self._read_position)
+    return self._consume(newline + 1 - self._read_position)
+
+  def tell(self):
+    """Returns the current offset in the uncompressed data."""
+    return self._uncompressed_position
+
+  @property
+  def compressed_position(self):
+    """Returns how many compressed bytes were consumed from the raw file."""
+    return self._file.tell()
+
+  def close(self):
+    self._file.close()
+    self._data = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    self.close()
+
+
+# -----------------------------------------------------------------------------
+# FileBasedSource, FileBasedReader, MultiFileReader.
+
+
+class FileBasedSource(iobase.Source):
+  """Base class of the sources reading byte ranges of local or GCS files.
+
+  The file path of a source can contain glob characters, in which case the
+  source reads all the files matching the pattern and its offsets must not be
+  specified. Sources are split by file and by byte ranges cut at arbitrary
+  offsets, hence the readers of subclasses must skip the record straddling
+  their start offset and finish the one straddling their end offset.
+
+  Subclasses implement _file_source() and _file_reader(), and may override
+  _is_splittable().
+  """
+
+  def __init__(self, file_path, start_offset=None, end_offset=None):
+    """Initializes a FileBasedSource.
+
+    Args:
+      file_path: The file path to read from as a local file path or a GCS
+        gs:// path. The path can contain glob characters (*, ?, and [...]
+        sets).
+      start_offset: The byte offset in the file that the reader should start
+        reading. By default is 0 (beginning of file).
+      end_offset: The byte offset in the file that the reader should stop
+        reading. By default it is the end of the file.
+
+    Raises:
+      TypeError: if file_path is not a string.
+    """
+    if not isinstance(file_path, basestring):
+      raise TypeError(
+          '%s: file_path must be a string;  got %r instead' %
+          (self.__class__.__name__, file_path))
+
+    self.file_path = file_path
+    self.start_offset = start_offset
+    self.end_offset = end_offset
+
+    self.is_gcs_source = file_path.startswith('gs://')
+
+  @property
+  def path(self):
+    return self.file_path
+
+  def _file_source(self, file_path, start_offset=None, end_offset=None):
+    """Returns a source reading a single file with the same settings."""
+    raise NotImplementedError
+
+  def _file_reader(self):
+    """Returns a reader for the byte range of a single file."""
+    raise NotImplementedError
+
+  def _is_splittable(self):
+    """Returns True if the file of the source can be split in byte ranges."""
+    return True
+
+  def estimate_size(self):
+    if _is_multi_file_pattern(self.file_path):
+      return sum(size for _, size in
+                 _expand_file_pattern_with_sizes(self.file_path))
+    start_offset = self.start_offset or 0
+    end_offset = self.end_offset
+    if end_offset is None:
+      end_offset = _file_size(self.file_path)
+    return max(0, end_offset - start_offset)
+
+  def split(self, desired_bundle_size):
+    """Splits the source into bundles by file and by byte ranges.
+
+    A multi-file source is split into one or more bundles per file. Files
+    that cannot be split always form a single bundle.
+
+    Args:
+      desired_bundle_size: the desired size (in bytes) of each bundle.
+
+    Returns:
+      A list of sources of the same class, each reading a single file.
+
+    Raises:
+      ValueError: if desired_bundle_size is not positive.
+      RuntimeError: if a multi-file pattern does not match any files.
+    """
+    if desired_bundle_size <= 0:
+      raise ValueError(
+          'Desired bundle size must be positive; got %r' % desired_bundle_size)
+    if not _is_multi_file_pattern(self.file_path):
+      return self._split_file(desired_bundle_size)
+    files = _expand_file_pattern_with_sizes(self.file_path)
+    if not files:
+      raise RuntimeError('No files found for path: %s' % self.file_path)
+    bundles = []
+    for file_path, file_size in files:
+      bundles.extend(self._file_source(file_path)._split_file(
+          desired_bundle_size, file_size=file_size))
+    return bundles
+
+  def _split_file(self, desired_bundle_size, file_size=None):
+    if not self._is_splittable():
+      return [self]
+    start_offset = self.start_offset or 0
+    end_offset = self.end_offset
+    if end_offset is None:
+      end_offset = (file_size if file_size is not None
+                    else _file_size(self.file_path))
+    bundles = []
+    while start_offset < end_offset:
+      bundle_end = min(start_offset + desired_bundle_size, end_offset)
+      bundles.append(
+          self._file_source(self.file_path, start_offset, bundle_end))
+      start_offset = bundle_end
+    return bundles or [self]
+
+  def reader(self):
+    # If a multi-file pattern was specified as a source then make sure the
+    # start/end offsets use the default values for reading the entire file.
+    if _is_multi_file_pattern(self.file_path):
+      if self.start_offset is not None:
+        raise ValueError(
+            'start offset cannot be specified for a multi-file source: '
+            '%s' % self.file_path)
+      if self.end_offset is not None:
+        raise ValueError(
+            'End offset cannot be specified for a multi-file source: '
+            '%s' % self.file_path)
+      return MultiFileReader(self)
+    else:
+      return self._file_reader()
+
+
+class FileBasedReader(iobase.SourceReader):
+  """Base class of the readers of a byte range of a single file.
+
+  Subclasses open the file and create self.range_tracker in __enter__, and
+  implement _iter_records(), claiming the offset of each split point from the
+  range tracker and keeping current_offset up to date.
+  """
+
+  def __init__(self, source):
+    self.source = source
+    self.start_offset = self.source.start_offset or 0
+    self.end_offset = self.source.end_offset
+    self.current_offset = self.start_offset
+    self._records = None
+
+  def _open_file(self):
+    return open_file(self.source.file_path, 'rb')
+
+  def __iter__(self):
+    # Records of the current block are buffered inside the generator, hence
+    # the same generator must be resumed if iteration is restarted (e.g. after
+    # a dynamic split).
+    if self._records is None:
+      self._records = self._iter_records()
+    return self._records
+
+  def _iter_records(self):
+    raise NotImplementedError
+
+  def get_progress(self):
+    return iobase.ReaderProgress(
+        position=iobase.ReaderPosition(byte_offset=self.current_offset))
+
+  def request_dynamic_split(self, dynamic_split_request):
+    assert dynamic_split_request is not None
+    progress = dynamic_split_request.progress
+    split_position = progress.position
+    if split_position is None:
+      percent_complete = progress.percent_complete
+      if percent_complete is not None:
+        if percent_complete <= 0 or percent_complete >= 1:
+          logging.warning(
+              '%s cannot be split since the provided percentage of work to '
+              'be completed is out of the valid range (0, 1). Requested: %r',
+              self.__class__.__name__, dynamic_split_request)
+          return
+        split_position = iobase.ReaderPosition()
+        split_position.byte_offset = (
+            self.range_tracker.get_position_for_fraction_consumed(
+                percent_complete))
+      else:
+        logging.warning(
+            '%s requires either a position or a percentage of work to be '
+            'complete to perform a dynamic split request. Requested: %r',
+            self.__class__.__name__, dynamic_split_request)
+        return
+
+    if self.range_tracker.try_split_at_position(split_position.byte_offset):
+      return iobase.DynamicSplitResultWithPosition(split_position)
+    else:
+      return
+
+
+class MultiFileReader(iobase.SourceReader):
+  """A reader for a FileBasedSource reading a multi-file pattern."""
+
+  def __init__(self, source):
+    self.source = source
+    self.file_paths = _expand_file_pattern(self.source.file_path)
+    if not self.file_paths:
+      raise RuntimeError(
+          'No files found for path: %s' % self.source.file_path)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    pass
+
+  def __iter__(self):
+    # pylint: disable=protected-access
+    file_sources = [self.source._file_source(path) for path in self.file_paths]
+    # The next few files are opened while the current one is being read.
+    for index, file_reader in enumerate(
+        prefetch.prefetched_readers(file_sources)):
+      logging.info('Reading from %s (%d/%d)', self.file_paths[index],
+                   index + 1, len(self.file_paths))
+      with file_reader:
+        for record in file_reader:
+          yield record
 
 
 # -----------------------------------------------------------------------------
 # TextFileSource, TextFileSink.
 
 
-class TextFileSource(iobase.Source):
+class TextFileSource(FileBasedSource):
   """A source for a GCS or local text file.
 
   Parses a text file as newline-delimited elements, by default assuming
@@ -77,13 +537,17 @@ class TextFileSource(iobase.Source):
       end_offset: The byte offset in the file that the reader should stop
         reading. By default it is the end of the file.
       compression_type: Used to handle compressed input files. Typical value
-          is 'AUTO'.
+          is CompressionTypes.AUTO, in which case gzip, bzip2 and deflate
+          compressed files are detected by their file name extension.
+          Compressed files cannot be split and must be read from the
+          beginning.
       strip_trailing_newlines: Indicates whether this source should remove
           the newline char in each line it reads before decoding that line.
       coder: Coder used to decode each line.
 
     Raises:
       TypeError: if file_path is not a string.
+      ValueError: if compression_type is not one of CompressionTypes.
 
     If the file_path contains glob characters then the start_offset and
     end_offset must not be specified.
@@ -100,20 +564,11 @@ class TextFileSource(iobase.Source):
     If end_offset falls inside a line (any character except the first one) then
     the source will contain that entire line.
     """
-    if not isinstance(file_path, basestring):
-      raise TypeError(
-          '%s: file_path must be a string;  got %r instead' %
-          (self.__class__.__name__, file_path))
-
-    self.file_path = file_path
-    self.start_offset = start_offset
-    self.end_offset = end_offset
-    self.compression_type = compression_type
+    super(TextFileSource, self).__init__(file_path, start_offset, end_offset)
+    self.compression_type = CompressionTypes.validate(compression_type)
     self.strip_trailing_newlines = strip_trailing_newlines
     self.coder = coder
 
-    self.is_gcs_source = file_path.startswith('gs://')
-
   @property
   def format(self):
     """Source format name required for remote execution."""
@@ -123,28 +578,24 @@ class TextFileSource(iobase.Source):
     return (self.file_path == other.file_path and
             self.start_offset == other.start_offset and
             self.end_offset == other.end_offset and
+            self.compression_type == other.compression_type and
             self.strip_trailing_newlines == other.strip_trailing_newlines and
             self.coder == other.coder)
 
-  @property
-  def path(self):
-    return self.file_path
+  def _file_source(self, file_path, start_offset=None, end_offset=None):
+    return TextFileSource(
+        file_path, start_offset=start_offset, end_offset=end_offset,
+        compression_type=self.compression_type,
+        strip_trailing_newlines=self.strip_trailing_newlines,
+        coder=self.coder)
 
-  def reader(self):
-    # If a multi-file pattern was specified as a source then make sure the
-    # start/end offsets use the default values for reading the entire file.
-    if re.search(r'[*?\[\]]', self.file_path) is not None:
-      if self.start_offset is not None:
-        raise ValueError(
-            'start offset cannot be specified for a multi-file source: '
-            '%s' % self.file_path)
-      if self.end_offset is not None:
-        raise ValueError(
-            'End offset cannot be specified for a multi-file source: '
-            '%s' % self.file_path)
-      return TextMultiFileReader(self)
-    else:
-      return TextFileReader(self)
+  def _file_reader(self):
+    return TextFileReader(self)
+
+  def _is_splittable(self):
+    # Compressed files cannot be split and always form a single bundle.
+    return CompressionTypes.detect_compression_type(
+        self.file_path, self.compression_type) == CompressionTypes.UNCOMPRESSED
 
 
 class TextFileSink(iobase.NativeSink):
@@ -247,25 +698,30 @@ class TextFileSink(iobase.NativeSink):
 
 
 # -----------------------------------------------------------------------------
-# TextFileReader, TextMultiFileReader.
+# TextFileReader.
 
 
-class TextFileReader(iobase.SourceReader):
+class TextFileReader(FileBasedReader):
   """A reader for a text file source."""
 
+  # Number of bytes read from the underlying file at a time. Lines are split
+  # and decoded a block at a time instead of being read one by one.
+  read_block_size = 64 * 1024
+
   def __init__(self, source):
-    self.source = source
-    self.start_offset = self.source.start_offset or 0
-    self.end_offset = self.source.end_offset
-    self.current_offset = self.start_offset
+    super(TextFileReader, self).__init__(source)
+    self.compression_type = CompressionTypes.detect_compression_type(
+        self.source.file_path, self.source.compression_type)
+
+  @property
+  def is_compressed(self):
+    return self.compression_type != CompressionTypes.UNCOMPRESSED
 
   def __enter__(self):
-    if self.source.is_gcs_source:
-      # pylint: disable=g-import-not-at-top
-      from google.cloud.dataflow.io import gcsio
-      self._file = gcsio.GcsIO().open(self.source.file_path, 'rb')
-    else:
-      self._file = open(self.source.file_path, 'rb')
+    if self.is_compressed:
+      return self._enter_compressed()
+
+    self._file = self._open_file()
     # Determine the real end_offset.
     # If not specified it will be the length of the file.
     if self.end_offset is None:
@@ -293,91 +749,111 @@ class TextFileReader(iobase.SourceReader):
 
     return self
 
+  def _enter_compressed(self):
+    # Compressed files cannot be split since there is no way to start
+    # decompressing at an arbitrary offset. The whole file is read by a single
+    # reader and positions are reported as offsets into the compressed file.
+    if self.start_offset:
+      raise ValueError(
+          'Compressed file %s cannot be read starting at offset %d' %
+          (self.source.file_path, self.start_offset))
+    if self.end_offset is not None:
+      logging.warning(
+          'Ignoring end offset %d for compressed file %s',
+          self.end_offset, self.source.file_path)
+    self._file = _CompressedFile(self._open_file(), self.compression_type)
+    self.end_offset = range_trackers.OffsetRangeTracker.OFFSET_INFINITY
+    self.range_tracker = range_trackers.OffsetRangeTracker(0, self.end_offset)
+    return self
+
   def __exit__(self, exception_type, exception_value, traceback):
     self._file.close()
 
-  def __iter__(self):
+  def _read_line_blocks(self):
+    """Reads the file in large blocks and splits each block into lines.
+
+    Yields:
+      (lines, terminated) tuples in file order, where lines is a list of
+      lines without their trailing newline characters and terminated tells
+      whether each of these lines was followed by a newline in the file. Only
+      the last line of a file can be unterminated.
+    """
+    pending = []
     while True:
-      if not self.range_tracker.try_return_record_at(
-          is_at_split_point=True,
-          record_start=self.current_offset):
-        # Reader has completed reading the set of records in its range. Note
-        # that the end offset of the range may be smaller than the original
-        # end offset defined when creating the reader due to reader accepting
-        # a dynamic split request from the service.
+      block = self._file.read(self.read_block_size)
+      if not block:
+        if pending:
+          yield [''.join(pending)], False
         return
-      line = self._file.readline()
-      self.current_offset += len(line)
-      if self.source.strip_trailing_newlines:
-        line = line.rstrip('\n')
-      yield self.source.coder.decode(line)
-
-  def get_progress(self):
-    return iobase.ReaderProgress(
-        position=iobase.ReaderPosition(byte_offset=self.current_offset))
-
-  def request_dynamic_split(self, dynamic_split_request):
-    assert dynamic_split_request is not None
-    progress = dynamic_split_request.progress
-    split_position = progress.position
-    if split_position is None:
-      percent_complete = progress.percent_complete
-      if percent_complete is not None:
-        if percent_complete <= 0 or percent_complete >= 1:
-          logging.warning(
-              'FileBasedReader cannot be split since the provided percentage '
-              'of work to be completed is out of the valid range (0, '
-              '1). Requested: %r',
-              dynamic_split_request)
+      if '\n' not in block:
+        # Avoid repeatedly concatenating the pieces of a very long line.
+        pending.append(block)
+        continue
+      if pending:
+        pending.append(block)
+        block = ''.join(pending)
+      lines = block.split('\n')
+      last = lines.pop()
+      pending = [last] if last else []
+      yield lines, True
+
+  def _decode_lines(self, lines, terminated):
+    decode = self.source.coder.decode
+    if not self.source.strip_trailing_newlines and terminated:
+      return [decode(line + '\n') for line in lines]
+    return [decode(line) for line in lines]
+
+  def _iter_records(self):
+    if self.is_compressed:
+      return self._iter_compressed()
+    else:
+      return self._iter_uncompressed()
+
+  def _iter_uncompressed(self):
+    try_return_record_at = self.range_tracker.try_return_record_at
+    for lines, terminated in self._read_line_blocks():
+      newline_size = 1 if terminated else 0
+      # Lines are decoded a block at a time, but each one must still be
+      # claimed from the range tracker right before it is returned so that
+      # dynamic splits can happen at any line boundary.
+      for line, record in zip(lines, self._decode_lines(lines, terminated)):
+        if not try_return_record_at(is_at_split_point=True,
+                                    record_start=self.current_offset):
+          # Reader has completed reading the set of records in its range.
+          # Note that the end offset of the range may be smaller than the
+          # original end offset defined when creating the reader due to reader
+          # accepting a dynamic split request from the service.
           return
-        split_position = iobase.ReaderPosition()
-        split_position.byte_offset = (
-            self.range_tracker.get_position_for_fraction_consumed(
-                percent_complete))
-      else:
-        logging.warning(
-            'TextReader requires either a position or a percentage of work to '
-            'be complete to perform a dynamic split request. Requested: %r',
-            dynamic_split_request)
-        return
+        self.current_offset += len(line) + newline_size
+        yield record
+
+  def _iter_compressed(self):
+    # Only the first record is a split point. The range is infinite so the
+    # tracker never stops the reader and refuses all split requests, hence it
+    # is enough to report a position once per block.
+    is_at_split_point = True
+    for lines, terminated in self._read_line_blocks():
+      self.range_tracker.try_return_record_at(
+          is_at_split_point=is_at_split_point,
+          record_start=self.current_offset)
+      is_at_split_point = False
+      self.current_offset = self._file.compressed_position
+      for record in self._decode_lines(lines, terminated):
+        yield record
 
-    if self.range_tracker.try_split_at_position(split_position.byte_offset):
-      return iobase.DynamicSplitResultWithPosition(split_position)
-    else:
+  def request_dynamic_split(self, dynamic_split_request):
+    if self.is_compressed:
+      logging.debug(
+          'Refusing to split compressed file %s: compression type %s is not '
+          'splittable. Requested: %r', self.source.file_path,
+          self.compression_type, dynamic_split_request)
       return
+    return super(TextFileReader, self).request_dynamic_split(
+        dynamic_split_request)
 
 
-class TextMultiFileReader(iobase.SourceReader):
-  """A reader for a multi-file text source."""
-
-  def __init__(self, source):
-    self.source = source
-    if source.is_gcs_source:
-      # pylint: disable=g-import-not-at-top
-      from google.cloud.dataflow.io import gcsio
-      self.file_paths = gcsio.GcsIO().glob(self.source.file_path)
-    else:
-      self.file_paths = glob.glob(self.source.file_path)
-    if not self.file_paths:
-      raise RuntimeError(
-          'No files found for path: %s' % self.source.file_path)
-
-  def __enter__(self):
-    return self
-
-  def __exit__(self, exception_type, exception_value, traceback):
-    pass
-
-  def __iter__(self):
-    index = 0
-    for path in self.file_paths:
-      index += 1
-      logging.info('Reading from %s (%d/%d)', path, index, len(self.file_paths))
-      with TextFileSource(
-          path, strip_trailing_newlines=self.source.strip_trailing_newlines,
-          coder=self.source.coder).reader() as reader:
-        for line in reader:
-          yield line
+# The reader of multi-file text sources.
+TextMultiFileReader = MultiFileReader
 
 
 # -----------------------------------------------------------------------------
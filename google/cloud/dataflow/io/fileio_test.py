@@ -15,10 +15,15 @@
 
 """Unit tests for local and GCS sources and sinks."""
 
+import bz2
+import gzip
 import logging
+import os
 import tempfile
 import unittest
+import zlib
 
+from google.cloud.dataflow import coders
 from google.cloud.dataflow.io import fileio
 from google.cloud.dataflow.io import iobase
 
@@ -72,6 +77,30 @@ class TestTextFileSource(unittest.TestCase):
         read_lines.append(line)
     self.assertEqual(read_lines, lines)
 
+  def test_read_lines_across_blocks(self):
+    lines = ['', 'a' * 10, 'b', '', 'c' * 25, 'd' * 7, '']
+    file_path = self.create_temp_file('\n'.join(lines))
+    for block_size in (1, 2, 3, 7, 64):
+      source = fileio.TextFileSource(file_path=file_path)
+      reader = source.reader()
+      reader.read_block_size = block_size
+      with reader:
+        self.assertEqual(list(reader), lines[:-1])
+      source = fileio.TextFileSource(file_path=file_path, start_offset=3,
+                                     end_offset=16)
+      reader = source.reader()
+      reader.read_block_size = block_size
+      with reader:
+        self.assertEqual(list(reader), ['b', '', 'c' * 25])
+
+  def test_read_without_stripping_newlines(self):
+    lines = ['First', 'Second', 'Third']
+    source = fileio.TextFileSource(
+        file_path=self.create_temp_file('\n'.join(lines)),
+        strip_trailing_newlines=False)
+    with source.reader() as reader:
+      self.assertEqual(list(reader), ['First\n', 'Second\n', 'Third'])
+
   def test_progress_entire_file(self):
     lines = ['First', 'Second', 'Third']
     source = fileio.TextFileSource(
@@ -325,6 +354,207 @@ class TestTextFileSource(unittest.TestCase):
     self.progress_with_offsets(lines, start_offset=20, end_offset=20)
 
 
+class TestTextFileSourceSplitting(unittest.TestCase):
+
+  def create_temp_file(self, text, suffix=''):
+    temp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    with temp.file as tmp:
+      tmp.write(text)
+    return temp.name
+
+  def read_bundles(self, bundles):
+    lines = []
+    for bundle in bundles:
+      with bundle.reader() as reader:
+        lines.extend(reader)
+    return lines
+
+  def test_estimate_size(self):
+    file_path = self.create_temp_file('a' * 100)
+    self.assertEqual(100, fileio.TextFileSource(file_path).estimate_size())
+    self.assertEqual(60, fileio.TextFileSource(
+        file_path, start_offset=20, end_offset=80).estimate_size())
+
+  def test_split_single_file(self):
+    lines = ['line %d' % i for i in range(100)]
+    file_path = self.create_temp_file('\n'.join(lines))
+    source = fileio.TextFileSource(file_path)
+    for bundle_size in (1, 7, 50, 1000, 10000):
+      bundles = source.split(bundle_size)
+      self.assertEqual(lines, self.read_bundles(bundles))
+      for bundle in bundles[:-1]:
+        self.assertEqual(bundle_size, bundle.end_offset - bundle.start_offset)
+    self.assertEqual(1, len(source.split(10000)))
+
+  def test_split_range(self):
+    lines = ['line %d' % i for i in range(100)]
+    file_path = self.create_temp_file('\n'.join(lines))
+    source = fileio.TextFileSource(file_path, start_offset=100,
+                                   end_offset=300)
+    with source.reader() as reader:
+      expected = list(reader)
+    bundles = source.split(30)
+    self.assertEqual(100, bundles[0].start_offset)
+    self.assertEqual(300, bundles[-1].end_offset)
+    self.assertEqual(expected, self.read_bundles(bundles))
+
+  def test_split_multiple_files(self):
+    temp_dir = tempfile.mkdtemp()
+    expected = []
+    for i in range(5):
+      lines = ['file %d line %d' % (i, j) for j in range(20)]
+      expected.extend(lines)
+      with open(os.path.join(temp_dir, 'file%d.txt' % i), 'w') as f:
+        f.write('\n'.join(lines))
+    source = fileio.TextFileSource(os.path.join(temp_dir, '*.txt'))
+    self.assertEqual(sum(os.path.getsize(os.path.join(temp_dir, name))
+                         for name in os.listdir(temp_dir)),
+                     source.estimate_size())
+    bundles = source.split(100)
+    self.assertGreater(len(bundles), 5)
+    for bundle in bundles:
+      self.assertFalse(fileio._is_multi_file_pattern(bundle.file_path))
+    self.assertEqual(sorted(expected), sorted(self.read_bundles(bundles)))
+
+  def test_split_compressed_file(self):
+    temp = tempfile.NamedTemporaryFile(delete=False, suffix='.gz')
+    temp.close()
+    with gzip.GzipFile(temp.name, 'wb') as f:
+      f.write('\n'.join(['a'] * 1000))
+    source = fileio.TextFileSource(temp.name)
+    self.assertEqual([source], source.split(10))
+
+  def test_split_no_files(self):
+    source = fileio.TextFileSource(os.path.join(tempfile.mkdtemp(), '*.txt'))
+    with self.assertRaises(RuntimeError):
+      source.split(100)
+
+
+class TestCompressedTextFileSource(unittest.TestCase):
+
+  def create_temp_file(self, contents, suffix=''):
+    temp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    with temp.file as tmp:
+      tmp.write(contents)
+    return temp.name
+
+  def create_gzip_file(self, text, suffix='.gz'):
+    path = self.create_temp_file('', suffix=suffix)
+    with gzip.GzipFile(path, 'wb') as f:
+      f.write(text)
+    return path
+
+  def read_lines(self, source):
+    with source.reader() as reader:
+      return list(reader)
+
+  def test_read_gzip_file(self):
+    lines = ['First', 'Second', 'Third']
+    source = fileio.TextFileSource(
+        file_path=self.create_gzip_file('\n'.join(lines)))
+    self.assertEqual(self.read_lines(source), lines)
+
+  def test_read_bzip2_file(self):
+    lines = ['First', 'Second', 'Third']
+    source = fileio.TextFileSource(
+        file_path=self.create_temp_file(bz2.compress('\n'.join(lines)),
+                                        suffix='.bz2'))
+    self.assertEqual(self.read_lines(source), lines)
+
+  def test_read_deflate_file(self):
+    lines = ['First', 'Second', 'Third']
+    source = fileio.TextFileSource(
+        file_path=self.create_temp_file(zlib.compress('\n'.join(lines)),
+                                        suffix='.deflate'))
+    self.assertEqual(self.read_lines(source), lines)
+
+  def test_read_concatenated_streams(self):
+    gzip_path = self.create_gzip_file('a\nb\n')
+    with open(gzip_path, 'rb') as f:
+      member = f.read()
+    source = fileio.TextFileSource(
+        file_path=self.create_temp_file(member + member, suffix='.gz'))
+    self.assertEqual(self.read_lines(source), ['a', 'b', 'a', 'b'])
+    source = fileio.TextFileSource(
+        file_path=self.create_temp_file(
+            bz2.compress('a\nb\n') + bz2.compress('c\n'), suffix='.bz2'))
+    self.assertEqual(self.read_lines(source), ['a', 'b', 'c'])
+
+  def test_read_large_gzip_file(self):
+    lines = ['line %d' % i for i in range(100000)]
+    source = fileio.TextFileSource(
+        file_path=self.create_gzip_file('\n'.join(lines)))
+    self.assertEqual(self.read_lines(source), lines)
+
+  def test_explicit_compression_type(self):
+    lines = ['First', 'Second', 'Third']
+    path = self.create_gzip_file('\n'.join(lines), suffix='.txt')
+    source = fileio.TextFileSource(
+        file_path=path, compression_type=fileio.CompressionTypes.GZIP)
+    self.assertEqual(self.read_lines(source), lines)
+    source = fileio.TextFileSource(
+        file_path=self.create_gzip_file('abc', suffix='.gz'),
+        compression_type=fileio.CompressionTypes.UNCOMPRESSED,
+        coder=coders.BytesCoder())
+    self.assertNotEqual(self.read_lines(source), ['abc'])
+
+  def test_invalid_compression_type(self):
+    with self.assertRaises(ValueError):
+      fileio.TextFileSource(file_path='/tmp/x', compression_type='LZO')
+
+  def test_detect_compression_type(self):
+    detect = fileio.CompressionTypes.detect_compression_type
+    self.assertEqual(detect('gs://b/f.gz'), fileio.CompressionTypes.GZIP)
+    self.assertEqual(detect('/tmp/f.BZ2'), fileio.CompressionTypes.BZIP2)
+    self.assertEqual(detect('/tmp/f.deflate'),
+                     fileio.CompressionTypes.DEFLATE)
+    self.assertEqual(detect('/tmp/f.txt'),
+                     fileio.CompressionTypes.UNCOMPRESSED)
+    self.assertEqual(detect('/tmp/f.txt', fileio.CompressionTypes.GZIP),
+                     fileio.CompressionTypes.GZIP)
+
+  def test_progress_in_compressed_bytes(self):
+    lines = ['line %d' % i for i in range(10)]
+    path = self.create_gzip_file('\n'.join(lines))
+    source = fileio.TextFileSource(file_path=path)
+    with source.reader() as reader:
+      self.assertEqual(0, reader.get_progress().position.byte_offset)
+      for _ in reader:
+        pass
+      self.assertEqual(os.path.getsize(path),
+                       reader.get_progress().position.byte_offset)
+
+  def test_dynamic_split_is_refused(self):
+    lines = ['aaaa', 'bbbb', 'cccc', 'dddd', 'eeee']
+    source = fileio.TextFileSource(
+        file_path=self.create_gzip_file('\n'.join(lines)))
+    with source.reader() as reader:
+      reader_iter = iter(reader)
+      next(reader_iter)
+      self.assertIsNone(reader.request_dynamic_split(
+          iobase.DynamicSplitRequest(
+              iobase.ReaderProgress(percent_complete=0.5))))
+      self.assertIsNone(reader.request_dynamic_split(
+          iobase.DynamicSplitRequest(iobase.ReaderProgress(
+              position=iobase.ReaderPosition(byte_offset=3)))))
+      self.assertEqual(list(reader_iter), lines[1:])
+
+  def test_start_offset_is_rejected(self):
+    source = fileio.TextFileSource(
+        file_path=self.create_gzip_file('a\nb'), start_offset=1)
+    with self.assertRaises(ValueError):
+      self.read_lines(source)
+
+  def test_read_multi_file_glob(self):
+    temp_dir = tempfile.mkdtemp()
+    for i, name in enumerate(['f1.gz', 'f2.gz']):
+      with gzip.GzipFile(os.path.join(temp_dir, name), 'wb') as f:
+        f.write('line%d\n' % i)
+    source = fileio.TextFileSource(
+        file_path=os.path.join(temp_dir, '*.gz'))
+    self.assertEqual(sorted(self.read_lines(source)), ['line0', 'line1'])
+
+
 class TestTextFileSink(unittest.TestCase):
 
   def create_temp_file(self):
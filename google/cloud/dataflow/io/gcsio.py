@@ -22,10 +22,12 @@ import errno
 import fnmatch
 import logging
 import multiprocessing
+from multiprocessing.pool import ThreadPool
 import os
 import re
 import StringIO
 import threading
+import time
 
 from google.cloud.dataflow.internal import auth
 from google.cloud.dataflow.utils import retry
@@ -46,6 +48,13 @@ except ImportError:
 
 DEFAULT_READ_BUFFER_SIZE = 1024 * 1024
 
+# Number of seconds for which the result of expanding a glob pattern is reused
+# by later glob(use_cache=True) calls for the same pattern within the process.
+GLOB_CACHE_TTL_SECS = 60
+
+# Maximum number of threads listing the partitions of a glob pattern.
+MAX_GLOB_LISTING_THREADS = 16
+
 
 def parse_gcs_path(gcs_path):
   """Return the bucket and object names of the given gs:// path."""
@@ -55,10 +64,76 @@ def parse_gcs_path(gcs_path):
   return match.group(1), match.group(2)
 
 
+class _GlobCache(object):
+  """A thread-safe cache of glob results whose entries expire after a TTL."""
+
+  def __init__(self, ttl_secs):
+    self.ttl_secs = ttl_secs
+    self._entries = {}
+    self._lock = threading.Lock()
+
+  def get(self, pattern):
+    with self._lock:
+      entry = self._entries.get(pattern)
+      if entry is None:
+        return None
+      expiration_time, results = entry
+      if time.time() >= expiration_time:
+        del self._entries[pattern]
+        return None
+      return results
+
+  def put(self, pattern, results):
+    # Empty results are not cached: the objects are likely about to be
+    # written.
+    if not results:
+      return
+    with self._lock:
+      self._entries[pattern] = (time.time() + self.ttl_secs, results)
+
+  def invalidate_bucket(self, bucket):
+    """Drops the cached results of all patterns in the given bucket."""
+    bucket_prefix = 'gs://%s/' % bucket
+    with self._lock:
+      for pattern in self._entries.keys():
+        if pattern.startswith(bucket_prefix):
+          del self._entries[pattern]
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+
+# Glob results shared by all GcsIO instances of the process.
+_glob_cache = _GlobCache(GLOB_CACHE_TTL_SECS)
+
+
+def clear_glob_cache():
+  """Drops all cached glob results."""
+  _glob_cache.clear()
+
+
+def invalidate_glob_cache(path):
+  """Drops the cached glob results that may include the given GCS path.
+
+  To be called after objects are written other than through GcsIO, e.g. with
+  gsutil.
+  """
+  bucket, _ = parse_gcs_path(path)
+  _glob_cache.invalidate_bucket(bucket)
+
+
+# The GcsIO instance of each thread, see GcsIO.__new__.
+_local_state = threading.local()
+
+
 class GcsIO(object):
   """Google Cloud Storage I/O client."""
   _instance = None
 
+  # Whether this is the instance of a thread, using a client of its own.
+  _per_thread = False
+
   def __new__(cls, storage_client=None):
     if storage_client:
       return super(GcsIO, cls).__new__(cls, storage_client)
@@ -67,14 +142,14 @@ class GcsIO(object):
       # creating more than one storage client for each thread, since each
       # initialization requires the relatively expensive step of initializing
       # credentaials.
-      local_state = threading.local()
-      if getattr(local_state, 'gcsio_instance', None) is None:
+      if getattr(_local_state, 'gcsio_instance', None) is None:
         credentials = auth.get_service_credentials()
         storage_client = storage.StorageV1(credentials=credentials)
-        local_state.gcsio_instance = (
+        _local_state.gcsio_instance = (
             super(GcsIO, cls).__new__(cls, storage_client))
-        local_state.gcsio_instance.client = storage_client
-      return local_state.gcsio_instance
+        _local_state.gcsio_instance.client = storage_client
+        _local_state.gcsio_instance._per_thread = True  # pylint: disable=protected-access
+      return _local_state.gcsio_instance
 
   def __init__(self, storage_client=None):
     # We must do this check on storage_client because the client attribute may
@@ -108,34 +183,142 @@ class GcsIO(object):
     else:
       raise ValueError('Invalid file open mode: %s.' % mode)
 
-  @retry.with_exponential_backoff()  # Using retry defaults from utils/retry.py
-  def glob(self, pattern):
+  def _thread_instance(self):
+    """Returns the GcsIO instance to use from the current thread.
+
+    Storage clients are not thread-safe, so other threads use their own
+    per-thread instance. Instances created with an explicit storage client
+    (e.g. in tests) are used as is.
+    """
+    return GcsIO() if self._per_thread else self
+
+  def glob(self, pattern, return_sizes=False, use_cache=False):
     """Return the GCS path names matching a given path name pattern.
 
     Path name patterns are those recognized by fnmatch.fnmatch().  The path
     can contain glob characters (*, ?, and [...] sets).
 
+    If use_cache is True, non-empty results are cached for
+    GLOB_CACHE_TTL_SECS seconds and shared by all GcsIO instances of the
+    process. Writing an object through GcsIO or calling invalidate_glob_cache()
+    drops the cached results for its bucket. The cache is meant for sources
+    expanding the same pattern repeatedly (e.g. when splitting) and should not
+    be used to check for the output of writes done otherwise.
+
+    If the part of the pattern after its literal prefix spans several
+    "directories", the objects under each directory are listed concurrently.
+
     Args:
       pattern: GCS file path pattern in the form gs://<bucket>/<name_pattern>.
+      return_sizes: If True, return (path, size) tuples instead of paths, so
+        that callers do not need to request the size of each object.
+      use_cache: If True, reuse and cache the results of recent calls.
 
     Returns:
-      list of GCS file paths matching the given pattern.
+      list of GCS file paths matching the given pattern, or list of
+      (path, size in bytes) tuples if return_sizes is True.
     """
+    results = _glob_cache.get(pattern) if use_cache else None
+    if results is None:
+      results = self._glob_uncached(pattern)
+      if use_cache:
+        _glob_cache.put(pattern, results)
+    if return_sizes:
+      return list(results)
+    else:
+      return [path for path, _ in results]
+
+  def _glob_uncached(self, pattern):
     bucket, name_pattern = parse_gcs_path(pattern)
     # Get the prefix with which we can list objects in the given bucket.
     prefix = re.match('^[^[*?]*', name_pattern).group(0)
-    request = storage.StorageObjectsListRequest(bucket=bucket, prefix=prefix)
-    object_paths = []
+    if '/' in name_pattern[len(prefix):]:
+      # Partition the listing by the "directories" right under the prefix.
+      # Every object under the prefix is either returned directly by this
+      # listing or lives under one of the returned sub-prefixes.
+      items, sub_prefixes = self._list_objects(bucket, prefix, delimiter='/')
+      if len(sub_prefixes) > 1:
+        pool = ThreadPool(min(len(sub_prefixes), MAX_GLOB_LISTING_THREADS))
+        try:
+          # Each pool thread lists with its own storage client.
+          for sub_items, _ in pool.imap(
+              lambda sub_prefix: self._thread_instance()._list_objects(  # pylint: disable=protected-access
+                  bucket, sub_prefix),
+              sub_prefixes):
+            items.extend(sub_items)
+        finally:
+          pool.terminate()
+      else:
+        for sub_prefix in sub_prefixes:
+          items.extend(self._list_objects(bucket, sub_prefix)[0])
+    else:
+      items, _ = self._list_objects(bucket, prefix)
+    return [('gs://%s/%s' % (bucket, name), size)
+            for name, size in sorted(items)
+            if fnmatch.fnmatch(name, name_pattern)]
+
+  @retry.with_exponential_backoff()  # Using retry defaults from utils/retry.py
+  def _list_objects(self, bucket, prefix, delimiter=None):
+    """Lists all objects with a given prefix.
+
+    Args:
+      bucket: name of the bucket to list.
+      prefix: only objects whose names start with this prefix are listed.
+      delimiter: if specified, objects whose names contain the delimiter after
+        the prefix are not listed. The distinct prefixes of their names up to
+        and including the delimiter are returned instead.
+
+    Returns:
+      a tuple of a list of (name, size) tuples of the objects listed and a
+      list of sub-prefixes.
+    """
+    request = storage.StorageObjectsListRequest(
+        bucket=bucket, prefix=prefix, delimiter=delimiter)
+    items = []
+    sub_prefixes = []
     while True:
       response = self.client.objects.List(request)
       for item in response.items:
-        if fnmatch.fnmatch(item.name, name_pattern):
-          object_paths.append('gs://%s/%s' % (item.bucket, item.name))
+        items.append((item.name, item.size))
+      sub_prefixes.extend(response.prefixes)
       if response.nextPageToken:
         request.pageToken = response.nextPageToken
       else:
         break
-    return object_paths
+    return items, sub_prefixes
+
+  @retry.with_exponential_backoff()  # Using retry defaults from utils/retry.py
+  def delete(self, path):
+    """Deletes a single GCS object.
+
+    Args:
+      path: GCS file path in the form gs://<bucket>/<name>.
+    """
+    bucket, object_path = parse_gcs_path(path)
+    request = storage.StorageObjectsDeleteRequest(bucket=bucket,
+                                                  object=object_path)
+    try:
+      self.client.objects.Delete(request)
+    except HttpError as http_error:
+      # The object may have been deleted by an earlier attempt.
+      if http_error.status_code != 404:
+        raise
+    _glob_cache.invalidate_bucket(bucket)
+
+  @retry.with_exponential_backoff()  # Using retry defaults from utils/retry.py
+  def size(self, path):
+    """Returns the size of a single GCS object.
+
+    Args:
+      path: GCS file path in the form gs://<bucket>/<name>.
+
+    Returns:
+      size of the GCS object in bytes.
+    """
+    bucket, object_path = parse_gcs_path(path)
+    request = storage.StorageObjectsGetRequest(bucket=bucket,
+                                               object=object_path)
+    return self.client.objects.Get(request).size
 
 
 class GcsBufferedReader(object):
@@ -485,6 +668,8 @@ class GcsBufferedWriter(object):
     """Close the current GCS file."""
     self.conn.close()
     self.upload_thread.join()
+    # Globs expanded before this write may be missing the new object.
+    _glob_cache.invalidate_bucket(self.bucket)
 
   def __enter__(self):
     return self
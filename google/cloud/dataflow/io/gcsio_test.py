@@ -54,6 +54,7 @@ class FakeGcsObjects(object):
   def __init__(self):
     self.files = {}
     self.list_page_tokens = {}
+    self.list_requests = []
 
   def add_file(self, f):
     self.files[(f.bucket, f.object)] = f
@@ -95,12 +96,22 @@ class FakeGcsObjects(object):
 
     self.add_file(f)
 
+  def Delete(self, delete_request):  # pylint: disable=invalid-name
+    self.files.pop((delete_request.bucket, delete_request.object), None)
+
   def List(self, list_request):  # pylint: disable=invalid-name
     bucket = list_request.bucket
     prefix = list_request.prefix or ''
+    delimiter = list_request.delimiter
+    self.list_requests.append((prefix, delimiter))
     matching_files = []
+    sub_prefixes = set()
     for file_bucket, file_name in sorted(iter(self.files)):
       if bucket == file_bucket and file_name.startswith(prefix):
+        if delimiter and delimiter in file_name[len(prefix):]:
+          end = file_name.index(delimiter, len(prefix)) + len(delimiter)
+          sub_prefixes.add(file_name[:end])
+          continue
         file_object = self.files[(file_bucket, file_name)].get_metadata()
         matching_files.append(file_object)
 
@@ -116,6 +127,8 @@ class FakeGcsObjects(object):
 
     result = storage.Objects(
         items=matching_files[range_start:range_start + items_per_page])
+    if range_start == 0:
+      result.prefixes = sorted(sub_prefixes)
     if range_start + items_per_page < len(matching_files):
       next_range_start = range_start + items_per_page
       next_page_token = '_page_token_%s_%s_%d' % (bucket, prefix,
@@ -153,6 +166,23 @@ class TestGCSIO(unittest.TestCase):
   def setUp(self):
     self.client = FakeGcsClient()
     self.gcs = gcsio.GcsIO(self.client)
+    gcsio.clear_glob_cache()
+
+  def test_size(self):
+    file_name = 'gs://gcsio-test/dummy_file'
+    file_size = 1234
+    self._insert_random_file(self.client, file_name, file_size)
+    self.assertEqual(1234, self.gcs.size(file_name))
+
+  def test_delete(self):
+    file_name = 'gs://gcsio-test/delete_me'
+    self._insert_random_file(self.client, file_name, 10)
+    self.assertEqual([file_name],
+                     self.gcs.glob('gs://gcsio-test/delete_*', use_cache=True))
+    self.gcs.delete(file_name)
+    self.assertIsNone(self.client.objects.get_file('gcsio-test', 'delete_me'))
+    self.assertEqual([], self.gcs.glob('gs://gcsio-test/delete_*',
+                                       use_cache=True))
 
   def test_full_file_read(self):
     file_name = 'gs://gcsio-test/full_file'
@@ -342,6 +372,98 @@ class TestGCSIO(unittest.TestCase):
       self.assertEqual(set(self.gcs.glob(file_pattern)),
                        set(expected_file_names))
 
+  def test_glob_with_sizes(self):
+    self._insert_random_file(self.client, 'gs://gcsio-test/a/x', 3)
+    self._insert_random_file(self.client, 'gs://gcsio-test/a/y', 5)
+    self._insert_random_file(self.client, 'gs://gcsio-test/b/x', 7)
+    self.assertEqual(
+        [('gs://gcsio-test/a/x', 3), ('gs://gcsio-test/b/x', 7)],
+        self.gcs.glob('gs://gcsio-test/*/x', return_sizes=True))
+
+  def test_glob_lists_partitions(self):
+    for day in range(1, 21):
+      for part in range(3):
+        self._insert_random_file(
+            self.client,
+            'gs://gcsio-test/logs/2016-%02d/part-%d' % (day, part), 1)
+      self._insert_random_file(
+          self.client, 'gs://gcsio-test/logs/2016-%02d/other' % day, 1)
+    self._insert_random_file(self.client, 'gs://gcsio-test/logs/2016-x', 1)
+    self._insert_random_file(self.client, 'gs://gcsio-test/logs/2015/part', 1)
+    expected = ['gs://gcsio-test/logs/2016-%02d/part-%d' % (day, part)
+                for day in range(1, 21) for part in range(3)]
+    self.assertEqual(expected,
+                     self.gcs.glob('gs://gcsio-test/logs/2016-*/part-*'))
+    listed_prefixes = [
+        prefix for prefix, _ in self.client.objects.list_requests]
+    self.assertIn('logs/2016-01/', listed_prefixes)
+    self.assertIn('logs/2016-20/', listed_prefixes)
+    self.assertNotIn('logs/2015/', listed_prefixes)
+
+  def test_glob_cache(self):
+    self._insert_random_file(self.client, 'gs://gcsio-test/c/x', 1)
+    self.assertEqual(['gs://gcsio-test/c/x'],
+                     self.gcs.glob('gs://gcsio-test/c/*', use_cache=True))
+    num_requests = len(self.client.objects.list_requests)
+    self._insert_random_file(self.client, 'gs://gcsio-test/c/y', 1)
+    # The cached result is reused, also by other GcsIO instances.
+    self.assertEqual(['gs://gcsio-test/c/x'],
+                     gcsio.GcsIO(self.client).glob('gs://gcsio-test/c/*',
+                                                   use_cache=True))
+    self.assertEqual(num_requests, len(self.client.objects.list_requests))
+    # Without use_cache the objects are listed.
+    self.assertEqual(['gs://gcsio-test/c/x', 'gs://gcsio-test/c/y'],
+                     self.gcs.glob('gs://gcsio-test/c/*'))
+    # Writing to the bucket invalidates the cached result.
+    with self.gcs.open('gs://gcsio-test/c/z', 'w') as f:
+      f.write('z')
+    self.assertEqual(
+        ['gs://gcsio-test/c/x', 'gs://gcsio-test/c/y', 'gs://gcsio-test/c/z'],
+        self.gcs.glob('gs://gcsio-test/c/*', use_cache=True))
+
+  def test_glob_cache_invalidated(self):
+    self._insert_random_file(self.client, 'gs://gcsio-test/e/x', 1)
+    self.gcs.glob('gs://gcsio-test/e/*', use_cache=True)
+    self._insert_random_file(self.client, 'gs://gcsio-test/e/y', 1)
+    gcsio.invalidate_glob_cache('gs://gcsio-test/e/y')
+    self.assertEqual(['gs://gcsio-test/e/x', 'gs://gcsio-test/e/y'],
+                     self.gcs.glob('gs://gcsio-test/e/*', use_cache=True))
+
+  def test_glob_cache_skips_empty_results(self):
+    self.assertEqual([], self.gcs.glob('gs://gcsio-test/f/*', use_cache=True))
+    self._insert_random_file(self.client, 'gs://gcsio-test/f/x', 1)
+    self.assertEqual(['gs://gcsio-test/f/x'],
+                     self.gcs.glob('gs://gcsio-test/f/*', use_cache=True))
+
+  def test_one_client_per_thread(self):
+    original_credentials = gcsio.auth.get_service_credentials
+    original_storage_client = gcsio.storage.StorageV1
+    gcsio.auth.get_service_credentials = lambda: None
+    gcsio.storage.StorageV1 = lambda credentials: FakeGcsClient()
+    try:
+      clients = []
+
+      def get_clients():
+        clients.append((gcsio.GcsIO().client, gcsio.GcsIO().client))
+
+      threads = [threading.Thread(target=get_clients) for _ in range(2)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+    finally:
+      gcsio.auth.get_service_credentials = original_credentials
+      gcsio.storage.StorageV1 = original_storage_client
+    # A thread reuses its client, but never shares it with other threads.
+    self.assertIs(clients[0][0], clients[0][1])
+    self.assertIs(clients[1][0], clients[1][1])
+    self.assertIsNot(clients[0][0], clients[1][0])
+
+  def test_glob_cache_expires(self):
+    cache = gcsio._GlobCache(ttl_secs=0)
+    cache.put('gs://gcsio-test/d/*', [('gs://gcsio-test/d/x', 1)])
+    self.assertIsNone(cache.get('gs://gcsio-test/d/*'))
+
 
 class TestPipeStream(unittest.TestCase):
 
@@ -58,6 +58,40 @@ class Source(object):
     """Returns a SourceReader instance associated with this source."""
     raise NotImplementedError
 
+  def estimate_size(self):
+    """Returns an estimate of the size of the source in bytes.
+
+    Returns:
+      An estimate of the total size of the data this source will read, or None
+      if the size cannot be estimated.
+    """
+    return None
+
+  def split(self, desired_bundle_size):
+    """Splits the source into a list of bundles.
+
+    The bundles, if read one after another, must return the same records as
+    reading the whole source. Sources that do not support splitting return a
+    list containing only themselves, which is the default.
+
+    Args:
+      desired_bundle_size: the desired size (in bytes) of each bundle. Bundles
+        may end up smaller or larger than this size.
+
+    Returns:
+      A non-empty list of 'Source' objects.
+    """
+    return [self]
+
+  def finish_split(self):
+    """Cleans up after all the bundles returned by split() have been read.
+
+    Runners reading all the bundles of a split source call this method once
+    they are done with them, e.g. so that sources can delete the temporary
+    files their bundles read. Does nothing by default.
+    """
+    pass
+
   def __repr__(self):
     return '<{name} {vals}>'.format(
         name=self.__class__.__name__,
@@ -287,6 +321,10 @@ class NativeSinkWriter(object):
     """Writes a record to the sink associated with this writer."""
     raise NotImplementedError
 
+  def itercounters(self):
+    """Returns an iterator over counters specific to this writer."""
+    return iter(())
+
 
 class RangeTracker(object):
   """A thread-safe helper object for implementing dynamic work rebalancing.
@@ -0,0 +1,151 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Opening the readers of a sequence of sources ahead of time.
+
+Readers that read a sequence of sources one after another (e.g. all the files
+matching a glob) would otherwise pay the latency of opening each source (e.g.
+GCS metadata lookups and the first read request) serially. The helpers here
+open the next few sources on background threads while the current one is being
+consumed.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import itertools
+import logging
+import sys
+import threading
+
+
+# Number of sources opened ahead of the source currently being read.
+DEFAULT_NUM_SOURCES_TO_PREFETCH = 2
+
+
+class PrefetchedReader(object):
+  """A reader opened, possibly in the background, before it is needed.
+
+  Opening consists of entering the reader and fetching its first record, which
+  for block-based readers also buffers the first block of data. Only a single
+  record is fetched ahead so that the progress reported by the reader is
+  accurate as soon as the record is returned.
+
+  Use as a context manager: entering waits until the reader is open (raising
+  any error that happened while opening it) and exiting closes the reader.
+  Iterating returns all the records of the reader.
+  """
+
+  def __init__(self, source, background=True):
+    self.source = source
+    self.reader = None
+    self.entered = False
+    self._records = None
+    self._first_records = []
+    self._exc_info = None
+    self._thread = None
+    if background:
+      self._thread = threading.Thread(target=self._open)
+      self._thread.daemon = True
+      self._thread.start()
+
+  def _open(self):
+    try:
+      reader = self.source.reader()
+      self.reader = reader.__enter__()
+      self._records = iter(self.reader)
+      for record in self._records:
+        self._first_records.append(record)
+        break
+    except:  # pylint: disable=bare-except
+      self._exc_info = sys.exc_info()
+
+  def wait(self):
+    """Waits until the reader is open, opening it now if not in background."""
+    if self._thread is not None:
+      self._thread.join()
+    elif self._records is None and self._exc_info is None:
+      self._open()
+
+  def __enter__(self):
+    self.entered = True
+    self.wait()
+    if self._exc_info is not None:
+      exc_info, self._exc_info = self._exc_info, None
+      if self.reader is not None:
+        self.reader.__exit__(*exc_info)
+      raise exc_info[0], exc_info[1], exc_info[2]
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    return self.reader.__exit__(exception_type, exception_value, traceback)
+
+  def __iter__(self):
+    return itertools.chain(self._first_records, self._records)
+
+  def discard(self):
+    """Closes a reader that will not be read, ignoring any errors."""
+    self.wait()
+    if self.reader is not None:
+      try:
+        self.reader.__exit__(None, None, None)
+      except Exception:  # pylint: disable=broad-except
+        logging.warning('Error while closing a prefetched reader for %r',
+                        self.source, exc_info=True)
+
+
+def prefetched_readers(sources,
+                       num_sources_to_prefetch=DEFAULT_NUM_SOURCES_TO_PREFETCH):
+  """Yields a PrefetchedReader for each of the given sources, in order.
+
+  While the reader of a source is being consumed, the readers of up to
+  num_sources_to_prefetch following sources are opened on background threads.
+
+  Args:
+    sources: an iterable of iobase.Source objects.
+    num_sources_to_prefetch: the number of sources to open ahead of time. If
+      zero, each source is opened when its reader is entered.
+
+  Yields:
+    PrefetchedReader objects that must be used as context managers.
+  """
+  sources = iter(sources)
+  pending = collections.deque()
+  background = num_sources_to_prefetch > 0
+
+  def fill(size):
+    while len(pending) < size:
+      try:
+        source = next(sources)
+      except StopIteration:
+        return
+      pending.append(PrefetchedReader(source, background=background))
+
+  current = None
+  try:
+    while True:
+      fill(1)
+      if not pending:
+        return
+      current = pending.popleft()
+      fill(num_sources_to_prefetch)
+      yield current
+  finally:
+    # Close readers opened ahead of time when iteration is abandoned, e.g. on
+    # an error or after a dynamic split.
+    if current is not None and not current.entered:
+      pending.appendleft(current)
+    for prefetched in pending:
+      if not prefetched.entered:
+        prefetched.discard()
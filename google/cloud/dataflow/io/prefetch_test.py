@@ -0,0 +1,112 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for opening readers ahead of time."""
+
+import logging
+import threading
+import unittest
+
+from google.cloud.dataflow.io import iobase
+from google.cloud.dataflow.io import prefetch
+
+
+class RecordingSource(iobase.Source):
+
+  def __init__(self, name, elements, events, fail_at_open=False):
+    self.name = name
+    self.elements = elements
+    self.events = events
+    self.fail_at_open = fail_at_open
+    self.opened = threading.Event()
+
+  def reader(self):
+    return RecordingReader(self)
+
+
+class RecordingReader(iobase.SourceReader):
+
+  def __init__(self, source):
+    self.source = source
+
+  def __enter__(self):
+    if self.source.fail_at_open:
+      raise ValueError('Cannot open %s' % self.source.name)
+    self.source.events.append(('open', self.source.name))
+    self.source.opened.set()
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    self.source.events.append(('close', self.source.name))
+
+  def __iter__(self):
+    for element in self.source.elements:
+      yield element
+
+
+class PrefetchTest(unittest.TestCase):
+
+  def read_all(self, sources, num_sources_to_prefetch=2):
+    records = []
+    for reader in prefetch.prefetched_readers(sources,
+                                              num_sources_to_prefetch):
+      with reader:
+        records.extend(reader)
+    return records
+
+  def test_reads_sources_in_order(self):
+    events = []
+    sources = [RecordingSource(str(i), range(i * 10, i * 10 + i), events)
+               for i in range(6)]
+    expected = [e for source in sources for e in source.elements]
+    self.assertEqual(expected, self.read_all(sources))
+    self.assertEqual(expected, self.read_all(sources, 0))
+    self.assertEqual([], self.read_all([]))
+
+  def test_opens_next_sources_ahead(self):
+    events = []
+    sources = [RecordingSource(str(i), [i], events) for i in range(4)]
+    readers = prefetch.prefetched_readers(sources, 2)
+    with next(readers) as first:
+      self.assertEqual([0], list(first))
+      self.assertTrue(sources[1].opened.wait(10))
+      self.assertTrue(sources[2].opened.wait(10))
+      self.assertFalse(sources[3].opened.is_set())
+    readers.close()
+    self.assertEqual(set(['0', '1', '2']),
+                     set(name for event, name in events if event == 'close'))
+
+  def test_no_prefetching(self):
+    events = []
+    sources = [RecordingSource(str(i), [i], events) for i in range(3)]
+    readers = prefetch.prefetched_readers(sources, 0)
+    with next(readers) as first:
+      self.assertEqual([0], list(first))
+    self.assertEqual([('open', '0'), ('close', '0')], events)
+
+  def test_open_error_raised_when_reached(self):
+    events = []
+    sources = [RecordingSource('0', [0, 1], events),
+               RecordingSource('1', [2], events, fail_at_open=True)]
+    records = []
+    with self.assertRaises(ValueError):
+      for reader in prefetch.prefetched_readers(sources):
+        with reader:
+          records.extend(reader)
+    self.assertEqual([0, 1], records)
+
+
+if __name__ == '__main__':
+  logging.getLogger().setLevel(logging.INFO)
+  unittest.main()
@@ -15,6 +15,7 @@
 """iobase.RangeTracker implementations provided with Dataflow SDK.
 """
 
+import binascii
 import logging
 import math
 import threading
@@ -22,6 +23,25 @@ import threading
 from google.cloud.dataflow.io import iobase
 
 
+# Maximum number of bytes of the shuffle positions used to interpolate between
+# them.
+MAX_INTERPOLATED_POSITION_BYTES = 64
+
+# Number of bits of precision of the fractions of a range of shuffle positions.
+_FRACTION_BITS = 53
+
+
+def _position_to_int(position, num_bytes):
+  """Returns the first num_bytes of a position, padded with zeros, as an int."""
+  position = position[:num_bytes]
+  return int(binascii.hexlify(position + '\x00' * (num_bytes - len(position))),
+             16)
+
+
+def _int_to_position(value, num_bytes):
+  return binascii.unhexlify('%0*x' % (2 * num_bytes, value))
+
+
 class OffsetRangeTracker(iobase.RangeTracker):
   """A 'RangeTracker' for non-negative positions of type 'long'."""
 
@@ -123,13 +143,14 @@ class OffsetRangeTracker(iobase.RangeTracker):
 
 
 class GroupedShuffleRangeTracker(iobase.RangeTracker):
-  """A 'RangeTracker' for positions used by'GroupedShuffleReader'.
+  """A 'RangeTracker' for positions used by the shuffle readers.
 
   These positions roughly correspond to hashes of keys. In case of hash
   collisions, multiple groups can have the same position. In that case, the
   first group at a particular position is considered a split point (because
   it is the first to be returned when reading a position range starting at this
-  position), others are not.
+  position), others are not. The 'UngroupedShuffleReader' tracks the values of
+  a key the same way, as the values of a group.
   """
 
   def __init__(self, decoded_start_pos, decoded_stop_pos):
@@ -224,10 +245,57 @@ class GroupedShuffleRangeTracker(iobase.RangeTracker):
       self._decoded_stop_pos = decoded_split_position
       return True
 
+  def _interpolation_range(self, position=''):
+    """Returns the range of positions as ints, and their number of bytes.
+
+    Positions are interpreted as big-endian numbers of the same number of bytes,
+    one more than the longest of the positions compared (up to a maximum), so
+    that there is room between two positions differing by their last byte. An
+    unspecified start is the smallest number and an unspecified stop is past
+    the largest one.
+    """
+    num_bytes = min(1 + max(len(self.start_position or ''),
+                            len(self.stop_position or ''), len(position)),
+                    MAX_INTERPOLATED_POSITION_BYTES)
+    start = _position_to_int(self.start_position or '', num_bytes)
+    if self.stop_position:
+      stop = _position_to_int(self.stop_position, num_bytes)
+    else:
+      stop = 1 << (8 * num_bytes)
+    return start, stop, num_bytes
+
   @property
   def fraction_consumed(self):
-    # GroupingShuffle sources have special support on the service and the
-    # service will estimate progress from positions for us.
-    raise RuntimeError('GroupedShuffleRangeTracker does not measure fraction'
-                       ' consumed due to positions being opaque strings'
-                       ' that are interpretted by the service')
+    """Returns the approximate fraction of the range before the last group.
+
+    Shuffle positions are opaque byte strings, so the fraction is interpolated
+    linearly between the start and stop positions. It is only accurate if the
+    groups are distributed uniformly over the range of positions, which is
+    roughly the case since positions are derived from hashes of the keys.
+    """
+    with self.lock:
+      if self.last_group_start is None:
+        return 0.0
+      start, stop, num_bytes = self._interpolation_range(self.last_group_start)
+      if stop <= start:
+        return 0.0
+      consumed = _position_to_int(self.last_group_start, num_bytes) - start
+      fraction = float((consumed << _FRACTION_BITS) // (stop - start)) / (
+          1 << _FRACTION_BITS)
+      return max(0.0, min(1.0, fraction))
+
+  def get_position_for_fraction_consumed(self, fraction):
+    """Returns the position at a fraction of the range, interpolated linearly.
+
+    Args:
+      fraction: a fraction of the range, in [0, 1).
+
+    Returns:
+      A decoded shuffle position.
+    """
+    with self.lock:
+      start, stop, num_bytes = self._interpolation_range(
+          self.last_group_start or '')
+    scaled_fraction = int(fraction * (1 << _FRACTION_BITS))
+    position = start + (((stop - start) * scaled_fraction) >> _FRACTION_BITS)
+    return _int_to_position(position, num_bytes)
@@ -311,6 +311,54 @@ class GroupedShuffleRangeTrackerTest(unittest.TestCase):
     self.assertFalse(tracker.try_return_record_at(
         True, self.bytes_to_position([3, 2, 1])))
 
+  def test_fraction_consumed_finite_range(self):
+    tracker = range_trackers.GroupedShuffleRangeTracker(
+        self.bytes_to_position([10, 0]), self.bytes_to_position([20, 0]))
+    self.assertEqual(0, tracker.fraction_consumed)
+    tracker.try_return_record_at(True, self.bytes_to_position([10, 0]))
+    self.assertEqual(0, tracker.fraction_consumed)
+    tracker.try_return_record_at(True, self.bytes_to_position([12, 128]))
+    self.assertEqual(0.25, tracker.fraction_consumed)
+    tracker.try_return_record_at(True, self.bytes_to_position([15]))
+    self.assertEqual(0.5, tracker.fraction_consumed)
+    tracker.try_return_record_at(True, self.bytes_to_position([19, 255, 255]))
+    self.assertAlmostEqual(1, tracker.fraction_consumed, places=5)
+
+  def test_fraction_consumed_infinite_range(self):
+    tracker = range_trackers.GroupedShuffleRangeTracker('', '')
+    tracker.try_return_record_at(True, self.bytes_to_position([64]))
+    self.assertEqual(0.25, tracker.fraction_consumed)
+    tracker.try_return_record_at(True, self.bytes_to_position([192, 0, 1]))
+    self.assertAlmostEqual(0.75, tracker.fraction_consumed, places=6)
+
+  def test_fraction_consumed_long_common_prefix(self):
+    prefix = [7] * 20
+    tracker = range_trackers.GroupedShuffleRangeTracker(
+        self.bytes_to_position(prefix + [0]),
+        self.bytes_to_position(prefix + [100]))
+    tracker.try_return_record_at(True, self.bytes_to_position(prefix + [10]))
+    self.assertAlmostEqual(0.1, tracker.fraction_consumed)
+
+  def test_get_position_for_fraction_consumed(self):
+    tracker = range_trackers.GroupedShuffleRangeTracker(
+        self.bytes_to_position([10]), self.bytes_to_position([20]))
+    self.assertEqual(self.bytes_to_position([15, 0]),
+                     tracker.get_position_for_fraction_consumed(0.5))
+    self.assertEqual(self.bytes_to_position([12, 128]),
+                     tracker.get_position_for_fraction_consumed(0.25))
+    tracker = range_trackers.GroupedShuffleRangeTracker('', '')
+    self.assertEqual(self.bytes_to_position([192]),
+                     tracker.get_position_for_fraction_consumed(0.75))
+
+  def test_split_at_fraction_consumed(self):
+    tracker = range_trackers.GroupedShuffleRangeTracker(
+        '', self.bytes_to_position([100]))
+    tracker.try_return_record_at(True, self.bytes_to_position([20, 5]))
+    position = tracker.get_position_for_fraction_consumed(0.5)
+    self.assertTrue(tracker.try_split_at_position(position))
+    self.assertEqual(position, tracker.stop_position)
+    self.assertAlmostEqual(0.4, tracker.fraction_consumed, places=2)
+
 
 if __name__ == '__main__':
   logging.getLogger().setLevel(logging.INFO)
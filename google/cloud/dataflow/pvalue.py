@@ -23,6 +23,8 @@ produced when the pipeline gets executed.
 
 from __future__ import absolute_import
 
+import warnings
+
 from google.cloud.dataflow import error
 from google.cloud.dataflow import typehints
 
@@ -340,29 +342,68 @@ def AsList(pcoll, label='AsList'):  # pylint: disable=invalid-name
   return AsSingleton(pcoll | combiners.ToList(label))
 
 
-def AsDict(pcoll, label='AsDict'):  # pylint: disable=invalid-name
-  """Convenience function packaging an entire PCollection as a side input dict.
+class AsDict(AsSideInput):
+  """Marker specifying a PCollection to be used as a side input dict.
 
-  Intended for use in side-argument specification---the same places where
-  AsSingleton and AsIter are used. Unlike those wrapper classes, AsDict (as
-  implemented) is a function that schedules a Combiner to condense pcoll into a
-  single dict, then wraps the resulting one-element PCollection in AsSingleton.
+  The PCollection should contain key-value pairs (i.e. 2-tuples) with unique
+  keys. If a key occurs several times, one of its values is used.
+
+  The PCollection is not combined into a single dict: the Dataflow workers
+  index its pairs by key in a local file and look up the values lazily, so
+  large dicts need not fit in memory.
+
+  Note that this is a breaking change: AsDict used to give the DoFns a dict.
+  On the workers the side input is now a read-only collections.Mapping, which
+  supports the lookup and iteration methods of dict, but not its mutation
+  methods, and isinstance(side_input, dict) is False. Its copy() method
+  returns a dict of all the entries (which must then fit in memory) that can
+  be modified. The DirectPipelineRunner still gives a dict.
 
   Args:
-    pcoll: Input pcollection. All elements should be key-value pairs (i.e.
-       2-tuples) with unique keys.
-    label: Label to be specified if several AsDict's are used in the pipeline at
-      same depth level.
+    pvalue: Input pcollection.
+    label: Deprecated and ignored (with a warning). It used to be required to
+      distinguish several AsDict's applied to the same PCollection.
+  """
 
-  Returns:
-    An AsDict-wrapper around a PCollection whose one element is a dict with
-      entries for uniquely-keyed pairs in pcoll.
+  def __init__(self, pvalue, label=None):
+    if label is not None:
+      warnings.warn('The label argument of AsDict is deprecated and ignored.',
+                    DeprecationWarning)
+    self.pvalue = pvalue
+
+  def __repr__(self):
+    return 'AsDict(%s)' % self.pvalue
+
+  @property
+  def element_type(self):
+    return typehints.Dict[typehints.Any, typehints.Any]
+
+
+class AsMultimap(AsSideInput):
+  """Marker specifying a PCollection to be used as a side input multimap.
+
+  The PCollection should contain key-value pairs (i.e. 2-tuples). The side
+  input is a read-only mapping from each key to the list of all the values
+  paired with it, looked up lazily like the values of AsDict. Each lookup
+  returns a new list.
   """
-  # Local import is required due to dependency loop; even though the
-  # implementation of this function requires concepts defined in modules that
-  # depend on pvalue, it lives in this module to reduce user workload.
-  from google.cloud.dataflow.transforms import combiners  # pylint: disable=g-import-not-at-top
-  return AsSingleton(pcoll | combiners.ToDict(label))
+
+  def __init__(self, pvalue):
+    self.pvalue = pvalue
+
+  def __repr__(self):
+    return 'AsMultimap(%s)' % self.pvalue
+
+  @property
+  def element_type(self):
+    return typehints.Dict[typehints.Any, typehints.List[typehints.Any]]
+
+
+# Types of the dict and multimap side inputs of a ParDo, as recorded with their
+# tags for the worker (singleton and iterable side inputs are recorded as True
+# and False).
+DICT_SIDE_INPUT = 'dict'
+MULTIMAP_SIDE_INPUT = 'multimap'
 
 
 class EmptySideInput(object):
@@ -16,7 +16,11 @@
 
 import unittest
 
+import mock
+
+from google.cloud.dataflow import pvalue
 from google.cloud.dataflow.pipeline import Pipeline
+from google.cloud.dataflow.pvalue import AsDict
 from google.cloud.dataflow.pvalue import PValue
 from google.cloud.dataflow.transforms import PTransform
 
@@ -42,6 +46,13 @@ class PValueTest(unittest.TestCase):
                       pipeline=Pipeline('DirectPipelineRunner'))
     self.assertRaises(ValueError, PValue, transform=PTransform())
 
+  def test_as_dict_label_deprecated(self):
+    with mock.patch.object(pvalue.warnings, 'warn') as warn:
+      AsDict(None)
+      self.assertFalse(warn.called)
+      AsDict(None, label='label')
+    self.assertEqual(DeprecationWarning, warn.call_args[0][1])
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -25,13 +25,39 @@ from google.cloud.dataflow.transforms.window import WindowFn
 from google.cloud.dataflow.utils import counters
 
 
-class FakeLogger(object):
-  def PerThreadLoggingContext(self, *unused_args, **unused_kwargs):
-    return self
-  def __enter__(self):
-    pass
-  def __exit__(self, *unused_args):
-    pass
+def receive_function(counters, receivers):
+  """Returns a function passing a windowed value to a list of receivers.
+
+  The returned function counts each value once and calls the pre-bound
+  process() methods of the receivers directly, so that the dispatch is
+  resolved once rather than for every element.
+
+  Args:
+    counters: an object whose update() method counts each value.
+    receivers: a list of objects with a process() method.
+  """
+  update = counters.update
+  processes = [receiver.process for receiver in receivers]
+  if not processes:
+    return update
+  elif len(processes) == 1:
+    process = processes[0]
+
+    def receive(windowed_value):
+      update(windowed_value)
+      process(windowed_value)
+  else:
+
+    def receive(windowed_value):
+      update(windowed_value)
+      for process in processes:
+        process(windowed_value)
+  return receive
+
+
+# Results of a DoFn which are not plain values to be output in the window of
+# the input element.
+_SPECIAL_RESULT_TYPES = (SideOutputValue, WindowedValue, TimestampedValue)
 
 
 class DoFnRunner(object):
@@ -47,7 +73,6 @@ class DoFnRunner(object):
                context,
                tagged_receivers,
                tagged_counters,
-               logger=None,
                step_name=None):
     if not args and not kwargs:
       self.dofn = fn
@@ -69,10 +94,20 @@ class DoFnRunner(object):
     self.context = context
     self.tagged_receivers = tagged_receivers
     self.tagged_counters = tagged_counters
-    self.logger = logger or FakeLogger()
     self.step_name = step_name
+    # Functions dispatching the outputs of each tag, see receive_function().
+    self._tagged_receive = {}
+
+  def _receive_function(self, tag):
+    try:
+      return self._tagged_receive[tag]
+    except KeyError:
+      receive = self._tagged_receive[tag] = receive_function(
+          self.tagged_counters[tag], self.tagged_receivers[tag])
+      return receive
 
   def start(self):
+    self._main_receive = self._receive_function(None)
     self.context.set_element(None)
     self._process_outputs(None, self.dofn.start_bundle(self.context))
 
@@ -82,10 +117,8 @@ class DoFnRunner(object):
     self._process_outputs(None, self.dofn.finish_bundle(self.context))
 
   def process(self, element):
-    with self.logger.PerThreadLoggingContext(step_name=self.step_name):
-      assert isinstance(element, WindowedValue)
-      self.context.set_element(element)
-      self._process_outputs(element, self.dofn.process(self.context))
+    self.context.set_element(element)
+    self._process_outputs(element, self.dofn.process(self.context))
 
   def _process_outputs(self, element, results):
     """Dispatch the result of computation to the appropriate receivers.
@@ -95,7 +128,12 @@ class DoFnRunner(object):
     """
     if results is None:
       return
+    main_receive = self._main_receive
     for result in results:
+      if element is not None and not isinstance(result, _SPECIAL_RESULT_TYPES):
+        # The common case: a plain value output in the window of the input.
+        main_receive(WindowedValue(result, element.timestamp, element.windows))
+        continue
       tag = None
       if isinstance(result, SideOutputValue):
         tag = result.tag
@@ -126,10 +164,9 @@ class DoFnRunner(object):
       else:
         windowed_value = WindowedValue(
             result, element.timestamp, element.windows)
-      for receiver in self.tagged_receivers[tag]:
-        # TODO(robertwb): Should the counters be on the context?
-        self.tagged_counters[tag].update(windowed_value)
-        receiver.process(windowed_value)
+      # TODO(robertwb): Should the counters be on the context?
+      self._receive_function(tag)(windowed_value)
+
 
 class NoContext(WindowFn.AssignContext):
   """An uninspectable WindowFn.AssignContext."""
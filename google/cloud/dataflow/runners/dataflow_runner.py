@@ -27,8 +27,12 @@ import time
 from google.cloud.dataflow import coders
 from google.cloud.dataflow import pvalue
 from google.cloud.dataflow.internal import pickler
+from google.cloud.dataflow.pvalue import AsDict
+from google.cloud.dataflow.pvalue import AsMultimap
 from google.cloud.dataflow.pvalue import AsSideInput
 from google.cloud.dataflow.pvalue import AsSingleton
+from google.cloud.dataflow.pvalue import DICT_SIDE_INPUT
+from google.cloud.dataflow.pvalue import MULTIMAP_SIDE_INPUT
 from google.cloud.dataflow.runners.runner import PipelineResult
 from google.cloud.dataflow.runners.runner import PipelineRunner
 from google.cloud.dataflow.runners.runner import PipelineState
@@ -346,9 +350,16 @@ class DataflowPipelineRunner(PipelineRunner):
           PropertyNames.STEP_NAME: si_label,
           PropertyNames.OUTPUT_NAME: PropertyNames.OUTPUT}
       # The label for the side input step will appear as a 'tag' property for
-      # the side input source specification. Its type (singleton or iterator)
-      # will also be used to read the entire source or just first element.
-      si_tags_and_types.append((si_label, isinstance(side_pval, AsSingleton)))
+      # the side input source specification. Its type (singleton, iterator,
+      # dict or multimap) will also be used to read the entire source, just
+      # the first element, or index the elements by key.
+      if isinstance(side_pval, AsDict):
+        si_type = DICT_SIDE_INPUT
+      elif isinstance(side_pval, AsMultimap):
+        si_type = MULTIMAP_SIDE_INPUT
+      else:
+        si_type = isinstance(side_pval, AsSingleton)
+      si_tags_and_types.append((si_label, si_type))
 
     # Now create the step for the ParDo transform being handled.
     step = self._add_step(
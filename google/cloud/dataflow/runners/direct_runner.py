@@ -26,7 +26,9 @@ import itertools
 
 from google.cloud.dataflow import coders
 from google.cloud.dataflow import error
+from google.cloud.dataflow.pvalue import AsDict
 from google.cloud.dataflow.pvalue import AsIter
+from google.cloud.dataflow.pvalue import AsMultimap
 from google.cloud.dataflow.pvalue import AsSingleton
 from google.cloud.dataflow.pvalue import EmptySideInput
 from google.cloud.dataflow.runners.common import DoFnRunner
@@ -49,6 +51,10 @@ class DirectPipelineRunner(PipelineRunner):
   optimize for time or space.
   """
 
+  # Desired size in bytes of the bundles sources are split into before being
+  # read.
+  _desired_bundle_size = 64 * 1024 * 1024
+
   def __init__(self, cache=None):
     # Cache of values computed while the runner executes a pipeline.
     self._cache = cache if cache is not None else PValueCache()
@@ -101,6 +107,14 @@ class DirectPipelineRunner(PipelineRunner):
         # User wants the entire PCollection as side input. List permits
         # repeatable iteration.
         return [v.value for v in self._cache.get_pvalue(si.pvalue)]
+      if isinstance(si, AsDict):
+        return dict(v.value for v in self._cache.get_pvalue(si.pvalue))
+      if isinstance(si, AsMultimap):
+        multimap = collections.defaultdict(list)
+        for v in self._cache.get_pvalue(si.pvalue):
+          key, value = v.value
+          multimap[key].append(value)
+        return dict(multimap)
     side_inputs = [get_side_input_value(e) for e in transform_node.side_inputs]
 
     # TODO(robertwb): Do this type checking inside DoFnRunner to get it on
@@ -191,10 +205,19 @@ class DirectPipelineRunner(PipelineRunner):
     # TODO(chamikara) Implement a more generic way for passing PipelineOption
     # to sources when using DirectRunner.
     source = transform_node.transform.source
-    source.pipeline_options = transform_node.inputs[0].pipeline.options
-    with source.reader() as reader:
-      self._cache.cache_output(
-          transform_node, [GlobalWindows.WindowedValue(e) for e in reader])
+    options = transform_node.inputs[0].pipeline.options
+    source.pipeline_options = options
+    # Reading the source as a sequence of bundles exercises the same splitting
+    # logic the sources use when executed remotely.
+    values = []
+    try:
+      for bundle in source.split(self._desired_bundle_size):
+        bundle.pipeline_options = options
+        with bundle.reader() as reader:
+          values.extend(GlobalWindows.WindowedValue(e) for e in reader)
+    finally:
+      source.finish_split()
+    self._cache.cache_output(transform_node, values)
 
   @skip_if_cached
   def run__NativeWrite(self, transform_node):
@@ -450,10 +450,11 @@ class PTransformWithSideInputs(PTransform):
         any([isinstance(v, pvalue.PCollection) for v in kwargs.itervalues()])):
       raise error.SideInputError(
           'PCollection used directly as side input argument. Specify '
-          'AsIter(pcollection) or AsSingleton(pcollection) to indicate how the '
-          'PCollection is to be used.')
+          'AsIter(pcollection), AsSingleton(pcollection), AsDict(pcollection) '
+          'or AsMultimap(pcollection) to indicate how the PCollection is to be '
+          'used.')
     self.args, self.kwargs, self.side_inputs = util.remove_objects_from_args(
-        args, kwargs, (pvalue.AsSingleton, pvalue.AsIter))
+        args, kwargs, (pvalue.AsSideInput,))
     self.raw_side_inputs = args, kwargs
 
   def with_input_types(
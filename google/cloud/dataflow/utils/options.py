@@ -274,6 +274,26 @@ class DebugOptions(PipelineOptions):
                         help='Debug file to write the workflow specification.')
 
 
+class ProfilingOptions(PipelineOptions):
+
+  @classmethod
+  def _add_argparse_args(cls, parser):
+    parser.add_argument(
+        '--profile_fraction',
+        type=float,
+        default=0.0,
+        help=
+        ('Fraction of the work items to execute under cProfile, between 0 and '
+         '1. The stats of each profiled work item are written to '
+         '--profile_location and a summary is logged by the worker.'))
+    parser.add_argument(
+        '--profile_location',
+        default=None,
+        help=
+        ('GCS path for saving the profiles of work items. If not set, the '
+         'profiles are saved in a profiles directory of --temp_location.'))
+
+
 class SetupOptions(PipelineOptions):
 
   @classmethod
@@ -35,15 +35,17 @@ are not lost often.
 
 import BaseHTTPServer
 import datetime
+import json
 import logging
 import os
 import random
 import re
 import resource
-import sys
+import SocketServer
 import threading
 import time
 import traceback
+import urlparse
 
 from google.cloud.dataflow.internal import apiclient
 from google.cloud.dataflow.internal import auth
@@ -53,11 +55,23 @@ from google.cloud.dataflow.utils import retry
 from google.cloud.dataflow.worker import executor
 from google.cloud.dataflow.worker import logger
 from google.cloud.dataflow.worker import maptask
+from google.cloud.dataflow.worker import profiler
+from google.cloud.dataflow.worker import statuspages
 from google.cloud.dataflow.worker import workitem
 
 from apitools.base.py.exceptions import HttpError
 
 
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+  """An HTTP server handling each request in a separate thread.
+
+  A long request (e.g. a profile on /profilez) does not block the other pages.
+  """
+
+  daemon_threads = True
+
+
 class BatchWorker(object):
   """A worker class with all the knowledge to lease and execute work items."""
 
@@ -93,6 +107,16 @@ class BatchWorker(object):
     self.local_staging_directory = (properties['local_staging_directory']
                                     if self.running_in_gce else
                                     self.temp_gcs_directory)
+    # Pipeline options relevant to the worker are passed as a JSON object under
+    # the 'options' key of the SDK pipeline options. The worker harness passes
+    # the sdkPipelineOptions of the job environment (set by
+    # apiclient.Environment) as the JSON sdk_pipeline_options property.
+    pipeline_options = json.loads(
+        properties.get('sdk_pipeline_options') or '{}').get('options', {})
+    self.profile_fraction = float(pipeline_options.get('profile_fraction', 0))
+    self.profile_location = (
+        pipeline_options.get('profile_location') or
+        '%s/profiles' % self.temp_gcs_directory.rstrip('/'))
     # Initialize the logging machinery.
     logger.initialize(job_id=self.job_id,
                       worker_id=self.worker_id,
@@ -111,6 +135,7 @@ class BatchWorker(object):
     self.lock = threading.Lock()
     self._current_work_item = None
     self._current_executor = None
+    self.work_thread_ident = None
     self.environment = maptask.WorkerEnvironment()
 
   @property
@@ -384,6 +409,10 @@ class BatchWorker(object):
     """Executes worker operations and adds any failures to the report status."""
     logging.info('Executing %s', work_item)
     self.log_memory_usage_if_needed(force=True)
+    if logger.worker_log_handler is not None:
+      # Count the log records dropped while executing this work item.
+      work_item.counters.append(
+          logger.worker_log_handler.reset_dropped_records_counter())
     try:
       with work_item.lock:
         self.set_current_work_item_and_executor(work_item,
@@ -403,27 +432,80 @@ class BatchWorker(object):
     with work_item.lock:
       work_item.done = True
 
+  def do_work_maybe_profiled(self, work_item):
+    """Executes a work item, profiling a profile_fraction of the work items."""
+    if profiler.should_profile(self.profile_fraction):
+      with profiler.Profile(
+          '%s-%s' % (work_item.map_task.stage_name, work_item.proto.id),
+          self.profile_location):
+        self.do_work(work_item)
+    else:
+      self.do_work(work_item)
+
+  def current_operations(self):
+    """Returns the operations of the work item being executed, if any."""
+    work_item = self.current_work_item
+    if work_item is None:
+      return []
+    return getattr(work_item.map_task, 'executed_operations', None) or []
+
+  def status_page(self, path):
+    """Returns the plain text body of a status server page.
+
+    Args:
+      path: the path of the request, including its query string.
+
+    Returns:
+      The body of the page.
+
+    Raises:
+      ValueError: if the query string has invalid parameters.
+    """
+    url = urlparse.urlparse(path)
+    params = urlparse.parse_qs(url.query)
+    if url.path == '/profilez':
+      seconds = float(
+          params.get('seconds', [statuspages.DEFAULT_PROFILE_SECS])[0])
+      if not 0 < seconds <= statuspages.MAX_PROFILE_SECS:
+        raise ValueError('The profile duration must be between 0 and %s '
+                         'seconds.' % statuspages.MAX_PROFILE_SECS)
+      thread_idents = (None if self.work_thread_ident is None
+                       else [self.work_thread_ident])
+      return statuspages.profile(thread_idents, seconds)
+    elif url.path == '/heapz':
+      return statuspages.heap_summary()
+    elif url.path == '/countersz':
+      return statuspages.counters(self.current_operations())
+    else:
+      # Serve /threadz for any other path.
+      return statuspages.thread_stacks()
+
   def status_server(self):
     """Executes the serving loop for the status server."""
+    worker = self
 
     class StatusHttpHandler(BaseHTTPServer.BaseHTTPRequestHandler):
-      """HTTP handler for serving stacktraces of all worker threads."""
+      """HTTP handler for serving the worker status pages.
+
+      See the statuspages module for the pages served.
+      """
 
       def do_GET(self):  # pylint: disable=invalid-name
-        """Return /threadz information for any GET request."""
+        try:
+          body = worker.status_page(self.path)
+        except ValueError as exn:
+          self.send_error(400, str(exn))
+          return
         self.send_response(200)
         self.send_header('Content-Type', 'text/plain')
         self.end_headers()
-        frames = sys._current_frames()  # pylint: disable=protected-access
-        for t in threading.enumerate():
-          self.wfile.write('--- Thread #%s name: %s ---\n' % (t.ident, t.name))
-          self.wfile.write(''.join(traceback.format_stack(frames[t.ident])))
+        self.wfile.write(body)
 
       def log_message(self, f, *args):
         """Do not log any messages."""
         pass
 
-    httpd = BaseHTTPServer.HTTPServer(
+    httpd = _ThreadingHTTPServer(
         ('localhost', self.STATUS_HTTP_PORT), StatusHttpHandler)
     logging.info('Status HTTP server running at %s:%s', httpd.server_name,
                  httpd.server_port)
@@ -448,6 +530,9 @@ class BatchWorker(object):
       logging.error('Could not load main session: %s',
                     deferred_exception_details, exc_info=True)
 
+    # The status server profiles this thread, which executes the work items.
+    self.work_thread_ident = threading.current_thread().ident
+
     # Start status HTTP server thread.
     thread = threading.Thread(target=self.status_server)
     thread.daemon = True
@@ -491,7 +576,6 @@ class BatchWorker(object):
         with logger.PerThreadLoggingContext(
             work_item_id=work_item.proto.id,
             stage_name=work_item.map_task.stage_name):
-          # TODO(silviuc): Add more detailed timing and profiling support.
           start_time = time.time()
 
           if deferred_exception_details:
@@ -509,7 +593,7 @@ class BatchWorker(object):
             # failed.  The progress reporting_thread will take care of sending
             # updates and updating in the workitem object the reporting indexes
             # and duration for the lease.
-            self.do_work(work_item)
+            self.do_work_maybe_profiled(work_item)
           logging.info('Completed work item: %s in %.9f seconds',
                        work_item.proto.id, time.time() - start_time)
 
@@ -0,0 +1,71 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the batch worker."""
+
+import json
+import logging
+import unittest
+
+import mock
+
+from google.cloud.dataflow.worker import batchworker
+from google.cloud.dataflow.worker import profiler
+
+
+def make_properties(**kwargs):
+  properties = {
+      'project_id': 'project',
+      'job_id': 'job',
+      'worker_id': 'worker',
+      'service_path': 'https://dataflow.googleapis.com/',
+      'root_url': 'https://dataflow.googleapis.com/',
+      'dataflow.worker.logging.location': '/tmp/worker.log',
+      'reporting_enabled': 'true',
+      'temp_gcs_directory': '/tmp/dataflow',
+  }
+  properties.update(kwargs)
+  return properties
+
+
+class BatchWorkerTest(unittest.TestCase):
+
+  def create_worker(self, properties):
+    with mock.patch.object(batchworker.logger, 'initialize'):
+      with mock.patch.object(batchworker.apiclient, 'DataflowWorkerClient'):
+        return batchworker.BatchWorker(properties)
+
+  def test_profiling_options_from_sdk_pipeline_options(self):
+    worker = self.create_worker(make_properties(
+        sdk_pipeline_options=json.dumps({'options': {
+            'profile_fraction': 0.25,
+            'profile_location': 'gs://bucket/profiles'}})))
+    work_item = mock.Mock()
+    with mock.patch.object(profiler, 'should_profile',
+                           return_value=False) as should_profile:
+      with mock.patch.object(worker, 'do_work') as do_work:
+        worker.do_work_maybe_profiled(work_item)
+    should_profile.assert_called_once_with(0.25)
+    do_work.assert_called_once_with(work_item)
+    self.assertEqual('gs://bucket/profiles', worker.profile_location)
+
+  def test_profiling_disabled_without_sdk_pipeline_options(self):
+    worker = self.create_worker(make_properties())
+    self.assertEqual(0, worker.profile_fraction)
+    self.assertEqual('/tmp/dataflow/profiles', worker.profile_location)
+
+
+if __name__ == '__main__':
+  logging.getLogger().setLevel(logging.INFO)
+  unittest.main()
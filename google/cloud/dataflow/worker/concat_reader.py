@@ -20,7 +20,11 @@ not use this when developing Dataflow jobs.
 
 from __future__ import absolute_import
 
+import logging
+import threading
+
 from google.cloud.dataflow.io import iobase
+from google.cloud.dataflow.io import prefetch
 
 
 class ConcatSource(iobase.Source):
@@ -32,6 +36,22 @@ class ConcatSource(iobase.Source):
   def reader(self):
     return ConcatReader(self)
 
+  def estimate_size(self):
+    total_size = 0
+    for sub_source in self.sub_sources or []:
+      size = sub_source.estimate_size()
+      if size is None:
+        return None
+      total_size += size
+    return total_size
+
+  def split(self, desired_bundle_size):
+    """Splits each sub-source and returns all resulting bundles in order."""
+    bundles = []
+    for sub_source in self.sub_sources or []:
+      bundles.extend(sub_source.split(desired_bundle_size))
+    return bundles or [self]
+
   def __eq__(self, other):
     return self.sub_sources == other.sub_sources
 
@@ -39,8 +59,10 @@ class ConcatSource(iobase.Source):
 class ConcatReader(iobase.SourceReader):
   """A reader that reads elements from a given set of encoded sources.
 
-  Creates readers for sources lazily, i.e. only when elements
-  from the particular reader are about to be read.
+  Creates readers for sources lazily, i.e. only shortly before elements
+  from the particular reader are about to be read. The readers of the next
+  few sources are opened on background threads while the current one is
+  being read so that their open latency is not paid serially.
 
   This class does does not cache readers and instead creates new set of readers
   evertime it is iterated on. Because of this, multiple iterators created for
@@ -50,12 +72,20 @@ class ConcatReader(iobase.SourceReader):
 
   For progress reporting ConcatReader uses a position of type
   iobase.ConcatPosition.
+
+  The reader can be split dynamically at the start of a sub-source not read
+  yet, or within the current sub-source if its reader supports dynamic
+  splitting. A split at a percentage of the work is mapped to a sub-source
+  assuming that all the sub-sources take the same time to read.
   """
 
   def __init__(self, source):
     self.source = source
     self.current_reader = None
     self.current_reader_index = -1
+    # Index of the first sub-source not to be read, changed by dynamic splits.
+    self.stop_index = len(source.sub_sources or [])
+    self._lock = threading.Lock()
 
   def __enter__(self):
     return self
@@ -64,11 +94,15 @@ class ConcatReader(iobase.SourceReader):
     if self.source.sub_sources is None:
       return
 
-    for sub_source in self.source.sub_sources:
-      with sub_source.reader() as reader:
+    for sub_reader in prefetch.prefetched_readers(self.source.sub_sources):
+      with self._lock:
+        if self.current_reader_index + 1 >= self.stop_index:
+          return
         self.current_reader_index += 1
-        self.current_reader = reader
-        for data in reader:
+        self.current_reader = None
+      with sub_reader:
+        self.current_reader = sub_reader.reader
+        for data in sub_reader:
           yield data
 
   def __exit__(self, exception_type, exception_value, traceback):
@@ -94,3 +128,63 @@ class ConcatReader(iobase.SourceReader):
       return iobase.ReaderProgress(
           position=iobase.ReaderPosition(
               concat_position=iobase.ConcatPosition(index, inner_position)))
+
+  def request_dynamic_split(self, dynamic_split_request):
+    assert dynamic_split_request is not None
+    progress = dynamic_split_request.progress
+    if progress.position is not None:
+      concat_position = progress.position.concat_position
+      if concat_position is None:
+        logging.warning('ConcatReader only supports split at a concat '
+                        'position. Requested: %r', dynamic_split_request)
+        return
+      index = concat_position.index
+      inner_progress = None
+      if concat_position.position is not None:
+        inner_progress = iobase.ReaderProgress(
+            position=concat_position.position)
+    elif progress.percent_complete is not None:
+      if not 0 < progress.percent_complete < 1:
+        logging.warning('ConcatReader cannot be split at a percentage of work '
+                        'out of the range (0, 1). Requested: %r',
+                        dynamic_split_request)
+        return
+      sub_sources_complete = progress.percent_complete * self.stop_index
+      index = int(sub_sources_complete)
+      inner_progress = iobase.ReaderProgress(
+          percent_complete=sub_sources_complete - index)
+      if inner_progress.percent_complete == 0:
+        inner_progress = None
+    else:
+      logging.warning('ConcatReader requires either a position or a '
+                      'percentage of work to be complete to perform a dynamic '
+                      'split request. Requested: %r', dynamic_split_request)
+      return
+
+    with self._lock:
+      if index == self.current_reader_index and inner_progress is not None:
+        return self._split_current_reader(index, inner_progress)
+      # A position within a sub-source not open yet cannot be checked, so the
+      # split happens at the start of that sub-source instead.
+      if self.current_reader_index < index < self.stop_index:
+        logging.info('Split ConcatReader at sub-source %d', index)
+        self.stop_index = index
+        return iobase.DynamicSplitResultWithPosition(iobase.ReaderPosition(
+            concat_position=iobase.ConcatPosition(index, None)))
+      logging.info('Refusing to split ConcatReader at sub-source %d: current '
+                   'sub-source %d, stop sub-source %d', index,
+                   self.current_reader_index, self.stop_index)
+
+  def _split_current_reader(self, index, inner_progress):
+    if self.current_reader is None:
+      logging.info('Refusing to split ConcatReader within sub-source %d: not '
+                   'open yet', index)
+      return
+    sub_result = self.current_reader.request_dynamic_split(
+        iobase.DynamicSplitRequest(inner_progress))
+    if sub_result is None:
+      return
+    self.stop_index = index + 1
+    return iobase.DynamicSplitResultWithPosition(iobase.ReaderPosition(
+        concat_position=iobase.ConcatPosition(index,
+                                              sub_result.stop_position)))
@@ -20,6 +20,7 @@ import unittest
 
 from google.cloud.dataflow.io import iobase
 from google.cloud.dataflow.worker import concat_reader
+from google.cloud.dataflow.worker import inmemory
 
 
 class TestSource(iobase.Source):
@@ -63,6 +64,12 @@ class TestReader(iobase.SourceReader):
         position=iobase.ReaderPosition(record_index=self.current_index))
 
 
+class IdCoder(object):
+
+  def decode(self, value):
+    return value
+
+
 class ConcatReaderTest(unittest.TestCase):
 
   def create_data(self, sizes):
@@ -246,6 +253,99 @@ class ConcatReaderTest(unittest.TestCase):
   def test_get_progress_multiple_sizes(self):
     self._test_progress_reporting([20, 10, 30])
 
+  def test_split(self):
+    source = concat_reader.ConcatSource([
+        inmemory.InMemorySource(['aa', 'bb', 'cc']),
+        inmemory.InMemorySource(['dd'])])
+    self.assertEqual(8, source.estimate_size())
+    bundles = source.split(4)
+    self.assertEqual([['aa', 'bb'], ['cc'], ['dd']],
+                     [b.elements[b.start_index:b.end_index] for b in bundles])
+
+  def test_estimate_size_unknown(self):
+    source = concat_reader.ConcatSource([
+        inmemory.InMemorySource(['aa']), TestSource([1, 2])])
+    self.assertIsNone(source.estimate_size())
+
+
+class ConcatReaderDynamicSplitTest(unittest.TestCase):
+
+  def create_source(self, sizes):
+    sub_sources = []
+    start = 0
+    for size in sizes:
+      sub_sources.append(
+          inmemory.InMemorySource(range(start, start + size), coder=IdCoder()))
+      start += size
+    return concat_reader.ConcatSource(sub_sources)
+
+  def split_at(self, reader, index, record_index=None, percent_complete=None):
+    position = None
+    if index is not None:
+      inner_position = None
+      if record_index is not None:
+        inner_position = iobase.ReaderPosition(record_index=record_index)
+      position = iobase.ReaderPosition(
+          concat_position=iobase.ConcatPosition(index, inner_position))
+    return reader.request_dynamic_split(iobase.DynamicSplitRequest(
+        iobase.ReaderProgress(position=position,
+                              percent_complete=percent_complete)))
+
+  def test_split_at_sub_source_boundary(self):
+    read = []
+    with self.create_source([3, 3, 3, 3]).reader() as reader:
+      for value in reader:
+        read.append(value)
+        if value == 4:
+          # Sub-sources already read or being read.
+          self.assertIsNone(self.split_at(reader, 0))
+          self.assertIsNone(self.split_at(reader, 1))
+          self.assertIsNone(self.split_at(reader, 4))
+          result = self.split_at(reader, 3)
+          self.assertEqual(3, result.stop_position.concat_position.index)
+          self.assertIsNone(result.stop_position.concat_position.position)
+          result = self.split_at(reader, 2)
+          self.assertEqual(2, result.stop_position.concat_position.index)
+    self.assertEqual(range(6), read)
+
+  def test_split_within_current_sub_source(self):
+    read = []
+    with self.create_source([4, 4, 4]).reader() as reader:
+      for value in reader:
+        read.append(value)
+        if value == 5:
+          progress = reader.get_progress()
+          self.assertEqual(1, progress.position.concat_position.index)
+          result = self.split_at(reader, 1, record_index=3)
+          concat_position = result.stop_position.concat_position
+          self.assertEqual(1, concat_position.index)
+          self.assertEqual(3, concat_position.position.record_index)
+    self.assertEqual(range(7), read)
+
+  def test_split_at_percent_complete(self):
+    read = []
+    with self.create_source([4, 4, 4, 4]).reader() as reader:
+      for value in reader:
+        read.append(value)
+        if value == 1:
+          self.assertIsNone(self.split_at(reader, None, percent_complete=1))
+          # Half way through the second sub-source is beyond the current one,
+          # so the split happens at its start.
+          result = self.split_at(reader, None, percent_complete=0.375)
+          self.assertEqual(1, result.stop_position.concat_position.index)
+          # The percentage is now of the only sub-source left to read.
+          result = self.split_at(reader, None, percent_complete=0.75)
+          concat_position = result.stop_position.concat_position
+          self.assertEqual(0, concat_position.index)
+          self.assertEqual(3, concat_position.position.record_index)
+    self.assertEqual([0, 1, 2], read)
+
+  def test_split_before_reading(self):
+    with self.create_source([2, 2]).reader() as reader:
+      result = self.split_at(reader, 1)
+      self.assertEqual(1, result.stop_position.concat_position.index)
+      self.assertEqual([0, 1], list(reader))
+
 
 if __name__ == '__main__':
   logging.getLogger().setLevel(logging.INFO)
@@ -21,7 +21,9 @@ import random
 
 
 from google.cloud.dataflow.internal import pickler
+from google.cloud.dataflow.pvalue import DICT_SIDE_INPUT
 from google.cloud.dataflow.pvalue import EmptySideInput
+from google.cloud.dataflow.pvalue import MULTIMAP_SIDE_INPUT
 from google.cloud.dataflow.runners import common
 import google.cloud.dataflow.transforms as ptransform
 from google.cloud.dataflow.transforms import trigger
@@ -34,6 +36,12 @@ from google.cloud.dataflow.worker import logger
 from google.cloud.dataflow.worker import maptask
 from google.cloud.dataflow.worker import opcounters
 from google.cloud.dataflow.worker import shuffle
+from google.cloud.dataflow.worker import sideinputs
+from google.cloud.dataflow.worker import statesampler
+
+
+def _discard(unused_windowed_value):
+  pass
 
 
 class Operation(object):
@@ -53,23 +61,80 @@ class Operation(object):
     """
     self.spec = spec
     self.receivers = collections.defaultdict(list)
+    # The coders of the values of each output, used to estimate their size.
+    # Set by the executor when known.
+    self.output_coders = None
+    # The states in which the time spent executing this operation is counted.
+    # Set by attach_state_sampler().
+    self.scoped_states = ()
     # Initially we have no counters.  Initializing this here makes it
     # safe to call itercounters() at any time, even if start() has
     # not been called yet.
     self.counters = collections.defaultdict(self.new_operation_counters)
 
   def new_operation_counters(self, output_index=0):
-    return opcounters.OperationCounters(self.step_name, output_index)
+    coder = None
+    if self.output_coders and output_index < len(self.output_coders):
+      coder = self.output_coders[output_index]
+    return opcounters.OperationCounters(self.step_name, output_index, coder)
 
   def start(self):
     # If the operation has receivers, create one counter set per receiver.
     for output_index in self.receivers:
       self.counters[output_index] = self.new_operation_counters(output_index)
+    # Resolve the dispatch of each output to its receivers once, rather than
+    # for every element. The receivers have their state sampler attached
+    # already, so the functions call their final process() methods.
+    self.outputs = dict(
+        (output_index, common.receive_function(self.counters[output_index],
+                                               receivers))
+        for output_index, receivers in self.receivers.iteritems())
+    self.output = self.outputs.get(0, _discard)
 
   def itercounters(self):
     for opcounter in self.counters.values():
       for counter in opcounter:
         yield counter
+    for scoped_state in self.scoped_states:
+      for counter in scoped_state:
+        yield counter
+
+  def attach_state_sampler(self, state_sampler):
+    """Counts the time spent starting, processing and finishing separately.
+
+    The process() method, if any, is replaced by a method recording that the process
+    state of this operation is current while it runs. The start and finish
+    states must be entered by the caller of start() and finish(). The worker
+    logs take the step of their records from the current state, so this also
+    switches the logging context between steps.
+
+    Args:
+      state_sampler: a statesampler.StateSampler instance.
+    """
+    self.scoped_start_state = state_sampler.scoped_state(
+        '%s-start' % self.step_name, self.step_name)
+    self.scoped_process_state = state_sampler.scoped_state(
+        '%s-process' % self.step_name, self.step_name)
+    self.scoped_finish_state = state_sampler.scoped_state(
+        '%s-finish' % self.step_name, self.step_name)
+    self.scoped_states = (self.scoped_start_state, self.scoped_process_state,
+                          self.scoped_finish_state)
+
+    process = getattr(self, 'process', None)
+    if process is None:
+      # Read operations only have a start state.
+      return
+    process_state = self.scoped_process_state
+
+    # Not using the state as a context manager: this runs for every element
+    # and the work item fails anyway if processing raises an exception.
+    def scoped_process(o):
+      previous_state = state_sampler.current_state
+      state_sampler.current_state = process_state
+      process(o)
+      state_sampler.current_state = previous_state
+
+    self.process = scoped_process
 
   def finish(self):
     pass
@@ -133,15 +198,17 @@ class ReadOperation(Operation):
     super(ReadOperation, self).start()
     with self.spec.source.reader() as reader:
       self._reader = reader
-      for value in reader:
-        self._current_progress = reader.get_progress()
-        if reader.returns_windowed_values:
-          windowed_value = value
-        else:
-          windowed_value = GlobalWindows.WindowedValue(value)
-        for receiver in self.receivers[0]:
-          self.counters[0].update(windowed_value)
-          receiver.process(windowed_value)
+      output = self.output
+      get_progress = reader.get_progress
+      if reader.returns_windowed_values:
+        for windowed_value in reader:
+          self._current_progress = get_progress()
+          output(windowed_value)
+      else:
+        windowed_value_factory = GlobalWindows.WindowedValue
+        for value in reader:
+          self._current_progress = get_progress()
+          output(windowed_value_factory(value))
 
   def side_read_all(self, singleton=False):
     # TODO(mairbek): Should we return WindowedValue here?
@@ -185,18 +252,25 @@ class WriteOperation(Operation):
     self.writer = self.spec.sink.writer()
     self.writer.__enter__()
     self.use_windowed_value = self.writer.takes_windowed_values
+    self._update_counters = self.counters[0].update
+    self._write = self.writer.Write
 
   def finish(self):
     self.writer.__exit__(None, None, None)
 
+  def itercounters(self):
+    for counter in super(WriteOperation, self).itercounters():
+      yield counter
+    if self.writer is not None:
+      for counter in self.writer.itercounters():
+        yield counter
+
   def process(self, o):
-    logging.debug('Processing [%s] in %s', o, self)
-    assert isinstance(o, WindowedValue)
-    self.counters[0].update(o)
+    self._update_counters(o)
     if self.use_windowed_value:
-      self.writer.Write(o)
+      self._write(o)
     else:
-      self.writer.Write(o.value)
+      self._write(o.value)
 
 
 class InMemoryWriteOperation(Operation):
@@ -206,11 +280,14 @@ class InMemoryWriteOperation(Operation):
     super(InMemoryWriteOperation, self).__init__(spec)
     self.spec = spec
 
+  def start(self):
+    super(InMemoryWriteOperation, self).start()
+    self._update_counters = self.counters[0].update
+    self._append = self.spec.output_buffer.append
+
   def process(self, o):
-    logging.debug('Processing [%s] in %s', o, self)
-    assert isinstance(o, WindowedValue)
-    self.counters[0].update(o)
-    self.spec.output_buffer.append(o.value)
+    self._update_counters(o)
+    self._append(o.value)
 
 
 class GroupedShuffleReadOperation(Operation):
@@ -228,13 +305,12 @@ class GroupedShuffleReadOperation(Operation):
           self.spec.shuffle_reader_config, coder=self.spec.coders,
           start_position=self.spec.start_shuffle_position,
           end_position=self.spec.end_shuffle_position)
+    output = self.output
+    windowed_value_factory = GlobalWindows.WindowedValue
     with self.shuffle_source.reader() as reader:
       for key, key_values in reader:
         self._reader = reader
-        for receiver in self.receivers[0]:
-          windowed_value = GlobalWindows.WindowedValue((key, key_values))
-          self.counters[0].update(windowed_value)
-          receiver.process(windowed_value)
+        output(windowed_value_factory((key, key_values)))
 
   def get_progress(self):
     if self._reader is not None:
@@ -260,21 +336,20 @@ class UngroupedShuffleReadOperation(Operation):
           self.spec.shuffle_reader_config, coder=self.spec.coders,
           start_position=self.spec.start_shuffle_position,
           end_position=self.spec.end_shuffle_position)
+    output = self.output
+    windowed_value_factory = GlobalWindows.WindowedValue
     with self.shuffle_source.reader() as reader:
+      self._reader = reader
       for value in reader:
-        self._reader = reader
-        for receiver in self.receivers[0]:
-          windowed_value = GlobalWindows.WindowedValue(value)
-          self.counters[0].update(windowed_value)
-          receiver.process(windowed_value)
+        output(windowed_value_factory(value))
 
   def get_progress(self):
-    # 'UngroupedShuffleReader' does not support progress reporting.
-    pass
+    if self._reader is not None:
+      return self._reader.get_progress()
 
   def request_dynamic_split(self, dynamic_split_request):
-    # 'UngroupedShuffleReader' does not support dynamic work rebalancing.
-    pass
+    if self._reader is not None:
+      return self._reader.request_dynamic_split(dynamic_split_request)
 
 
 class ShuffleWriteOperation(Operation):
@@ -293,15 +368,16 @@ class ShuffleWriteOperation(Operation):
           self.spec.shuffle_writer_config, coder=self.spec.coders)
     self.writer = self.shuffle_sink.writer()
     self.writer.__enter__()
+    self._update_counters = self.counters[0].update
+    self._write = self.writer.Write
+    self._ungrouped = self.spec.shuffle_kind == 'ungrouped'
 
   def finish(self):
     logging.debug('Finishing %s', self)
     self.writer.__exit__(None, None, None)
 
   def process(self, o):
-    logging.debug('Processing [%s] in %s', o, self)
-    assert isinstance(o, WindowedValue)
-    self.counters[0].update(o)
+    self._update_counters(o)
     # We typically write into shuffle key/value pairs. This is the reason why
     # the else branch below expects the value attribute of the WindowedValue
     # argument to be a KV pair. However the service may write to shuffle in
@@ -311,7 +387,7 @@ class ShuffleWriteOperation(Operation):
     # used to reshard workflow outputs into a fixed set of files. This is
     # achieved by using an UngroupedShuffleSource to read back the values
     # written in 'ungrouped' mode.
-    if self.spec.shuffle_kind == 'ungrouped':
+    if self._ungrouped:
       # We want to spread the values uniformly to all shufflers.
       k, v = str(random.getrandbits(64)), o.value
     else:
@@ -319,7 +395,7 @@ class ShuffleWriteOperation(Operation):
     # TODO(silviuc): Figure out what is the proper value for the secondary key.
     # For now the secondary key is a duplicate of the primary key just because
     # they both use the same coder.
-    self.writer.Write(k, k, v)
+    self._write(k, k, v)
 
 
 class DoOperation(Operation):
@@ -334,9 +410,10 @@ class DoOperation(Operation):
 
     Args:
       tags_and_types: List of tuples (tag, type). Each side input has a string
-        tag that is specified in the worker instruction. The type is actually
-        a boolean which is True for singleton input (read just first value)
-        and False for collection input (read all values).
+        tag that is specified in the worker instruction. The type is True for
+        singleton input (read just first value), False for collection input
+        (read all values), and DICT_SIDE_INPUT or MULTIMAP_SIDE_INPUT for a
+        mapping of the key-value pairs of the collection (indexed by key).
 
     Yields:
       With each iteration it yields the result of reading an entire side source
@@ -357,21 +434,30 @@ class DoOperation(Operation):
       # while the variable has the value assigned by the current iteration of
       # the for loop.
       # pylint: disable=cell-var-from-loop
-      results = []
-      for si in itertools.ifilter(
-          lambda o: o.tag == side_tag, self.spec.side_inputs):
-        if isinstance(si, maptask.WorkerRead):
-          op = ReadOperation(si)
-        else:
+      side_inputs = [si for si in self.spec.side_inputs if si.tag == side_tag]
+      for si in side_inputs:
+        if not isinstance(si, maptask.WorkerRead):
           raise NotImplementedError('Unknown side input type: %r' % si)
-        for v in op.side_read_all(singleton=side_type):
-          results.append(v)
-          if side_type:
-            break
+      if side_type in (DICT_SIDE_INPUT, MULTIMAP_SIDE_INPUT):
+        # The pairs are streamed to a key-indexed file instead of being held
+        # in memory.
+        yield sideinputs.read_view(
+            [si.source for si in side_inputs],
+            lambda: itertools.chain.from_iterable(
+                ReadOperation(si).side_read_all() for si in side_inputs),
+            multimap=side_type == MULTIMAP_SIDE_INPUT)
+        continue
       if side_type:
-        yield results[0] if results else EmptySideInput()
-      else:
-        yield results
+        # Only the first value is read. It is not cached, so that each work
+        # item gets its own (e.g. the list of an AsList side input).
+        yield next(itertools.chain.from_iterable(
+            ReadOperation(si).side_read_all(singleton=True)
+            for si in side_inputs), EmptySideInput())
+        continue
+      # The sources are read concurrently in the background (and cached by the
+      # worker). The DoFn can iterate over the values already read while the
+      # rest are being read.
+      yield sideinputs.StreamingSideInput([si.source for si in side_inputs])
 
   def itercounters(self):
     """Return an iterator over all our counters.
@@ -422,7 +508,7 @@ class DoOperation(Operation):
     self.dofn_runner = common.DoFnRunner(
         fn, args, kwargs, self._read_side_inputs(tags_and_types),
         window_fn, self.context, tagged_receivers, tagged_counters,
-        logger, self.step_name)
+        self.step_name)
 
     self.dofn_runner.start()
 
@@ -430,8 +516,7 @@ class DoOperation(Operation):
     self.dofn_runner.finish()
 
   def process(self, o):
-    with logger.PerThreadLoggingContext(step_name=self.step_name):
-      self.dofn_runner.process(o)
+    self.dofn_runner.process(o)
 
 
 class CombineOperation(Operation):
@@ -485,14 +570,9 @@ class CombineOperation(Operation):
     logging.debug('Finishing %s', self)
 
   def process(self, o):
-    logging.debug('Processing [%s] in %s', o, self)
-    assert isinstance(o, WindowedValue)
     key, values = o.value
-    windowed_result = WindowedValue(
-        (key, self.apply(values)), o.timestamp, o.windows)
-    for receiver in self.receivers[0]:
-      self.counters[0].update(windowed_result)
-      receiver.process(windowed_result)
+    self.output(
+        WindowedValue((key, self.apply(values)), o.timestamp, o.windows))
 
   def full_combine(self, elements):
     return self.combine_fn.apply(elements)
@@ -541,12 +621,9 @@ class PGBKOperation(Operation):
         break
       del self.table[kw]
       key, windows = kw
-      windowed_value = WindowedValue(
+      self.output(WindowedValue(
           (key, [v.value[1] for v in vs]),
-          vs[0].timestamp, windows)
-      for receiver in self.receivers[0]:
-        self.counters[0].update(windowed_value)
-        receiver.process(windowed_value)
+          vs[0].timestamp, windows))
 
 
 class FlattenOperation(Operation):
@@ -557,12 +634,7 @@ class FlattenOperation(Operation):
   """
 
   def process(self, o):
-    logging.debug('Processing [%s] in %s', o, self)
-    assert isinstance(o, WindowedValue)
-    windowed_result = WindowedValue(o.value, o.timestamp, o.windows)
-    for receiver in self.receivers[0]:
-      self.counters[0].update(windowed_result)
-      receiver.process(windowed_result)
+    self.output(WindowedValue(o.value, o.timestamp, o.windows))
 
 
 class ReifyTimestampAndWindowsOperation(Operation):
@@ -577,19 +649,12 @@ class ReifyTimestampAndWindowsOperation(Operation):
     super(ReifyTimestampAndWindowsOperation, self).__init__(spec)
 
   def process(self, o):
-    logging.debug('Processing [%s] in %s', o, self)
-    assert isinstance(o, WindowedValue)
     k, v = o.value
     self.output(
         window.WindowedValue(
             (k, window.WindowedValue(v, o.timestamp, o.windows)),
             o.timestamp, o.windows))
 
-  def output(self, windowed_result):
-    for receiver in self.receivers[0]:
-      self.counters[0].update(windowed_result)
-      receiver.process(windowed_result)
-
 
 class BatchGroupAlsoByWindowsOperation(Operation):
   """BatchGroupAlsoByWindowsOperation operation.
@@ -603,8 +668,6 @@ class BatchGroupAlsoByWindowsOperation(Operation):
 
   def process(self, o):
     """Process a given value."""
-    logging.debug('Processing [%s] in %s', o, self)
-    assert isinstance(o, WindowedValue)
     k, vs = o.value
     driver = trigger.create_trigger_driver(self.windowing, True)
     state = InMemoryUnmergedState()
@@ -619,11 +682,6 @@ class BatchGroupAlsoByWindowsOperation(Operation):
           self.output(window.WindowedValue(
               (k, values), out_window.end, [out_window]))
 
-  def output(self, windowed_result):
-    for receiver in self.receivers[0]:
-      self.counters[0].update(windowed_result)
-      receiver.process(windowed_result)
-
 
 class StreamingGroupAlsoByWindowsOperation(Operation):
   """BatchGroupAlsoByWindowsOperation operation.
@@ -636,8 +694,6 @@ class StreamingGroupAlsoByWindowsOperation(Operation):
     self.windowing = pickler.loads(self.spec.window_fn)
 
   def process(self, o):
-    logging.debug('Processing [%s] in %s', o, self)
-    assert isinstance(o, WindowedValue)
     keyed_work = o.value
     driver = trigger.create_trigger_driver(self.windowing)
     state = self.spec.context.state
@@ -646,11 +702,6 @@ class StreamingGroupAlsoByWindowsOperation(Operation):
       self.output(window.WindowedValue((keyed_work.key, values),
                                        out_window.end, [out_window]))
 
-  def output(self, windowed_result):
-    for receiver in self.receivers[0]:
-      self.counters[0].update(windowed_result)
-      receiver.process(windowed_result)
-
 
 class MapTaskExecutor(object):
   """A class for executing map tasks.
@@ -763,14 +814,29 @@ class MapTaskExecutor(object):
     if map_task.step_names is not None:
       for ix, op in enumerate(self._ops):
         op.step_name = map_task.step_names[ix]
+    if map_task.output_coders is not None:
+      for ix, op in enumerate(self._ops):
+        op.output_coders = map_task.output_coders[ix]
+
+    # Count the time spent in each operation. The receivers are set up
+    # already so the timing of process() covers every call.
+    state_sampler = statesampler.StateSampler()
+    for op in self._ops:
+      op.attach_state_sampler(state_sampler)
 
     # Attach the ops back to the map_task, so we can report their counters.
     map_task.executed_operations = self._ops
 
-    ix = len(self._ops)
-    for op in reversed(self._ops):
-      ix -= 1
-      logging.debug('Starting op %d %s', ix, op)
-      op.start()
-    for op in self._ops:
-      op.finish()
+    # The step of the records logged while executing the operations is the
+    # one of the current state of the sampler.
+    with state_sampler, logger.PerThreadLoggingContext(
+        state_sampler=state_sampler):
+      ix = len(self._ops)
+      for op in reversed(self._ops):
+        ix -= 1
+        logging.debug('Starting op %d %s', ix, op)
+        with op.scoped_start_state:
+          op.start()
+      for op in self._ops:
+        with op.scoped_finish_state:
+          op.finish()
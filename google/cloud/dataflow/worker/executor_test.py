@@ -14,13 +14,17 @@
 
 """Tests for work item executor functionality."""
 
+import json
 import logging
 import tempfile
+import time
 import unittest
 
 from google.cloud.dataflow import coders
+from google.cloud.dataflow import pvalue
 from google.cloud.dataflow.internal import pickler
 from google.cloud.dataflow.internal import util
+from google.cloud.dataflow.io import avroio
 from google.cloud.dataflow.io import bigquery
 from google.cloud.dataflow.io import fileio
 import google.cloud.dataflow.transforms as ptransform
@@ -28,7 +32,9 @@ from google.cloud.dataflow.transforms import core
 from google.cloud.dataflow.transforms import window
 from google.cloud.dataflow.worker import executor
 from google.cloud.dataflow.worker import inmemory
+from google.cloud.dataflow.worker import logger
 from google.cloud.dataflow.worker import maptask
+from google.cloud.dataflow.worker import sideinputs
 import mock
 
 
@@ -96,10 +102,22 @@ class ProgressRequestRecordingInMemorySource(inmemory.InMemorySource):
     return self.last_reader
 
 
+class ReadCountingInMemorySource(inmemory.InMemorySource):
+
+  num_reads = 0
+
+  def reader(self):
+    ReadCountingInMemorySource.num_reads += 1
+    return super(ReadCountingInMemorySource, self).reader()
+
+
 class ExecutorTest(unittest.TestCase):
 
   SHUFFLE_CODERS = (coders.PickleCoder(), coders.PickleCoder())
 
+  def setUp(self):
+    sideinputs.clear_side_input_cache()
+
   def create_temp_file(self, content_text):
     """Creates a temporary file with content and returns the path to it."""
     temp = tempfile.NamedTemporaryFile(delete=False)
@@ -131,6 +149,111 @@ class ExecutorTest(unittest.TestCase):
     with open(output_path) as f:
       self.assertEqual('XYZ: 01234567890123456789\n', f.read())
 
+  def test_step_msecs_counters(self):
+    output_buffer = []
+
+    def slow_fn(x):
+      time.sleep(0.02)
+      return [x]
+
+    map_task = make_map_task([
+        maptask.WorkerRead(
+            inmemory.InMemorySource(
+                elements=[pickler.dumps(e) for e in range(5)],
+                coder=coders.Base64PickleCoder()),
+            tag=None),
+        maptask.WorkerDoFn(serialized_fn=pickle_with_side_inputs(
+            ptransform.CallableWrapperDoFn(slow_fn)),
+                           output_tags=['out'], input=(0, 0),
+                           side_inputs=None),
+        maptask.WorkerInMemoryWrite(output_buffer=output_buffer,
+                                    input=(1, 0))])
+    executor.MapTaskExecutor().execute(map_task)
+    self.assertEqual(range(5), output_buffer)
+    counters = dict(
+        (counter.name, counter.total)
+        for op in map_task.executed_operations
+        for counter in op.itercounters())
+    for step in ('step-0', 'step-1', 'step-2'):
+      for state in ('start', 'process', 'finish'):
+        self.assertIn('%s-%s-msecs' % (step, state), counters)
+        self.assertIn('%s-%s-cpu-msecs' % (step, state), counters)
+    # The time spent sleeping in the DoFn is not attributed to the read.
+    self.assertGreaterEqual(counters['step-1-process-msecs'], 50)
+    self.assertLess(counters['step-0-start-msecs'],
+                    counters['step-1-process-msecs'])
+
+  def test_output_with_several_receivers(self):
+    first_buffer, second_buffer = [], []
+    map_task = make_map_task([
+        maptask.WorkerRead(
+            inmemory.InMemorySource(
+                elements=[pickler.dumps(e) for e in range(5)],
+                coder=coders.Base64PickleCoder()),
+            tag=None),
+        maptask.WorkerDoFn(serialized_fn=pickle_with_side_inputs(
+            ptransform.CallableWrapperDoFn(lambda x: [x, x * 10])),
+                           output_tags=['out'], input=(0, 0),
+                           side_inputs=None),
+        maptask.WorkerInMemoryWrite(output_buffer=first_buffer,
+                                    input=(1, 0)),
+        maptask.WorkerInMemoryWrite(output_buffer=second_buffer,
+                                    input=(1, 0))])
+    executor.MapTaskExecutor().execute(map_task)
+    expected = [0, 0, 1, 10, 2, 20, 3, 30, 4, 40]
+    self.assertEqual(expected, first_buffer)
+    self.assertEqual(expected, second_buffer)
+    counters = dict(
+        (counter.name, counter.total)
+        for op in map_task.executed_operations
+        for counter in op.itercounters())
+    # Each element is counted once, whatever its number of receivers.
+    self.assertEqual(5, counters['step-0-out0-ElementCount'])
+    self.assertEqual(10, counters['step-1-out0-ElementCount'])
+
+  def test_logging_context_follows_steps(self):
+    log_records = []
+
+    class RecordingHandler(logging.Handler):
+
+      def emit(self, record):
+        log_records.append(json.loads(self.format(record)))
+
+    def logging_fn(x):
+      logging.info('Processing %s', x)
+      return [x]
+
+    handler = RecordingHandler()
+    handler.setFormatter(logger.JsonLogFormatter('job', 'worker'))
+    root_logger = logging.getLogger()
+    original_level = root_logger.level
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(handler)
+    try:
+      executor.MapTaskExecutor().execute(make_map_task([
+          maptask.WorkerRead(
+              inmemory.InMemorySource(
+                  elements=[pickler.dumps(e) for e in range(2)],
+                  coder=coders.Base64PickleCoder()),
+              tag=None),
+          maptask.WorkerDoFn(serialized_fn=pickle_with_side_inputs(
+              ptransform.CallableWrapperDoFn(logging_fn)),
+                             output_tags=['out'], input=(0, 0),
+                             side_inputs=None),
+          maptask.WorkerDoFn(serialized_fn=pickle_with_side_inputs(
+              ptransform.CallableWrapperDoFn(logging_fn)),
+                             output_tags=['out'], input=(1, 0),
+                             side_inputs=None),
+          maptask.WorkerInMemoryWrite(output_buffer=[], input=(2, 0))]))
+    finally:
+      root_logger.removeHandler(handler)
+      root_logger.setLevel(original_level)
+    self.assertEqual(
+        [('Processing 0', 'step-1'), ('Processing 0', 'step-2'),
+         ('Processing 1', 'step-1'), ('Processing 1', 'step-2')],
+        [(r['message'], r.get('step')) for r in log_records
+         if r['message'].startswith('Processing')])
+
   def test_read_do_write_with_start_bundle(self):
     input_path = self.create_temp_file('01234567890123456789\n0123456789')
     output_path = '%s.out' % input_path
@@ -285,6 +408,27 @@ class ExecutorTest(unittest.TestCase):
     with open(output_path) as f:
       self.assertEqual('XYZ: ghi', pickler.loads(f.read().strip()))
 
+  def test_create_do_avro_file_write(self):
+    output_path = self.create_temp_file('n/a')
+    elements = ['abc', 'def', 'ghi']
+    executor.MapTaskExecutor().execute(make_map_task([
+        maptask.WorkerRead(
+            inmemory.InMemorySource(
+                elements=[pickler.dumps(e) for e in elements],
+                start_index=0,
+                end_index=3),
+            tag=None),
+        maptask.WorkerDoFn(
+            serialized_fn=pickle_with_side_inputs(
+                ptransform.CallableWrapperDoFn(lambda x: [('XYZ', x)])),
+            output_tags=['out'], input=(0, 0), side_inputs=None),
+        maptask.WorkerWrite(avroio.AvroFileSink(
+            output_path, coder=coders.PickleCoder()), input=(1, 0))]))
+    with avroio.AvroFileSource(
+        output_path, coder=coders.PickleCoder()).reader() as reader:
+      self.assertEqual([('XYZ', 'abc'), ('XYZ', 'def'), ('XYZ', 'ghi')],
+                       list(reader))
+
   def test_create_do_with_side_in_memory_write(self):
     elements = ['abc', 'def', 'ghi']
     side_elements = ['x', 'y', 'z']
@@ -315,6 +459,141 @@ class ExecutorTest(unittest.TestCase):
     # only the first element appended.
     self.assertEqual(['abc:x', 'def:x', 'ghi:x'], output_buffer)
 
+  def test_side_input_read_once_per_worker(self):
+    ReadCountingInMemorySource.num_reads = 0
+    for elements in (['abc', 'def'], ['ghi']):
+      output_buffer = []
+      executor.MapTaskExecutor().execute(make_map_task([
+          maptask.WorkerRead(
+              inmemory.InMemorySource(
+                  elements=[pickler.dumps(e) for e in elements]),
+              tag=None),
+          maptask.WorkerDoFn(
+              serialized_fn=pickle_with_side_inputs(
+                  ptransform.CallableWrapperDoFn(
+                      lambda x, side: ['%s:%s' % (x, ''.join(side))]),
+                  tag_and_type=('inmemory', False)),
+              output_tags=['out'], input=(0, 0),
+              side_inputs=[
+                  maptask.WorkerRead(
+                      ReadCountingInMemorySource(
+                          elements=[pickler.dumps(e) for e in 'xyz']),
+                      tag='inmemory')]),
+          maptask.WorkerInMemoryWrite(
+              output_buffer=output_buffer, input=(1, 0))]))
+      self.assertEqual(['%s:xyz' % e for e in elements], output_buffer)
+    self.assertEqual(1, ReadCountingInMemorySource.num_reads)
+
+  def test_singleton_side_input_not_shared_across_work_items(self):
+
+    def append_and_format(x, side):
+      side.append(x)
+      return [''.join(side)]
+
+    ReadCountingInMemorySource.num_reads = 0
+    for elements in (['a'], ['b']):
+      output_buffer = []
+      executor.MapTaskExecutor().execute(make_map_task([
+          maptask.WorkerRead(
+              inmemory.InMemorySource(
+                  elements=[pickler.dumps(e) for e in elements]),
+              tag=None),
+          maptask.WorkerDoFn(
+              serialized_fn=pickle_with_side_inputs(
+                  ptransform.CallableWrapperDoFn(append_and_format),
+                  tag_and_type=('inmemory', True)),
+              output_tags=['out'], input=(0, 0),
+              side_inputs=[
+                  maptask.WorkerRead(
+                      ReadCountingInMemorySource(
+                          elements=[pickler.dumps(e)
+                                    for e in (['x'], ['y'])]),
+                      tag='inmemory')]),
+          maptask.WorkerInMemoryWrite(
+              output_buffer=output_buffer, input=(1, 0))]))
+      # The list appended to by the first work item is not seen by the second.
+      self.assertEqual(['x' + elements[0]], output_buffer)
+    # Singletons are read for each work item and not cached.
+    self.assertEqual(2, ReadCountingInMemorySource.num_reads)
+    self.assertEqual(0, len(sideinputs._side_input_cache))
+
+  def test_create_do_with_dict_and_multimap_side_inputs(self):
+    pairs = [('a', 1), ('b', 2), ('a', 3)]
+    output_buffer = []
+    executor.MapTaskExecutor().execute(make_map_task([
+        maptask.WorkerRead(
+            inmemory.InMemorySource(
+                elements=[pickler.dumps(e) for e in 'abc']),
+            tag=None),
+        maptask.WorkerDoFn(
+            serialized_fn=pickler.dumps((
+                ptransform.CallableWrapperDoFn(
+                    lambda x, dct, multimap: [
+                        (x, dct.get(x), sorted(multimap.get(x, [])))]),
+                [util.ArgumentPlaceholder(), util.ArgumentPlaceholder()], {},
+                [('dict', pvalue.DICT_SIDE_INPUT),
+                 ('multimap', pvalue.MULTIMAP_SIDE_INPUT)],
+                core.Windowing(window.GlobalWindows()))),
+            output_tags=['out'], input=(0, 0),
+            side_inputs=[
+                maptask.WorkerRead(
+                    inmemory.InMemorySource(
+                        elements=[pickler.dumps(e) for e in pairs[1:]]),
+                    tag='dict'),
+                maptask.WorkerRead(
+                    inmemory.InMemorySource(
+                        elements=[pickler.dumps(e) for e in pairs]),
+                    tag='multimap')]),
+        maptask.WorkerInMemoryWrite(
+            output_buffer=output_buffer, input=(1, 0))]))
+    self.assertEqual(
+        [('a', 3, [1, 3]), ('b', 2, [2]), ('c', None, [])], output_buffer)
+
+  def test_dict_and_multimap_side_inputs_shared_by_work_items(self):
+
+    def use_side_inputs(x, dct, multimap):
+      # DoFns can modify copies of the dict and the lists of the multimap.
+      copied = dct.copy()
+      copied[x] = 'modified'
+      values = multimap.get(x, [])
+      values.append('modified')
+      return [(x, sorted(copied.items()), values, dct.has_key(x))]
+
+    pairs = [('a', 1), ('b', 2)]
+    outputs = []
+    for elements in ('a', 'b'):
+      output_buffer = []
+      executor.MapTaskExecutor().execute(make_map_task([
+          maptask.WorkerRead(
+              inmemory.InMemorySource(
+                  elements=[pickler.dumps(e) for e in elements]),
+              tag=None),
+          maptask.WorkerDoFn(
+              serialized_fn=pickler.dumps((
+                  ptransform.CallableWrapperDoFn(use_side_inputs),
+                  [util.ArgumentPlaceholder(), util.ArgumentPlaceholder()], {},
+                  [('dict', pvalue.DICT_SIDE_INPUT),
+                   ('multimap', pvalue.MULTIMAP_SIDE_INPUT)],
+                  core.Windowing(window.GlobalWindows()))),
+              output_tags=['out'], input=(0, 0),
+              side_inputs=[
+                  maptask.WorkerRead(
+                      inmemory.InMemorySource(
+                          elements=[pickler.dumps(e) for e in pairs]),
+                      tag='dict'),
+                  maptask.WorkerRead(
+                      inmemory.InMemorySource(
+                          elements=[pickler.dumps(e) for e in pairs]),
+                      tag='multimap')]),
+          maptask.WorkerInMemoryWrite(
+              output_buffer=output_buffer, input=(1, 0))]))
+      outputs.extend(output_buffer)
+    # The second work item does not see the changes of the first one.
+    self.assertEqual(
+        [('a', [('a', 'modified'), ('b', 2)], [1, 'modified'], True),
+         ('b', [('a', 1), ('b', 'modified')], [2, 'modified'], True)],
+        outputs)
+
   def test_in_memory_source_progress_reporting(self):
     elements = [101, 201, 301, 401, 501, 601, 701]
     output_buffer = []
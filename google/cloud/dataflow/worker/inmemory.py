@@ -15,9 +15,11 @@
 """In-memory input source."""
 
 import itertools
+import logging
 
 from google.cloud.dataflow import coders
 from google.cloud.dataflow.io import iobase
+from google.cloud.dataflow.io import range_trackers
 
 
 class InMemorySource(iobase.Source):
@@ -48,9 +50,40 @@ class InMemorySource(iobase.Source):
   def reader(self):
     return InMemoryReader(self)
 
+  def estimate_size(self):
+    return sum(len(element) for element in
+               itertools.islice(self.elements, self.start_index,
+                                self.end_index))
+
+  def split(self, desired_bundle_size):
+    """Splits the source into index ranges of roughly the desired size.
+
+    Sizes are measured in bytes of the encoded elements. Each bundle contains
+    at least one element.
+    """
+    bundles = []
+    bundle_start = self.start_index
+    bundle_size = 0
+    for index in xrange(self.start_index, self.end_index):
+      bundle_size += len(self.elements[index])
+      if bundle_size >= desired_bundle_size:
+        bundles.append(InMemorySource(self.elements, self.coder,
+                                      bundle_start, index + 1))
+        bundle_start = index + 1
+        bundle_size = 0
+    if bundle_start < self.end_index:
+      bundles.append(InMemorySource(self.elements, self.coder,
+                                    bundle_start, self.end_index))
+    return bundles or [self]
+
 
 class InMemoryReader(iobase.SourceReader):
-  """A reader for in-memory source."""
+  """A reader for in-memory source.
+
+  Positions are the indices of the elements, reported as record indices. The
+  reader can be split dynamically at a record index or a percentage of the
+  elements.
+  """
 
   def __init__(self, source):
     self.source = source
@@ -58,6 +91,10 @@ class InMemoryReader(iobase.SourceReader):
     # Index of the next item to be read by the InMemoryReader.
     # Starts at source.start_index.
     self.current_index = source.start_index
+    # The end index of a source may be past its last element.
+    self.end_index = min(source.end_index, len(source.elements))
+    self.range_tracker = range_trackers.OffsetRangeTracker(
+        source.start_index, self.end_index)
 
   def __enter__(self):
     return self
@@ -66,21 +103,44 @@ class InMemoryReader(iobase.SourceReader):
     pass
 
   def __iter__(self):
-    for value in itertools.islice(self.source.elements,
-                                  self.source.start_index,
-                                  self.source.end_index):
-      self.current_index += 1
-      yield self.source.coder.decode(value)
+    decode = self.source.coder.decode
+    try_return_record_at = self.range_tracker.try_return_record_at
+    for index in xrange(self.source.start_index, self.end_index):
+      if not try_return_record_at(True, index):
+        return
+      self.current_index = index + 1
+      yield decode(self.source.elements[index])
 
   def get_progress(self):
-    if (self.current_index >= self.source.end_index or
-        self.source.start_index >= self.source.end_index):
-      percent_complete = 1
-    elif self.current_index == self.source.start_index:
-      percent_complete = 0
-    else:
+    if self.current_index == self.source.start_index:
       percent_complete = (
-          float(self.current_index - self.source.start_index) / (
-              self.source.end_index - self.source.start_index))
-
-    return iobase.ReaderProgress(percent_complete=percent_complete)
+          1 if self.source.start_index >= self.end_index else 0)
+      return iobase.ReaderProgress(percent_complete=percent_complete)
+    return iobase.ReaderProgress(
+        position=iobase.ReaderPosition(record_index=self.current_index - 1),
+        percent_complete=self.range_tracker.fraction_consumed)
+
+  def request_dynamic_split(self, dynamic_split_request):
+    assert dynamic_split_request is not None
+    progress = dynamic_split_request.progress
+    split_position = progress.position
+    if split_position is None:
+      percent_complete = progress.percent_complete
+      if percent_complete is None or not 0 < percent_complete < 1:
+        logging.warning(
+            'InMemoryReader requires either a record index or a percentage '
+            'of work in the range (0, 1) to perform a dynamic split request. '
+            'Requested: %r', dynamic_split_request)
+        return
+      split_position = iobase.ReaderPosition(
+          record_index=int(
+              self.range_tracker.get_position_for_fraction_consumed(
+                  percent_complete)))
+    elif split_position.record_index is None:
+      logging.warning(
+          'InMemoryReader only supports split at a record index. '
+          'Requested: %r', dynamic_split_request)
+      return
+
+    if self.range_tracker.try_split_at_position(split_position.record_index):
+      return iobase.DynamicSplitResultWithPosition(split_position)
@@ -17,6 +17,7 @@
 import logging
 import unittest
 
+from google.cloud.dataflow.io import iobase
 from google.cloud.dataflow.worker import inmemory
 
 
@@ -67,6 +68,77 @@ class InMemoryIO(unittest.TestCase):
       self.assertEqual(5, i)
       self.assertEqual(1, reader.get_progress().percent_complete)
 
+  def test_estimate_size(self):
+    source = inmemory.InMemorySource(['a', 'bb', 'ccc', 'dddd'],
+                                     coder=FakeCoder(), start_index=1)
+    self.assertEqual(9, source.estimate_size())
+
+  def test_split(self):
+    elements = ['a', 'bb', 'ccc', 'dddd', 'eeeee']
+    source = inmemory.InMemorySource(elements, coder=FakeCoder())
+    bundles = source.split(4)
+    self.assertEqual([(0, 3), (3, 4), (4, 5)],
+                     [(b.start_index, b.end_index) for b in bundles])
+    self.assertEqual([source], source.split(100))
+    bundles = inmemory.InMemorySource(
+        elements, coder=FakeCoder(), start_index=1, end_index=3).split(1)
+    self.assertEqual([(1, 2), (2, 3)],
+                     [(b.start_index, b.end_index) for b in bundles])
+
+  def test_progress_position(self):
+    source = inmemory.InMemorySource([1, 2, 3, 4], coder=FakeCoder(),
+                                     start_index=1)
+    with source.reader() as reader:
+      self.assertIsNone(reader.get_progress().position)
+      next(iter(reader))
+      self.assertEqual(1, reader.get_progress().position.record_index)
+
+  def split_request(self, record_index=None, percent_complete=None):
+    position = (iobase.ReaderPosition(record_index=record_index)
+                if record_index is not None else None)
+    return iobase.DynamicSplitRequest(
+        iobase.ReaderProgress(position=position,
+                              percent_complete=percent_complete))
+
+  def test_dynamic_split_at_record_index(self):
+    source = inmemory.InMemorySource(range(10), coder=FakeCoder())
+    read = []
+    with source.reader() as reader:
+      for item in reader:
+        read.append(item)
+        if len(read) == 2:
+          # Already read.
+          self.assertIsNone(
+              reader.request_dynamic_split(self.split_request(1)))
+          self.assertIsNone(
+              reader.request_dynamic_split(self.split_request(10)))
+          result = reader.request_dynamic_split(self.split_request(5))
+          self.assertEqual(5, result.stop_position.record_index)
+    self.assertEqual([10, 11, 12, 13, 14], read)
+
+  def test_dynamic_split_at_percent_complete(self):
+    source = inmemory.InMemorySource(range(10), coder=FakeCoder(),
+                                     start_index=2)
+    read = []
+    with source.reader() as reader:
+      for item in reader:
+        read.append(item)
+        if len(read) == 1:
+          self.assertIsNone(reader.request_dynamic_split(
+              self.split_request(percent_complete=1)))
+          result = reader.request_dynamic_split(
+              self.split_request(percent_complete=0.5))
+          self.assertEqual(6, result.stop_position.record_index)
+          self.assertEqual(0.25, reader.get_progress().percent_complete)
+    self.assertEqual([12, 13, 14, 15], read)
+
+  def test_dynamic_split_before_reading(self):
+    source = inmemory.InMemorySource(range(10), coder=FakeCoder())
+    with source.reader() as reader:
+      self.assertIsNone(reader.request_dynamic_split(self.split_request(5)))
+      self.assertEqual(10, len(list(reader)))
+
+
 if __name__ == '__main__':
   logging.getLogger().setLevel(logging.INFO)
   unittest.main()
@@ -0,0 +1,314 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A shuffle backed by files on the local disk.
+
+LocalShuffleWriter and LocalShuffleReader implement the interface of the
+shuffle client library (PyShuffleWriter and PyShuffleReader) over the files of
+a local directory, so that shuffle sources and sinks can be used without the
+Dataflow service, e.g. to measure and tune the shuffle code of the worker.
+
+Writers buffer the entries written, sort them by key and secondary key and
+spill them to run files in the directory. The first reader of the directory
+merges all the runs into a single sorted data file and an index of the offsets
+of the keys in it. Readers read chunks of entries from the memory-mapped data
+file.
+
+Each key is assigned a position, the same for all of its entries. The positions
+are 8 byte big-endian integers spread uniformly over their range, so that the
+fraction of a range of positions consumed can be interpolated. Reading a range
+of positions returns all the entries of the keys with positions in the range.
+
+A shuffle configuration naming the directory (see encode_config) makes the
+shuffle sources and sinks use the local shuffle.
+"""
+
+from __future__ import absolute_import
+
+import array
+import base64
+import cStringIO as StringIO
+import heapq
+import mmap
+import os
+import struct
+import threading
+import uuid
+
+
+# Prefix of a shuffle configuration naming a local shuffle directory.
+CONFIG_PREFIX = 'local:'
+
+# Size of the entries buffered by a writer before they are spilled to a run.
+RUN_BYTES = 64 << 20
+
+# Maximum size of the chunks of entries returned by a reader. A chunk contains
+# at least one entry.
+CHUNK_BYTES = 1 << 20
+
+_RUN_PREFIX = 'run-'
+_DATA_FILE = 'shuffle.data'
+_INDEX_FILE = 'shuffle.index'
+
+# Number of distinct key positions.
+_POSITION_RANGE = 1 << 64
+
+# A position continuing a read within the entries of a key: the key position,
+# this marker and the offset of the next entry in the data file.
+_CONTINUATION_MARKER = '\xff'
+_CONTINUATION_LENGTH = 17
+
+_LENGTH = struct.Struct('>I')
+_POSITION = struct.Struct('>Q')
+_ENCODED_POSITION_LENGTH = _LENGTH.pack(8)
+
+
+def encode_config(directory):
+  """Returns the shuffle configuration of a local shuffle directory.
+
+  The configuration is encoded like the ones sent by the service, and can be
+  used as the config_bytes of shuffle sources and sinks.
+  """
+  return base64.urlsafe_b64encode(CONFIG_PREFIX + directory).rstrip('=')
+
+
+def is_local_config(config):
+  """Returns True if a decoded shuffle configuration names a local shuffle."""
+  return config.startswith(CONFIG_PREFIX)
+
+
+def config_directory(config):
+  """Returns the directory named by a decoded local shuffle configuration."""
+  return config[len(CONFIG_PREFIX):]
+
+
+def _entry_end(buf, offset):
+  """Returns the offset after an entry (key, 2nd-key, value) in a buffer."""
+  for _ in range(3):
+    offset += 4 + _LENGTH.unpack_from(buf, offset)[0]
+  return offset
+
+
+def _iter_entries(buf):
+  """Yields the (key, secondary_key, encoded entry) of the entries in buf."""
+  offset = 0
+  end = len(buf)
+  while offset < end:
+    key_length = _LENGTH.unpack_from(buf, offset)[0]
+    key_end = offset + 4 + key_length
+    secondary_key_length = _LENGTH.unpack_from(buf, key_end)[0]
+    secondary_key_end = key_end + 4 + secondary_key_length
+    value_length = _LENGTH.unpack_from(buf, secondary_key_end)[0]
+    entry_end = secondary_key_end + 4 + value_length
+    yield (buf[offset + 4:key_end], buf[key_end + 4:secondary_key_end],
+           buf[offset:entry_end])
+    offset = entry_end
+
+
+def _map_file(path):
+  """Returns the contents of a file, memory-mapped unless empty."""
+  with open(path, 'rb') as f:
+    if not os.fstat(f.fileno()).st_size:
+      return ''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class LocalShuffleWriter(object):
+  """Writes entries to a local shuffle directory.
+
+  Several writers (e.g. one per work item) can write to the same directory,
+  but all of them must be closed before the directory is read.
+  """
+
+  def __init__(self, directory, run_bytes=RUN_BYTES):
+    self.directory = directory
+    self.run_bytes = run_bytes
+    if not os.path.exists(directory):
+      try:
+        os.makedirs(directory)
+      except OSError:
+        if not os.path.isdir(directory):
+          raise
+    self._writer_id = uuid.uuid4().hex
+    self._num_runs = 0
+    self._entries = []
+    self._bytes_buffered = 0
+
+  def Write(self, entries):  # pylint: disable=invalid-name
+    """Writes encoded entries without positions, as sent to the shuffle."""
+    for key, secondary_key, entry in _iter_entries(entries):
+      self._entries.append((key, secondary_key, len(self._entries), entry))
+    self._bytes_buffered += len(entries)
+    if self._bytes_buffered >= self.run_bytes:
+      self._spill()
+
+  def _spill(self):
+    if not self._entries:
+      return
+    # Entries with the same keys keep the order they were written in.
+    self._entries.sort()
+    path = os.path.join(self.directory, '%s%s-%06d' % (
+        _RUN_PREFIX, self._writer_id, self._num_runs))
+    with open(path + '.tmp', 'wb') as f:
+      for _, _, _, entry in self._entries:
+        f.write(entry)
+    os.rename(path + '.tmp', path)
+    self._num_runs += 1
+    self._entries = []
+    self._bytes_buffered = 0
+
+  def Close(self):  # pylint: disable=invalid-name
+    self._spill()
+
+
+def _merge_runs(directory):
+  """Merges the runs of a directory into the data and index files."""
+  run_names = sorted(name for name in os.listdir(directory)
+                     if name.startswith(_RUN_PREFIX) and
+                     not name.endswith('.tmp'))
+  runs = [_map_file(os.path.join(directory, name)) for name in run_names]
+
+  def entries_of_run(run_index, run):
+    for sequence, (key, secondary_key, entry) in enumerate(_iter_entries(run)):
+      yield key, secondary_key, run_index, sequence, entry
+
+  # The key offsets are followed by the size of the data file.
+  key_offsets = array.array('L')
+  suffix = '.%s.tmp' % uuid.uuid4().hex
+  data_path = os.path.join(directory, _DATA_FILE)
+  index_path = os.path.join(directory, _INDEX_FILE)
+  with open(data_path + suffix, 'wb') as f:
+    offset = 0
+    last_key = None
+    for key, _, _, _, entry in heapq.merge(
+        *[entries_of_run(i, run) for i, run in enumerate(runs)]):
+      if key != last_key or not key_offsets:
+        key_offsets.append(offset)
+        last_key = key
+      f.write(entry)
+      offset += len(entry)
+    key_offsets.append(offset)
+  with open(index_path + suffix, 'wb') as f:
+    key_offsets.tofile(f)
+  for run in runs:
+    if run:
+      run.close()
+  # Concurrent readers merge the same runs into the same files, so whichever
+  # rename happens last is as good as the others. The index is renamed last
+  # since its presence means the data file is complete.
+  os.rename(data_path + suffix, data_path)
+  os.rename(index_path + suffix, index_path)
+
+
+class LocalShuffleReader(object):
+  """Reads ranges of positions of a local shuffle directory."""
+
+  def __init__(self, directory, chunk_bytes=CHUNK_BYTES):
+    self.directory = directory
+    self.chunk_bytes = chunk_bytes
+    self._data = None
+    self._key_offsets = None
+    self._stride = None
+    self._lock = threading.Lock()
+
+  def _open(self):
+    with self._lock:
+      if self._data is not None:
+        return
+      index_path = os.path.join(self.directory, _INDEX_FILE)
+      if not os.path.exists(index_path):
+        _merge_runs(self.directory)
+      key_offsets = array.array('L')
+      with open(index_path, 'rb') as f:
+        key_offsets.fromstring(f.read())
+      self._key_offsets = key_offsets
+      num_keys = len(key_offsets) - 1
+      self._stride = _POSITION_RANGE // max(num_keys, 1)
+      self._data = _map_file(os.path.join(self.directory, _DATA_FILE))
+
+  @property
+  def num_keys(self):
+    self._open()
+    return len(self._key_offsets) - 1
+
+  def key_position(self, key_index):
+    """Returns the position of the key_index-th key."""
+    return _POSITION.pack(key_index * self._stride)
+
+  def _first_key_at_or_after(self, position):
+    """Returns the index of the first key with a position >= position."""
+    lo, hi = 0, len(self._key_offsets) - 1
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if self.key_position(mid) < position:
+        lo = mid + 1
+      else:
+        hi = mid
+    return lo
+
+  def _start(self, position):
+    """Returns the (key index, offset) of the first entry to read."""
+    if not position:
+      return 0, 0
+    if (len(position) == _CONTINUATION_LENGTH and
+        position[8] == _CONTINUATION_MARKER):
+      key_index = _POSITION.unpack(position[:8])[0] // self._stride
+      return key_index, _POSITION.unpack(position[9:])[0]
+    key_index = self._first_key_at_or_after(position)
+    return key_index, self._key_offsets[key_index]
+
+  def Read(self, start_position, end_position):  # pylint: disable=invalid-name
+    """Returns a chunk of the entries of a range of positions.
+
+    Args:
+      start_position: the position to read from, or '' to read from the
+        start. Either the position returned with the previous chunk, or any
+        byte string: the entries of the keys at or after it are read.
+      end_position: the position where reading stops (exclusive), or '' to
+        read until the end.
+
+    Returns:
+      A (chunk, next_position) tuple. The chunk contains encoded entries with
+      their positions. The next position is '' if the chunk is the last one of
+      the range.
+    """
+    self._open()
+    key_offsets = self._key_offsets
+    key_index, offset = self._start(start_position)
+    end_offset = key_offsets[
+        self._first_key_at_or_after(end_position) if end_position
+        else len(key_offsets) - 1]
+    data = self._data
+    chunk = StringIO.StringIO()
+    chunk_size = 0
+    while offset < end_offset and chunk_size < self.chunk_bytes:
+      while key_offsets[key_index + 1] <= offset:
+        key_index += 1
+      # Copies all the entries of the key that fit in the chunk at once.
+      key_end = min(key_offsets[key_index + 1], end_offset)
+      prefix = _ENCODED_POSITION_LENGTH + self.key_position(key_index)
+      while offset < key_end and chunk_size < self.chunk_bytes:
+        entry_end = _entry_end(data, offset)
+        chunk.write(prefix)
+        chunk.write(data[offset:entry_end])
+        chunk_size += len(prefix) + entry_end - offset
+        offset = entry_end
+    if offset >= end_offset:
+      next_position = ''
+    elif offset == key_offsets[key_index + 1]:
+      next_position = self.key_position(key_index + 1)
+    else:
+      next_position = (self.key_position(key_index) + _CONTINUATION_MARKER +
+                       _POSITION.pack(offset))
+    return chunk.getvalue(), next_position
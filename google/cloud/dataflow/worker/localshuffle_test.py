@@ -0,0 +1,168 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the local disk-backed shuffle."""
+
+import cStringIO as StringIO
+import logging
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from google.cloud.dataflow.coders import coders
+from google.cloud.dataflow.worker import localshuffle
+from google.cloud.dataflow.worker.shuffle import GroupedShuffleSource
+from google.cloud.dataflow.worker.shuffle import ShuffleEntry
+from google.cloud.dataflow.worker.shuffle import ShuffleSink
+from google.cloud.dataflow.worker.shuffle import UngroupedShuffleSource
+
+
+def encode_entries(entries):
+  stream = StringIO.StringIO()
+  for key, secondary_key, value in entries:
+    ShuffleEntry(key, secondary_key, value, position=None).to_bytes(
+        stream, with_position=False)
+  return stream.getvalue()
+
+
+def decode_chunk(chunk):
+  entries = []
+  stream = StringIO.StringIO(chunk)
+  while stream.tell() < len(chunk):
+    entry = ShuffleEntry.from_stream(stream)
+    entries.append(
+        (entry.position, entry.key, entry.secondary_key, entry.value))
+  return entries
+
+
+def read_range(reader, start_position='', end_position=''):
+  """Reads all the chunks of a range, returning (position, k, 2nd-k, v)."""
+  entries = []
+  position = start_position
+  while True:
+    chunk, position = reader.Read(position, end_position)
+    entries.extend(decode_chunk(chunk))
+    if not position:
+      return entries
+
+
+class LocalShuffleTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write(self, *entry_lists, **kwargs):
+    for entries in entry_lists:
+      writer = localshuffle.LocalShuffleWriter(self.directory, **kwargs)
+      writer.Write(encode_entries(entries))
+      writer.Close()
+
+  def test_entries_sorted_by_key_and_secondary_key(self):
+    self.write([('b', '2', 'b2'), ('a', '1', 'a1'), ('b', '1', 'b1')],
+               [('a', '0', 'a0'), ('c', '0', 'c0'), ('b', '11', 'b11')])
+    reader = localshuffle.LocalShuffleReader(self.directory)
+    self.assertEqual(
+        [('a', '0', 'a0'), ('a', '1', 'a1'), ('b', '1', 'b1'),
+         ('b', '11', 'b11'), ('b', '2', 'b2'), ('c', '0', 'c0')],
+        [entry[1:] for entry in read_range(reader)])
+
+  def test_external_merge_of_runs(self):
+    entries = [('%03d' % random.randint(0, 100), '%03d' % i, str(i))
+               for i in range(1000)]
+    # Every few entries written are spilled to a separate run.
+    writer = localshuffle.LocalShuffleWriter(self.directory, run_bytes=100)
+    for i in range(0, len(entries), 10):
+      writer.Write(encode_entries(entries[i:i + 10]))
+    writer.Close()
+    self.assertGreater(len(os.listdir(self.directory)), 50)
+    reader = localshuffle.LocalShuffleReader(self.directory)
+    self.assertEqual(sorted(entries),
+                     [entry[1:] for entry in read_range(reader)])
+
+  def test_positions_shared_by_the_entries_of_a_key(self):
+    self.write([('a', '1', 'x'), ('a', '2', 'y'), ('b', '', 'z'),
+                ('c', '', 'w'), ('d', '', 'v')])
+    reader = localshuffle.LocalShuffleReader(self.directory)
+    positions = [entry[0] for entry in read_range(reader)]
+    self.assertEqual(positions[0], positions[1])
+    self.assertEqual(['\x00' * 8, '\x40' + '\x00' * 7, '\x80' + '\x00' * 7,
+                      '\xc0' + '\x00' * 7], sorted(set(positions)))
+
+  def test_read_ranges(self):
+    self.write([(k, '', k + '-value') for k in 'abcdefgh'])
+    reader = localshuffle.LocalShuffleReader(self.directory)
+    positions = [entry[0] for entry in read_range(reader)]
+    self.assertEqual(
+        ['c', 'd', 'e'],
+        [entry[1] for entry in read_range(reader, positions[2], positions[5])])
+    self.assertEqual(
+        ['a', 'b'], [entry[1] for entry in read_range(reader, '', positions[2])])
+    self.assertEqual(
+        ['g', 'h'], [entry[1] for entry in read_range(reader, positions[6])])
+    # Arbitrary positions start and end at the next key.
+    self.assertEqual(
+        ['c', 'd'],
+        [entry[1] for entry in read_range(
+            reader, positions[1] + '\x00', positions[3][:7] + '\x01')])
+    self.assertEqual([], read_range(reader, positions[3], positions[3]))
+
+  def test_chunks_split_within_a_key(self):
+    self.write([('a', '%03d' % i, 'x' * 10) for i in range(100)] +
+               [('b', '', 'y')])
+    reader = localshuffle.LocalShuffleReader(self.directory, chunk_bytes=100)
+    num_chunks = 0
+    entries = []
+    position = ''
+    while True:
+      chunk, position = reader.Read(position, '')
+      num_chunks += 1
+      entries.extend(decode_chunk(chunk))
+      if not position:
+        break
+    self.assertGreater(num_chunks, 10)
+    self.assertEqual(101, len(entries))
+    self.assertEqual(['%03d' % i for i in range(100)],
+                     [entry[2] for entry in entries[:100]])
+
+  def test_empty_shuffle(self):
+    self.write([])
+    reader = localshuffle.LocalShuffleReader(self.directory)
+    self.assertEqual(0, reader.num_keys)
+    self.assertEqual(('', ''), reader.Read('', ''))
+
+  def test_shuffle_sources_and_sinks(self):
+    config = localshuffle.encode_config(self.directory)
+    sink = ShuffleSink(config_bytes=config, coder=coders.BytesCoder())
+    with sink.writer() as writer:
+      for key, value in [('b', '1'), ('a', '2'), ('b', '3'), ('a', '4')]:
+        writer.Write(key, '', value)
+    source = GroupedShuffleSource(config_bytes=config,
+                                  coder=coders.BytesCoder())
+    with source.reader() as reader:
+      self.assertEqual([('a', ['2', '4']), ('b', ['1', '3'])],
+                       [(key, list(values)) for key, values in reader])
+    source = UngroupedShuffleSource(config_bytes=config,
+                                    coder=coders.BytesCoder())
+    with source.reader() as reader:
+      self.assertEqual(['2', '4', '1', '3'], list(reader))
+
+
+if __name__ == '__main__':
+  logging.getLogger().setLevel(logging.INFO)
+  unittest.main()
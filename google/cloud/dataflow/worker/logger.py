@@ -14,18 +14,64 @@
 
 """Python Dataflow worker logging."""
 
+import copy
 import json
 import logging
+import Queue
 import threading
+import time
 import traceback
 
+from google.cloud.dataflow.utils.counters import Counter
+
+
+# Maximum number of records waiting to be written by the worker log handler.
+# Further records are dropped until the writing thread catches up.
+MAX_QUEUED_RECORDS = 10000
+
+# Records below WARNING with the same step and message format are all written
+# up to this many times per interval. Further ones are sampled, one in
+# REPEATED_RECORDS_SAMPLING_PERIOD being written.
+MAX_REPEATED_RECORDS_PER_INTERVAL = 100
+REPEATED_RECORDS_INTERVAL_SECS = 60
+REPEATED_RECORDS_SAMPLING_PERIOD = 100
+
 
 # Per-thread worker information. This is used only for logging to set
 # context information that changes while work items get executed:
 # work_item_id, step_name, stage_name.
+#
+# While a map task executes, the step changes with every call from one fused
+# operation to the next. Instead of a step_name the executor sets the
+# state_sampler of the map task, whose current state (switched anyway to time
+# each step) tells the step when a record is actually logged.
 per_thread_worker_data = threading.local()
 
 
+def _current_context():
+  """Returns the work item, stage and step records are currently logged in."""
+  context = {}
+  if hasattr(per_thread_worker_data, 'work_item_id'):
+    context['work'] = per_thread_worker_data.work_item_id
+  if hasattr(per_thread_worker_data, 'stage_name'):
+    context['stage'] = per_thread_worker_data.stage_name
+  step_name = _current_step_name()
+  if step_name is not None:
+    context['step'] = step_name
+  return context
+
+
+def _current_step_name():
+  step_name = getattr(per_thread_worker_data, 'step_name', None)
+  if step_name is not None:
+    return step_name
+  state_sampler = getattr(per_thread_worker_data, 'state_sampler', None)
+  if state_sampler is not None:
+    state = state_sampler.current_state
+    if state is not None:
+      return state.step_name
+
+
 class PerThreadLoggingContext(object):
   """A context manager to add per thread attributes."""
 
@@ -104,7 +150,7 @@ class JsonLogFormatter(logging.Formatter):
         record.levelname if record.levelname != 'WARNING' else 'WARN')
     # Prepare the actual message using the message formatting string and the
     # positional arguments as they have been used in the log call.
-    output['message'] = record.msg % record.args
+    output['message'] = record.msg % record.args if record.args else record.msg
     # The thread ID is logged as a combination of the process ID and thread ID
     # since workers can run in multiple processes.
     output['thread'] = '%s:%s' % (record.process, record.thread)
@@ -113,13 +159,12 @@ class JsonLogFormatter(logging.Formatter):
     output['worker'] = self.worker_id
     # Stage, step and work item ID come from thread local storage since they
     # change with every new work item leased for execution. If there is no
-    # work item ID then we make sure the step is undefined too.
-    if hasattr(per_thread_worker_data, 'work_item_id'):
-      output['work'] = getattr(per_thread_worker_data, 'work_item_id')
-    if hasattr(per_thread_worker_data, 'stage_name'):
-      output['stage'] = getattr(per_thread_worker_data, 'stage_name')
-    if hasattr(per_thread_worker_data, 'step_name'):
-      output['step'] = getattr(per_thread_worker_data, 'step_name')
+    # work item ID then we make sure the step is undefined too. Records written
+    # asynchronously carry the context captured when they were logged.
+    context = getattr(record, 'worker_context', None)
+    if context is None:
+      context = _current_context()
+    output.update(context)
     # All logging happens using the root logger. We will add the basename of the
     # file and the function name where the logging happened to make it easier
     # to identify who generated the record.
@@ -129,16 +174,124 @@ class JsonLogFormatter(logging.Formatter):
     if record.exc_info:
       output['exception'] = ''.join(
           traceback.format_exception(*record.exc_info))
+    elif getattr(record, 'exc_text', None):
+      output['exception'] = record.exc_text
 
     return json.dumps(output)
 
 
+class AsyncJsonLogHandler(logging.Handler):
+  """A handler writing JSON records to a file from a background thread.
+
+  Logging threads only capture the context of a record and queue it; the
+  records are formatted by a JsonLogFormatter and written by a separate
+  thread. At most max_queued_records records are kept in memory, and
+  repeated records below WARNING are sampled (see
+  MAX_REPEATED_RECORDS_PER_INTERVAL). Records not written are counted by
+  dropped_records_counter.
+  """
+
+  _STOP = object()
+
+  def __init__(self, log_path, job_id, worker_id,
+               max_queued_records=MAX_QUEUED_RECORDS):
+    super(AsyncJsonLogHandler, self).__init__()
+    self.setFormatter(JsonLogFormatter(job_id, worker_id))
+    self.dropped_records_counter = Counter('dropped-log-records', Counter.SUM)
+    self._stream = open(log_path, 'a')
+    self._queue = Queue.Queue(max_queued_records)
+    # Maps (step, message format) to the number of records logged in the
+    # current interval. Cleared at the end of each interval.
+    self._repeated_records = {}
+    self._interval_end = 0
+    self._thread = threading.Thread(target=self._run, name='AsyncLogWriter')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _should_drop(self, record, context):
+    if record.levelno >= logging.WARNING:
+      return False
+    now = time.time()
+    if now >= self._interval_end:
+      self._repeated_records.clear()
+      self._interval_end = now + REPEATED_RECORDS_INTERVAL_SECS
+    # Messages which are not format strings (e.g. objects) share one key.
+    key = (context.get('step'),
+           record.msg if isinstance(record.msg, basestring) else None)
+    count = self._repeated_records.get(key, 0) + 1
+    self._repeated_records[key] = count
+    return (count > MAX_REPEATED_RECORDS_PER_INTERVAL and
+            count % REPEATED_RECORDS_SAMPLING_PERIOD != 0)
+
+  def emit(self, record):
+    # Called with the handler lock held, by the thread logging the record.
+    context = _current_context()
+    if self._should_drop(record, context):
+      self.dropped_records_counter.update(1)
+      return
+    # The message and exception are rendered now since their arguments may
+    # change before the record is written. This is much cheaper than the JSON
+    # encoding and the write. The record is copied since it is shared with the
+    # other handlers of the logger.
+    record = copy.copy(record)
+    record.worker_context = context
+    record.msg = record.getMessage()
+    record.args = None
+    if record.exc_info:
+      record.exc_text = ''.join(traceback.format_exception(*record.exc_info))
+      record.exc_info = None
+    try:
+      self._queue.put_nowait(record)
+    except Queue.Full:
+      self.dropped_records_counter.update(1)
+
+  def _run(self):
+    while True:
+      record = self._queue.get()
+      try:
+        if record is self._STOP:
+          return
+        try:
+          self._stream.write(self.format(record) + '\n')
+          if self._queue.empty():
+            self._stream.flush()
+        except Exception:  # pylint: disable=broad-except
+          self.handleError(record)
+      finally:
+        self._queue.task_done()
+
+  def flush(self):
+    """Waits until all the queued records are written."""
+    self._queue.join()
+    self._stream.flush()
+
+  def close(self):
+    if self._thread.is_alive():
+      self._queue.put(self._STOP)
+      self._thread.join()
+    self._stream.close()
+    super(AsyncJsonLogHandler, self).close()
+
+  def reset_dropped_records_counter(self):
+    """Counts the records dropped from now on with a new counter.
+
+    Returns:
+      The new counter.
+    """
+    self.dropped_records_counter = Counter('dropped-log-records', Counter.SUM)
+    return self.dropped_records_counter
+
+
+# The handler writing the logs of the worker, set by initialize().
+worker_log_handler = None
+
+
 def initialize(job_id, worker_id, log_path):
   """Initialize root logger so that we log JSON to a file and text to stdout."""
 
-  file_handler = logging.FileHandler(log_path)
-  file_handler.setFormatter(JsonLogFormatter(job_id, worker_id))
-  logging.getLogger().addHandler(file_handler)
+  global worker_log_handler  # pylint: disable=global-statement
+  worker_log_handler = AsyncJsonLogHandler(log_path, job_id, worker_id)
+  logging.getLogger().addHandler(worker_log_handler)
 
   # Set default level to INFO to avoid logging various DEBUG level log calls
   # sprinkled throughout the code.
@@ -17,10 +17,12 @@
 import json
 import logging
 import sys
+import tempfile
 import threading
 import unittest
 
 from google.cloud.dataflow.worker import logger
+from google.cloud.dataflow.worker import statesampler
 
 
 class PerThreadLoggingContextTest(unittest.TestCase):
@@ -108,6 +110,19 @@ class JsonLogFormatterTest(unittest.TestCase):
         {'work': 'workitem', 'stage': 'stage', 'step': 'step'})
     self.assertEqual(log_output, expected_output)
 
+  def test_record_with_step_of_state_sampler(self):
+    sampler = statesampler.StateSampler()
+    formatter = logger.JsonLogFormatter(job_id='jobid', worker_id='workerid')
+    record = self.create_log_record(**self.SAMPLE_RECORD)
+    with logger.PerThreadLoggingContext(state_sampler=sampler):
+      self.assertNotIn('step', json.loads(formatter.format(record)))
+      with sampler.scoped_state('step1-process', 'step1'):
+        self.assertEqual('step1', json.loads(formatter.format(record))['step'])
+        with sampler.scoped_state('step2-process', 'step2'):
+          self.assertEqual('step2',
+                           json.loads(formatter.format(record))['step'])
+        self.assertEqual('step1', json.loads(formatter.format(record))['step'])
+
   def test_exception_record(self):
     formatter = logger.JsonLogFormatter(job_id='jobid', worker_id='workerid')
     try:
@@ -123,6 +138,104 @@ class JsonLogFormatterTest(unittest.TestCase):
     self.assertNotEqual(exn_output.find('logger_test.py'), -1)
     self.assertEqual(log_output, self.SAMPLE_OUTPUT)
 
+class AsyncJsonLogHandlerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.log_path = tempfile.NamedTemporaryFile(delete=False).name
+    self.handler = None
+
+  def tearDown(self):
+    if self.handler is not None:
+      self.handler.close()
+
+  def create_handler(self, **kwargs):
+    self.handler = logger.AsyncJsonLogHandler(
+        self.log_path, 'jobid', 'workerid', **kwargs)
+    return self.handler
+
+  def create_record(self, msg, *args, **kwargs):
+    return logging.LogRecord('name', kwargs.get('level', logging.INFO),
+                             'file.py', 1, msg, args, None)
+
+  def read_log(self):
+    self.handler.flush()
+    with open(self.log_path) as f:
+      return [json.loads(line) for line in f]
+
+  def test_records_keep_context_and_arguments(self):
+    handler = self.create_handler()
+    values = ['first']
+    with logger.PerThreadLoggingContext(work_item_id='workitem',
+                                        step_name='step'):
+      handler.handle(self.create_record('values: %s', values))
+    values.append('second')
+    handler.handle(self.create_record('100%'))
+    records = self.read_log()
+    self.assertEqual(["values: ['first']", '100%'],
+                     [r['message'] for r in records])
+    self.assertEqual(('workitem', 'step'),
+                     (records[0]['work'], records[0]['step']))
+    self.assertNotIn('step', records[1])
+    self.assertEqual(0, handler.dropped_records_counter.total)
+
+  def test_record_shared_with_other_handlers_is_unchanged(self):
+    handler = self.create_handler()
+    try:
+      raise ValueError('failed')
+    except ValueError:
+      exc_info = sys.exc_info()
+    record = logging.LogRecord('name', logging.ERROR, 'file.py', 1,
+                               'value: %s', ('x',), exc_info)
+    handler.handle(record)
+    # Handlers running after this one still see the original record.
+    self.assertEqual('value: %s', record.msg)
+    self.assertEqual(('x',), record.args)
+    self.assertIs(exc_info, record.exc_info)
+    records = self.read_log()
+    self.assertEqual('value: x', records[0]['message'])
+    self.assertIn('ValueError: failed', records[0]['exception'])
+
+  def test_repeated_records_are_sampled(self):
+    handler = self.create_handler()
+    num_records = logger.MAX_REPEATED_RECORDS_PER_INTERVAL + 1000
+    for i in range(num_records):
+      handler.handle(self.create_record('element %d', i))
+    handler.handle(self.create_record('other message'))
+    for i in range(5):
+      handler.handle(self.create_record('warning %d', i,
+                                        level=logging.WARNING))
+    records = self.read_log()
+    num_sampled = 1000 // logger.REPEATED_RECORDS_SAMPLING_PERIOD
+    self.assertEqual(
+        logger.MAX_REPEATED_RECORDS_PER_INTERVAL + num_sampled + 1 + 5,
+        len(records))
+    self.assertEqual(1000 - num_sampled, handler.dropped_records_counter.total)
+
+  def test_records_dropped_when_queue_is_full(self):
+    handler = self.create_handler(max_queued_records=1)
+    writing = threading.Event()
+    resume = threading.Event()
+    original_format = handler.format
+
+    def blocking_format(record):
+      writing.set()
+      resume.wait()
+      return original_format(record)
+
+    handler.format = blocking_format
+    handler.handle(self.create_record('written first'))
+    writing.wait()
+    handler.handle(self.create_record('queued'))
+    handler.handle(self.create_record('dropped'))
+    resume.set()
+    self.assertEqual(['written first', 'queued'],
+                     [r['message'] for r in self.read_log()])
+    self.assertEqual(1, handler.dropped_records_counter.total)
+    counter = handler.reset_dropped_records_counter()
+    self.assertEqual(0, counter.total)
+    self.assertIs(counter, handler.dropped_records_counter)
+
+
 if __name__ == '__main__':
   logging.getLogger().setLevel(logging.INFO)
   unittest.main()
@@ -20,6 +20,7 @@ source, write to a sink, parallel do, etc.
 
 import base64
 import collections
+import logging
 
 from google.cloud.dataflow import coders
 from google.cloud.dataflow import io
@@ -343,6 +344,30 @@ def get_coder_from_spec(coder_spec, kv_pair=False):
     return coder
 
 
+def get_output_coders(work):
+  """Returns the coders of the values of the outputs of an instruction.
+
+  The coders are only used to estimate the size of the output values, so an
+  output whose codec cannot be parsed gets None instead of failing the work
+  item.
+  """
+  output_coders = []
+  for output in work.outputs:
+    coder = None
+    if output.codec:
+      codec_specs = {p.key: from_json_value(p.value)
+                     for p in output.codec.additionalProperties}
+      try:
+        coder = get_coder_from_spec(codec_specs)
+      except Exception:  # pylint: disable=broad-except
+        logging.debug('Could not parse the codec of output %s of %s.',
+                      output.name, work.name, exc_info=True)
+      if isinstance(coder, coders.WindowedValueCoder):
+        coder = coder.wrapped_value_coder
+    output_coders.append(coder)
+  return output_coders
+
+
 def get_read_work_item(work, env, context):
   """Parses a read parallel instruction into the appropriate Worker* object."""
   specs = {p.key: from_json_value(p.value)
@@ -527,12 +552,16 @@ class MapTask(object):
       within the map task.
     stage_name: The name of this map task execution stage.
     step_names: The names of the step corresponding to each map task operation.
+    output_coders: For each map task operation, the list of the coders of the
+      values of its outputs (None for the outputs whose coder is unknown), or
+      None if no coder is known.
   """
 
-  def __init__(self, operations, stage_name, step_names):
+  def __init__(self, operations, stage_name, step_names, output_coders=None):
     self.operations = operations
     self.stage_name = stage_name
     self.step_names = step_names
+    self.output_coders = output_coders
 
   def __str__(self):
     return '<%s %s steps=%s>' % (self.__class__.__name__, self.stage_name,
@@ -558,7 +587,6 @@ class WorkerEnvironment(object):
     self.register_source_parser(WorkerEnvironment._parse_concat_source)
     self.register_source_parser(WorkerEnvironment._parse_windmill_source)
     # TODO(silviuc): Implement support for PartitioningShuffleSource
-    # TODO(silviuc): Implement support for AvroSource
     # TODO(silviuc): Implement support for custom sources
     self.register_sink_parser(WorkerEnvironment._parse_text_sink)
     self.register_sink_parser(WorkerEnvironment._parse_avro_sink)
@@ -656,15 +684,20 @@ class WorkerEnvironment(object):
   @staticmethod
   def _parse_avro_source(specs, unused_codec_specs, unused_context):
     if specs['@type'] == 'AvroSource':
-      # Note that the worker does not really implement AVRO yet.It takes
-      # advantage that both reading and writing is done through the worker to
-      # choose a supported format (text files with one pickled object per line).
-      return io.TextFileSource(
+      # Avro files are only used for intermediate data written and read by the
+      # worker itself. Each record is an Avro bytes value holding one pickled
+      # object.
+      start_offset = None
+      if 'start_offset' in specs:
+        start_offset = int(specs['start_offset']['value'])
+      end_offset = None
+      if 'end_offset' in specs:
+        end_offset = int(specs['end_offset']['value'])
+      return io.AvroFileSource(
           file_path=specs['filename']['value'],
-          start_offset=None,
-          end_offset=None,
-          strip_trailing_newlines=True,
-          coder=coders.Base64PickleCoder())
+          start_offset=start_offset,
+          end_offset=end_offset,
+          coder=coders.PickleCoder())
 
   @staticmethod
   def _parse_big_query_source(specs, codec_specs, unused_context):
@@ -711,14 +744,11 @@ class WorkerEnvironment(object):
 
   @staticmethod
   def _parse_avro_sink(specs, unused_codec_specs, unused_context):
-    # Note that the worker does not really implement AVRO yet.It takes
-    # advantage that both reading and writing is done through the worker to
-    # choose a supported format (text files with one pickled object per line).
+    # See _parse_avro_source for the format of the records.
     if specs['@type'] == 'AvroSink':
-      return io.TextFileSink(
+      return io.AvroFileSink(
           specs['filename']['value'],
-          append_trailing_newlines=True,
-          coder=coders.Base64PickleCoder())
+          coder=coders.PickleCoder())
 
   @staticmethod
   def _parse_pubsub_sink(specs, codec_specs, context):
@@ -759,10 +789,12 @@ def decode_map_task(map_task_proto, env=WorkerEnvironment(),
   operations = []
   stage_name = map_task_proto.stageName
   step_names = []
+  output_coders = []
   context.worker_environment = env
   # Parse the MapTask instructions.
   for work in map_task_proto.instructions:
     step_names.append(work.name)
+    output_coders.append(get_output_coders(work))
     if work.read is not None:
       operations.append(get_read_work_item(work, env, context))
     elif work.write is not None:
@@ -775,4 +807,4 @@ def decode_map_task(map_task_proto, env=WorkerEnvironment(),
       operations.append(get_partial_gbk_work_item(work, env, context))
     else:
       raise NotImplementedError('Unknown instruction: %r' % work)
-  return MapTask(operations, stage_name, step_names)
+  return MapTask(operations, stage_name, step_names, output_coders)
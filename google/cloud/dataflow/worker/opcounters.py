@@ -16,33 +16,77 @@
 
 from __future__ import absolute_import
 
+import logging
 from numbers import Number
+import random
 
 from google.cloud.dataflow.utils.counters import Counter
 
 
+# Every element is sampled for the mean byte count until this many elements
+# were seen. Afterwards elements are sampled at a rate decaying with the number
+# of elements seen, down to one in MAX_SAMPLING_PERIOD elements.
+NUM_INITIAL_SAMPLES = 10
+MAX_SAMPLING_PERIOD = 1000
+
+
 class OperationCounters(object):
-  """The set of basic counters to attach to an Operation."""
+  """The set of basic counters to attach to an Operation.
 
-  def __init__(self, step_name, output_index=0):
+  The mean byte count is estimated from the encoded size of a sample of the
+  elements, as given by the coder of the output. Estimating the size of every
+  element would cost as much as encoding it. Without a coder, or if the coder
+  cannot estimate the size of an element, its size is guessed with
+  _guess_size().
+  """
+
+  def __init__(self, step_name, output_index=0, coder=None):
     self.element_counter = Counter(
         '%s-out%d-ElementCount' % (step_name, output_index), Counter.SUM)
     self.mean_byte_counter = Counter(
         '%s-out%d-MeanByteCount' % (step_name, output_index), Counter.MEAN)
+    # The coder of the output values, as given by the map task, or None.
+    self.coder = coder
+    self._sample_countdown = 1
 
   def update(self, windowed_value):
     """Add one value to this counter."""
-    if isinstance(windowed_value.value, Number):
-      size = 4  # numbers take 4 bytes
-    else:
+    self.element_counter.update(1)
+    self._sample_countdown -= 1
+    if self._sample_countdown <= 0:
+      self._sample(windowed_value.value)
+
+  def _sample(self, value):
+    size = None
+    if self.coder is not None:
       try:
-        # len() gives the right answer for at least strings
-        size = len(windowed_value.value)
-      except (AttributeError, TypeError):
-        # it's an object, not data, and there's nothing to count.
-        size = 0
+        size = self.coder.estimate_size(value)
+      except Exception:  # pylint: disable=broad-except
+        # The value may not be encodable at all, e.g. if it is consumed by the
+        # next operation of the work item only.
+        logging.debug('Could not estimate the size of %r with %s.',
+                      value, self.coder, exc_info=True)
+    if size is None:
+      size = self._guess_size(value)
     self.mean_byte_counter.update(size)
-    self.element_counter.update(1)
+    period = min(
+        MAX_SAMPLING_PERIOD,
+        1 + self.element_counter.total // NUM_INITIAL_SAMPLES)
+    # Randomize the gap between samples so that periodic data is not sampled
+    # at the same phase.
+    self._sample_countdown = random.randint(1, 2 * period - 1)
+
+  @staticmethod
+  def _guess_size(value):
+    """Returns a cheap guess of the encoded size of a value."""
+    if isinstance(value, Number):
+      return 4  # numbers take 4 bytes
+    try:
+      # len() gives the right answer for at least strings
+      return len(value)
+    except (AttributeError, TypeError):
+      # it's an object, not data, and there's nothing to count.
+      return 0
 
   def __iter__(self):
     """Iterator over all our counters."""
@@ -17,7 +17,11 @@
 import logging
 import unittest
 
+import mock
+
+from google.cloud.dataflow import coders
 from google.cloud.dataflow.transforms.window import GlobalWindows
+from google.cloud.dataflow.worker import opcounters
 from google.cloud.dataflow.worker.opcounters import OperationCounters
 
 
@@ -30,49 +34,63 @@ class OperationCountersTest(unittest.TestCase):
     self.assertEqual(expected_total_bytes, opcounts.mean_byte_counter.total)
 
   def test_update_int(self):
-    opcounts = OperationCounters('some-name')
+    opcounts = OperationCounters('some-name', coder=coders.VarIntCoder())
     self.verify_counters(opcounts, 0, 0)
     opcounts.update(GlobalWindows.WindowedValue(1))
-    self.verify_counters(opcounts, 1, 4)  # an int is 4 bytes
+    self.verify_counters(opcounts, 1, 1)  # a small int is encoded as 1 byte
+    opcounts.update(GlobalWindows.WindowedValue(1 << 20))
+    self.verify_counters(opcounts, 2, 4)
 
   def test_update_str(self):
-    opcounts = OperationCounters('some-name')
+    opcounts = OperationCounters('some-name', coder=coders.BytesCoder())
     self.verify_counters(opcounts, 0, 0)
     opcounts.update(GlobalWindows.WindowedValue('abcde'))
     self.verify_counters(opcounts, 1, 5)  # the string is 5 bytes long
 
-  def test_update_old_object(self):
-    class OldClassThatDoesNotImplementLen:  # pylint: disable=old-style-class
-
-      def __init__(self):
-        pass
-
-    opcounts = OperationCounters('some-name')
-    self.verify_counters(opcounts, 0, 0)
-    obj = OldClassThatDoesNotImplementLen()
-    opcounts.update(GlobalWindows.WindowedValue(obj))
-    self.verify_counters(opcounts, 1, 0)  # objects contribute no length
-
-  def test_update_new_object(self):
-    class ObjectThatDoesNotImplementLen(object):
-
-      def __init__(self):
-        pass
-
+  def test_update_without_coder(self):
     opcounts = OperationCounters('some-name')
     self.verify_counters(opcounts, 0, 0)
+    # Without a coder the sizes are guessed: 4 bytes for numbers, len() for
+    # sized values and 0 for other objects.
+    opcounts.update(GlobalWindows.WindowedValue(1 << 40))
+    self.verify_counters(opcounts, 1, 4)
+    opcounts.update(GlobalWindows.WindowedValue('abcde'))
+    self.verify_counters(opcounts, 2, 9)
+    opcounts.update(GlobalWindows.WindowedValue(object()))
+    self.verify_counters(opcounts, 3, 9)
 
-    obj = ObjectThatDoesNotImplementLen()
-    opcounts.update(GlobalWindows.WindowedValue(obj))
-    self.verify_counters(opcounts, 1, 0)  # objects contribute no length
+  def test_update_value_that_cannot_be_encoded(self):
+    opcounts = OperationCounters('some-name', coder=coders.VarIntCoder())
+    opcounts.update(GlobalWindows.WindowedValue('not an int'))
+    # The size is guessed instead.
+    self.verify_counters(opcounts, 1, len('not an int'))
 
   def test_update_multiple(self):
-    opcounts = OperationCounters('some-name')
+    opcounts = OperationCounters('some-name', coder=coders.BytesCoder())
     self.verify_counters(opcounts, 0, 0)
     opcounts.update(GlobalWindows.WindowedValue('abcde'))
     opcounts.update(GlobalWindows.WindowedValue('defghij'))
     self.verify_counters(opcounts, 2, 12)  # the strings add up to 12 characters
 
+  def test_sampling_rate_decays(self):
+    coder = coders.BytesCoder()
+    opcounts = OperationCounters('some-name', coder=coder)
+    with mock.patch.object(coder, 'estimate_size',
+                           wraps=coder.estimate_size) as estimate_size:
+      for _ in range(opcounters.NUM_INITIAL_SAMPLES - 1):
+        opcounts.update(GlobalWindows.WindowedValue('abc'))
+      self.assertEqual(opcounters.NUM_INITIAL_SAMPLES - 1,
+                       estimate_size.call_count)
+      for _ in range(100000):
+        opcounts.update(GlobalWindows.WindowedValue('abc'))
+    self.assertEqual(100000 + opcounters.NUM_INITIAL_SAMPLES - 1,
+                     opcounts.element_counter.total)
+    samples = opcounts.mean_byte_counter.elements
+    self.assertEqual(samples, estimate_size.call_count)
+    self.assertLess(samples, 1000)
+    self.assertGreater(samples, 100000 / opcounters.MAX_SAMPLING_PERIOD)
+    self.assertEqual(3 * samples, opcounts.mean_byte_counter.total)
+
 
 if __name__ == '__main__':
   logging.getLogger().setLevel(logging.INFO)
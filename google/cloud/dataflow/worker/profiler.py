@@ -0,0 +1,117 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Profiling of the execution of work items with cProfile.
+
+The stats of each profiled work item are saved in the format written by
+pstats.Stats.dump_stats() so they can be loaded with pstats after being
+copied from the profile location, e.g.:
+
+  gsutil cp gs://bucket/temp/profiles/<stage>-<work item id>.prof .
+  python -c "import pstats; pstats.Stats('<file>').print_stats(20)"
+"""
+
+from __future__ import absolute_import
+
+import cProfile
+import logging
+import marshal
+import os
+import pstats
+import random
+import StringIO
+
+from google.cloud.dataflow.utils import retry
+
+
+# Number of functions listed in the logged summary of a profile.
+DEFAULT_SUMMARY_ENTRIES = 20
+
+
+def should_profile(profile_fraction):
+  """Returns True with probability profile_fraction."""
+  return profile_fraction > 0 and random.random() < profile_fraction
+
+
+@retry.with_exponential_backoff()
+def _write_file(path, contents):
+  if path.startswith('gs://'):
+    from google.cloud.dataflow.io import gcsio  # pylint: disable=g-import-not-at-top
+    f = gcsio.GcsIO().open(path, 'wb')
+  else:
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+      os.makedirs(directory)
+    f = open(path, 'wb')
+  try:
+    f.write(contents)
+  finally:
+    f.close()
+
+
+class Profile(object):
+  """Context manager profiling the execution of a block with cProfile.
+
+  On exit the stats are written to a file named after the profile id in the
+  profile location and the functions with the highest cumulative time are
+  logged.
+  """
+
+  def __init__(self, profile_id, profile_location=None,
+               summary_entries=DEFAULT_SUMMARY_ENTRIES):
+    """Initializes a profile.
+
+    Args:
+      profile_id: a name identifying the profile, used as the file name of the
+        stats.
+      profile_location: the directory (local or GCS) the stats are written to,
+        or None to only log the summary.
+      summary_entries: number of functions listed in the logged summary.
+    """
+    self.profile_id = profile_id
+    self.profile_location = profile_location
+    self.summary_entries = summary_entries
+    self.profile_path = None
+    self.profiler = None
+    self.stats = None
+
+  def __enter__(self):
+    logging.info('Starting profiling of %s', self.profile_id)
+    self.profiler = cProfile.Profile()
+    self.profiler.enable()
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    self.profiler.disable()
+    self.stats = pstats.Stats(self.profiler)
+    if self.profile_location:
+      self.profile_path = '%s/%s.prof' % (self.profile_location.rstrip('/'),
+                                          self.profile_id)
+      try:
+        # The same format as written by pstats.Stats.dump_stats().
+        _write_file(self.profile_path, marshal.dumps(self.stats.stats))
+        logging.info('Saved profile of %s to %s', self.profile_id,
+                     self.profile_path)
+      except Exception:  # pylint: disable=broad-except
+        logging.warning('Could not save profile of %s to %s',
+                        self.profile_id, self.profile_path, exc_info=True)
+        self.profile_path = None
+    logging.info('Profile of %s:\n%s', self.profile_id, self.summary())
+
+  def summary(self):
+    """Returns the functions with the highest cumulative time, as text."""
+    output = StringIO.StringIO()
+    self.stats.stream = output
+    self.stats.sort_stats('cumulative').print_stats(self.summary_entries)
+    return output.getvalue()
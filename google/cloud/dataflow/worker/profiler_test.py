@@ -0,0 +1,57 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the work item profiler."""
+
+import logging
+import os
+import pstats
+import tempfile
+import unittest
+
+from google.cloud.dataflow.worker import profiler
+
+
+def profiled_function(n):
+  return sum(i * i for i in range(n))
+
+
+class ProfilerTest(unittest.TestCase):
+
+  def test_should_profile(self):
+    self.assertFalse(profiler.should_profile(0))
+    self.assertTrue(profiler.should_profile(1))
+    self.assertFalse(any(profiler.should_profile(0.0) for _ in range(100)))
+
+  def test_profile_saves_stats(self):
+    profile_location = os.path.join(tempfile.mkdtemp(), 'profiles')
+    with profiler.Profile('S01-1234', profile_location) as profile:
+      profiled_function(1000)
+    self.assertEqual(os.path.join(profile_location, 'S01-1234.prof'),
+                     profile.profile_path)
+    stats = pstats.Stats(profile.profile_path)
+    self.assertIn('profiled_function',
+                  [name for _, _, name in stats.stats])
+    self.assertIn('profiled_function', profile.summary())
+
+  def test_profile_without_location(self):
+    with profiler.Profile('S01-1234') as profile:
+      profiled_function(10)
+    self.assertIsNone(profile.profile_path)
+    self.assertIn('profiled_function', profile.summary())
+
+
+if __name__ == '__main__':
+  logging.getLogger().setLevel(logging.INFO)
+  unittest.main()
@@ -29,6 +29,14 @@ over values several times and in general to read in a non-sequential manner.
 
 The shuffle source supports reiterating over values and values returned
 have indefinite lifetimes, are stateless and immutable.
+
+Shuffle I/O overlaps with the decoding and encoding of entries: readers fetch
+the next chunk of entries on a background thread while the current chunk is
+decoded, and writers send full buffers of entries to the shuffle on a
+background thread while the next buffer is filled.
+
+A configuration naming a local directory (see localshuffle.encode_config) makes
+the sources and sinks use a shuffle backed by files on the local disk instead.
 """
 
 from __future__ import absolute_import
@@ -36,10 +44,14 @@ from __future__ import absolute_import
 import base64
 import cStringIO as StringIO
 import logging
+import Queue
 import struct
+import sys
+import threading
 
 from google.cloud.dataflow.io import iobase
 from google.cloud.dataflow.io import range_trackers
+from google.cloud.dataflow.worker import localshuffle
 
 
 # The following import works perfectly fine for the Dataflow SDK properly
@@ -53,6 +65,20 @@ except ImportError:
   pass
 
 
+# Number of chunks read from the shuffle ahead of the chunk being decoded.
+NUM_PREFETCHED_CHUNKS = 1
+
+# Size of the buffers of encoded entries sent to the shuffle, in bytes.
+WRITE_BUFFER_BYTES = 10 << 20
+
+# Maximum number of full buffers waiting to be sent to the shuffle. Writing
+# entries blocks while that many buffers are pending.
+MAX_PENDING_WRITES = 2
+
+# Seconds between checks that the chunks prefetched are still wanted.
+_PREFETCH_POLL_SECS = 0.1
+
+
 def _shuffle_decode(parameter):
   """Decodes a shuffle parameter.
 
@@ -76,6 +102,24 @@ def _shuffle_decode(parameter):
   return base64.urlsafe_b64decode(parameter)
 
 
+def _shuffle_reader(config_bytes):
+  """Returns a reader for an encoded shuffle configuration."""
+  config = _shuffle_decode(config_bytes)
+  if localshuffle.is_local_config(config):
+    return localshuffle.LocalShuffleReader(
+        localshuffle.config_directory(config))
+  return shuffle_client.PyShuffleReader(config)
+
+
+def _shuffle_writer(config_bytes):
+  """Returns a writer for an encoded shuffle configuration."""
+  config = _shuffle_decode(config_bytes)
+  if localshuffle.is_local_config(config):
+    return localshuffle.LocalShuffleWriter(
+        localshuffle.config_directory(config))
+  return shuffle_client.PyShuffleWriter(config)
+
+
 class ShuffleEntry(object):
   """A (position, key, 2nd-key, value) tuple as used by the shuffle library."""
 
@@ -147,6 +191,77 @@ class ShuffleEntry(object):
     return ShuffleEntry(key, secondary_key, value, position)
 
 
+class _SynchronizedShuffleReader(object):
+  """A shuffle reader that can be used by several threads.
+
+  The reader of a shuffle source is shared by the iterables over its entries,
+  which read on the thread prefetching chunks or the thread reiterating over
+  the values of a key.
+  """
+
+  def __init__(self, reader):
+    self._reader = reader
+    self._lock = threading.Lock()
+
+  def Read(self, start_position, end_position):  # pylint: disable=invalid-name
+    with self._lock:
+      return self._reader.Read(start_position, end_position)
+
+
+def _read_chunks(reader, start_position, end_position):
+  """Yields the chunks of entries of a range of shuffle positions."""
+  while True:
+    chunk, next_position = reader.Read(start_position, end_position)
+    yield chunk
+    if not next_position:  # An empty string signals the last chunk.
+      return
+    start_position = next_position
+
+
+def _prefetch(iterator, num_prefetched=NUM_PREFETCHED_CHUNKS):
+  """Yields the items of an iterator, fetched ahead on a background thread.
+
+  Errors of the iterator are raised when the item that failed is reached.
+  When the generator is closed early the background thread stops.
+  """
+  items = Queue.Queue(num_prefetched)
+  done = object()
+  stopped = threading.Event()
+
+  def put(item):
+    while not stopped.is_set():
+      try:
+        items.put(item, timeout=_PREFETCH_POLL_SECS)
+        return True
+      except Queue.Full:
+        pass
+    return False
+
+  def fetch():
+    try:
+      for item in iterator:
+        if not put((item, None)):
+          return
+    except:  # pylint: disable=bare-except
+      put((done, sys.exc_info()))
+      return
+    put((done, None))
+
+  thread = threading.Thread(target=fetch, name='ShufflePrefetch')
+  thread.daemon = True
+  thread.start()
+  try:
+    while True:
+      item, exc_info = items.get()
+      if item is done:
+        if exc_info is not None:
+          raise exc_info[0], exc_info[1], exc_info[2]
+        return
+      yield item
+  finally:
+    stopped.set()
+
+
 class ShuffleEntriesIterable(object):
   """An iterable over all entries between two positions filtered by key.
 
@@ -183,13 +298,12 @@ class ShuffleEntriesIterable(object):
     self._pushed_back_entry = entry
 
   def __iter__(self):
-    last_chunk_seen = False
-    start_position = self.start_position
-    end_position = self.end_position
-    while not last_chunk_seen:
-      chunk, next_position = self.reader.Read(start_position, end_position)
-      if not next_position:  # An empty string signals the last chunk.
-        last_chunk_seen = True
+    chunks = _read_chunks(self.reader, self.start_position, self.end_position)
+    if self.key is None:
+      # Reading all the entries of a range, as opposed to reiterating over the
+      # values of a key which usually fit in a chunk.
+      chunks = _prefetch(chunks)
+    for chunk in chunks:
       # Yield records inside the chunk just read.
       read_bytes, total_bytes = 0, len(chunk)
       stream = StringIO.StringIO(chunk)
@@ -205,8 +319,6 @@ class ShuffleEntriesIterable(object):
         while self._pushed_back_entry is not None:
           to_return, self._pushed_back_entry = self._pushed_back_entry, None
           yield to_return
-      # Move on to the next chunk.
-      start_position = next_position
 
 
 class ShuffleEntriesIterator(object):
@@ -288,17 +400,26 @@ class ShuffleKeyValuesIterable(object):
 
 
 class ShuffleReaderBase(iobase.SourceReader):
-  """A base class for grouped and ungrouped shuffle readers."""
+  """A base class for grouped and ungrouped shuffle readers.
+
+  Both readers report the shuffle position of the last record returned and the
+  approximate fraction of their range consumed as their progress, and can be
+  split dynamically at a shuffle position or a percentage of their range.
+  """
 
   def __init__(self, shuffle_source, reader=None):
     self.source = shuffle_source
     self.reader = reader
     self.entries_iterable = None
+    self._range_tracker = range_trackers.GroupedShuffleRangeTracker(
+        decoded_start_pos=shuffle_source.start_position,
+        decoded_stop_pos=shuffle_source.end_position)
 
   def __enter__(self):
     if self.reader is None:
-      self.reader = shuffle_client.PyShuffleReader(
-          _shuffle_decode(self.source.config_bytes))
+      self.reader = _shuffle_reader(self.source.config_bytes)
+    if not isinstance(self.reader, _SynchronizedShuffleReader):
+      self.reader = _SynchronizedShuffleReader(self.reader)
     # Initialize the shuffle entries iterable. For now we read from start to
     # end which is enough for plain GroupByKey operations.
     if self.entries_iterable is None:
@@ -309,15 +430,55 @@ class ShuffleReaderBase(iobase.SourceReader):
   def __exit__(self, exception_type, exception_value, traceback):
     pass
 
+  def get_progress(self):
+    last_group_start = self._range_tracker.last_group_start
+    if last_group_start is None:
+      return None
+    reader_position = iobase.ReaderPosition(
+        shuffle_position=base64.urlsafe_b64encode(last_group_start))
+    return iobase.ReaderProgress(
+        position=reader_position,
+        percent_complete=self._range_tracker.fraction_consumed)
+
+  def request_dynamic_split(self, dynamic_split_request):
+    assert dynamic_split_request is not None
+    reader_name = self.__class__.__name__
+    split_request_progress = dynamic_split_request.progress
+    if split_request_progress.position is None:
+      percent_complete = split_request_progress.percent_complete
+      if percent_complete is None or not 0 < percent_complete < 1:
+        logging.warning('%s only supports split at a Position or a percentage '
+                        'of work in the range (0, 1). Requested: %r',
+                        reader_name, dynamic_split_request)
+        return
+      encoded_shuffle_position = base64.urlsafe_b64encode(
+          self._range_tracker.get_position_for_fraction_consumed(
+              percent_complete))
+    else:
+      encoded_shuffle_position = (
+          split_request_progress.position.shuffle_position)
+    if encoded_shuffle_position is None:
+      logging.warning('%s only supports split at a shuffle position. '
+                      'Requested: %r',
+                      reader_name, split_request_progress.position)
+      return
+
+    if self._range_tracker.try_split_at_position(
+        _shuffle_decode(encoded_shuffle_position)):
+      logging.info('Split %s at %s', reader_name, encoded_shuffle_position)
+      split_position = iobase.ReaderPosition(
+          shuffle_position=encoded_shuffle_position)
+      return iobase.DynamicSplitResultWithPosition(split_position)
+    else:
+      logging.info('Refusing to split %s %r at %s',
+                   reader_name, self, encoded_shuffle_position)
+
 
 class GroupedShuffleReader(ShuffleReaderBase):
   """A shuffle reader providing grouped reading."""
 
   def __init__(self, shuffle_source, reader=None):
     super(GroupedShuffleReader, self).__init__(shuffle_source, reader)
-    self._range_tracker = range_trackers.GroupedShuffleRangeTracker(
-        decoded_start_pos=shuffle_source.start_position,
-        decoded_stop_pos=shuffle_source.end_position)
 
   def __iter__(self):
     entries_iterator = ShuffleEntriesIterator(self.entries_iterable)
@@ -350,38 +511,6 @@ class GroupedShuffleReader(ShuffleReaderBase):
       for _ in drain_iterator:
         pass
 
-  def get_progress(self):
-    last_group_start = self._range_tracker.last_group_start
-    if last_group_start is None:
-      return None
-    reader_position = iobase.ReaderPosition(
-        shuffle_position=base64.urlsafe_b64encode(last_group_start))
-    return iobase.ReaderProgress(position=reader_position)
-
-  def request_dynamic_split(self, dynamic_split_request):
-    assert dynamic_split_request is not None
-    split_request_progress = dynamic_split_request.progress
-    if split_request_progress.position is None:
-      logging.warning('GroupingShuffleReader only supports split at a Position.'
-                      ' Requested: %r', dynamic_split_request)
-      return
-    encoded_shuffle_position = split_request_progress.position.shuffle_position
-    if encoded_shuffle_position is None:
-      logging.warning('GroupingShuffleReader only supports split at a shuffle'
-                      ' position. Requested: %r'
-                      , split_request_progress.position)
-      return
-
-    if self._range_tracker.try_split_at_position(
-        _shuffle_decode(encoded_shuffle_position)):
-      logging.info('Split GroupedShuffleReader at %s', encoded_shuffle_position)
-      split_position = iobase.ReaderPosition(
-          shuffle_position=encoded_shuffle_position)
-      return iobase.DynamicSplitResultWithPosition(split_position)
-    else:
-      logging.info('Refusing to split GroupedShuffleReader %r at %s'
-                   , self, encoded_shuffle_position)
-
 
 class UngroupedShuffleReader(ShuffleReaderBase):
   """A shuffle reader providing ungrouped reading."""
@@ -390,8 +519,17 @@ class UngroupedShuffleReader(ShuffleReaderBase):
     super(UngroupedShuffleReader, self).__init__(shuffle_source, reader)
 
   def __iter__(self):
+    # The values of a key share its position, so only the first value at a
+    # position is a split point.
+    decode = self.source.value_coder.decode
+    try_return_record_at = self._range_tracker.try_return_record_at
+    last_position = None
     for entry in self.entries_iterable:
-      yield self.source.value_coder.decode(entry.value)
+      position = entry.position
+      if not try_return_record_at(position != last_position, position):
+        return
+      last_position = position
+      yield decode(entry.value)
 
 
 class ShuffleSourceBase(iobase.Source):
@@ -428,6 +566,51 @@ class UngroupedShuffleSource(ShuffleSourceBase):
     return UngroupedShuffleReader(self, reader=test_reader)
 
 
+class _AsyncShuffleWriter(object):
+  """Sends buffers of entries to a shuffle writer on a background thread.
+
+  At most max_pending buffers wait to be sent; write() blocks while the queue
+  is full. An error sending a buffer is raised by every following write() or
+  close() call, and all the buffers after it are dropped.
+  """
+
+  def __init__(self, writer, max_pending=MAX_PENDING_WRITES):
+    self._writer = writer
+    self._buffers = Queue.Queue(max_pending)
+    self._exc_info = None
+    self._thread = threading.Thread(target=self._run, name='ShuffleWriter')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _run(self):
+    while True:
+      data = self._buffers.get()
+      if data is None:
+        return
+      if self._exc_info is None:
+        try:
+          self._writer.Write(data)
+        except:  # pylint: disable=bare-except
+          self._exc_info = sys.exc_info()
+
+  def _raise_if_failed(self):
+    # The error is kept: once a buffer is lost the shuffle stream must not be
+    # written to, nor closed.
+    exc_info = self._exc_info
+    if exc_info is not None:
+      raise exc_info[0], exc_info[1], exc_info[2]
+
+  def write(self, data):
+    self._raise_if_failed()
+    self._buffers.put(data)
+
+  def close(self):
+    """Waits until all the buffers are sent."""
+    self._buffers.put(None)
+    self._thread.join()
+    self._raise_if_failed()
+
+
 class ShuffleSinkWriter(iobase.NativeSinkWriter):
   """A sink writer for ShuffleSink."""
 
@@ -436,19 +619,25 @@ class ShuffleSinkWriter(iobase.NativeSinkWriter):
     self.writer = writer
     self.stream = StringIO.StringIO()
     self.bytes_buffered = 0
+    self._async_writer = None
 
   def __enter__(self):
     if self.writer is None:
-      self.writer = shuffle_client.PyShuffleWriter(
-          _shuffle_decode(self.sink.config_bytes))
+      self.writer = _shuffle_writer(self.sink.config_bytes)
+    self._async_writer = _AsyncShuffleWriter(self.writer)
     return self
 
   def __exit__(self, exception_type, exception_value, traceback):
     value = self.stream.getvalue()
-    if value:
-      self.writer.Write(value)
-      self.bytes_buffered = 0
     self.stream.close()
+    self.bytes_buffered = 0
+    try:
+      if value:
+        self._async_writer.write(value)
+    finally:
+      self._async_writer.close()
+    # Not reached if a buffer could not be written, so that an incomplete
+    # stream is never committed.
     self.writer.Close()
 
   def Write(self, key, secondary_key, value):
@@ -459,8 +648,8 @@ class ShuffleSinkWriter(iobase.NativeSinkWriter):
         position=None)
     entry.to_bytes(self.stream, with_position=False)
     self.bytes_buffered += entry.size
-    if self.bytes_buffered > 10 << 20:
-      self.writer.Write(self.stream.getvalue())
+    if self.bytes_buffered > WRITE_BUFFER_BYTES:
+      self._async_writer.write(self.stream.getvalue())
       self.stream.close()
       self.stream = StringIO.StringIO()
       self.bytes_buffered = 0
@@ -17,9 +17,11 @@
 import base64
 import cStringIO as StringIO
 import logging
+import threading
 import unittest
 
 from google.cloud.dataflow.io import iobase
+from google.cloud.dataflow.worker import shuffle
 from google.cloud.dataflow.worker.shuffle import GroupedShuffleSource
 from google.cloud.dataflow.worker.shuffle import ShuffleEntry
 from google.cloud.dataflow.worker.shuffle import ShuffleSink
@@ -291,6 +293,44 @@ class TestGroupedShuffleSource(unittest.TestCase):
           iobase.DynamicSplitResultWithPosition(iobase.ReaderPosition(
               shuffle_position=base64.urlsafe_b64encode('2'))))
 
+  def test_progress_percent_complete(self):
+    source = GroupedShuffleSource(
+        config_bytes='not used', coder=Base64Coder(),
+        start_position=base64.urlsafe_b64encode('0'),
+        end_position=base64.urlsafe_b64encode('4'))
+
+    chunks = [TEST_CHUNK1, TEST_CHUNK2]
+    percent_complete = []
+    with source.reader(test_reader=FakeShuffleReader(chunks)) as reader:
+      for _ in reader:
+        percent_complete.append(reader.get_progress().percent_complete)
+    # The groups of the test chunks start at positions '0', '1' and '3'.
+    self.assertEqual([0, 0.25, 0.75], percent_complete)
+
+  def test_dynamic_splitting_at_percent_complete(self):
+    source = GroupedShuffleSource(
+        config_bytes='not used', coder=Base64Coder(),
+        start_position=base64.urlsafe_b64encode('0'),
+        end_position=base64.urlsafe_b64encode('4'))
+
+    def split_request(percent_complete):
+      return iobase.DynamicSplitRequest(
+          iobase.ReaderProgress(percent_complete=percent_complete))
+
+    chunks = [TEST_CHUNK1, TEST_CHUNK2]
+    keys = []
+    with source.reader(test_reader=FakeShuffleReader(chunks)) as reader:
+      for key, _ in reader:
+        keys.append(key)
+        if len(keys) == 1:
+          self.assertIsNone(reader.request_dynamic_split(split_request(0)))
+          # The middle of the range, between positions '1' and '3'.
+          self.try_splitting_reader_at(
+              reader, split_request(0.5),
+              iobase.DynamicSplitResultWithPosition(iobase.ReaderPosition(
+                  shuffle_position=base64.urlsafe_b64encode('2\x00'))))
+    self.assertEqual(['a', 'b'], keys)
+
   def test_reiteration(self):
     """Tests that key values iterators can be iterated repeatedly."""
     source = GroupedShuffleSource(
@@ -343,6 +383,99 @@ class TestUngroupedShuffleSource(unittest.TestCase):
     # We get only the values from the (k, 2nd-k, v) tuples.
     self.assertEqual([e[1] for e in TEST_CHUNK1 + TEST_CHUNK2], result)
 
+  def test_progress_reporting(self):
+    progress_record = []
+    source = UngroupedShuffleSource(
+        config_bytes='not used', coder=Base64Coder())
+
+    chunks = [TEST_CHUNK1, TEST_CHUNK2]
+    with source.reader(test_reader=FakeShuffleReader(chunks)) as reader:
+      self.assertIsNone(reader.get_progress())
+      for _ in reader:
+        progress_record.append(
+            reader.get_progress().position.shuffle_position)
+    self.assertEqual([base64.urlsafe_b64encode(str(i)) for i in range(8)],
+                     progress_record)
+
+  def test_dynamic_splitting(self):
+    result = []
+    source = UngroupedShuffleSource(
+        config_bytes='not used', coder=Base64Coder())
+
+    def split_request(position):
+      return iobase.DynamicSplitRequest(iobase.ReaderProgress(
+          position=iobase.ReaderPosition(
+              shuffle_position=base64.urlsafe_b64encode(position))))
+
+    chunks = [TEST_CHUNK1, TEST_CHUNK2]
+    with source.reader(test_reader=FakeShuffleReader(chunks)) as reader:
+      # Cannot split an unstarted reader.
+      self.assertIsNone(reader.request_dynamic_split(split_request('3')))
+      for v in reader:
+        result.append(v)
+        if len(result) == 2:
+          # Cannot split at an already returned position.
+          self.assertIsNone(reader.request_dynamic_split(split_request('1')))
+          # Cannot split without a shuffle position.
+          self.assertIsNone(reader.request_dynamic_split(
+              iobase.DynamicSplitRequest(iobase.ReaderProgress(
+                  position=iobase.ReaderPosition(record_index=3)))))
+          split_result = reader.request_dynamic_split(split_request('4'))
+          self.assertEqual(base64.urlsafe_b64encode('4'),
+                           split_result.stop_position.shuffle_position)
+    self.assertEqual([e[1] for e in (TEST_CHUNK1 + TEST_CHUNK2)[:4]], result)
+
+
+class PrefetchRecordingShuffleReader(FakeShuffleReader):
+  """A fake shuffle reader recording the start positions of the chunks read."""
+
+  def __init__(self, chunk_descriptors):
+    super(PrefetchRecordingShuffleReader, self).__init__(chunk_descriptors)
+    self.read_starts = []
+    self.second_chunk_read = threading.Event()
+
+  def Read(self, first, last):  # pylint: disable=invalid-name
+    self.read_starts.append(first)
+    if len(self.read_starts) == 2:
+      self.second_chunk_read.set()
+    return super(PrefetchRecordingShuffleReader, self).Read(first, last)
+
+
+class TestShufflePrefetch(unittest.TestCase):
+
+  def test_next_chunk_read_while_decoding(self):
+    source = UngroupedShuffleSource(
+        config_bytes='not used', coder=Base64Coder())
+    fake_reader = PrefetchRecordingShuffleReader([TEST_CHUNK1, TEST_CHUNK2])
+    result = []
+    with source.reader(test_reader=fake_reader) as reader:
+      for v in reader:
+        if not result:
+          # The second chunk is read before the first one is consumed.
+          self.assertTrue(fake_reader.second_chunk_read.wait(10))
+        result.append(v)
+    self.assertEqual([e[1] for e in TEST_CHUNK1 + TEST_CHUNK2], result)
+    self.assertEqual(['', '4'], fake_reader.read_starts)
+
+  def test_read_error_raised(self):
+
+    class FailingShuffleReader(FakeShuffleReader):
+
+      def Read(self, first, last):  # pylint: disable=invalid-name
+        if first:
+          raise IOError('Cannot read chunk at %s' % first)
+        return super(FailingShuffleReader, self).Read(first, last)
+
+    source = UngroupedShuffleSource(
+        config_bytes='not used', coder=Base64Coder())
+    result = []
+    with self.assertRaisesRegexp(IOError, 'Cannot read chunk at 4'):
+      with source.reader(
+          test_reader=FailingShuffleReader([TEST_CHUNK1, TEST_CHUNK2])) as r:
+        for v in r:
+          result.append(v)
+    self.assertEqual([e[1] for e in TEST_CHUNK1], result)
+
 
 class TestShuffleSink(unittest.TestCase):
 
@@ -355,6 +488,93 @@ class TestShuffleSink(unittest.TestCase):
         writer.Write(*entry)
     self.assertEqual(entries, fake_writer.values)
 
+  def test_buffers_written_in_background(self):
+
+    class BlockingShuffleWriter(FakeShuffleWriter):
+
+      def __init__(self):
+        super(BlockingShuffleWriter, self).__init__()
+        self.unblocked = threading.Event()
+        self.num_writes = 0
+
+      def Write(self, entries):  # pylint: disable=invalid-name
+        self.unblocked.wait(10)
+        self.num_writes += 1
+        super(BlockingShuffleWriter, self).Write(entries)
+
+    source = ShuffleSink(config_bytes='not used', coder=Base64Coder())
+    entries = [(str(i), '2nd', 'x' * 10) for i in range(3)]
+    fake_writer = BlockingShuffleWriter()
+    original_buffer_bytes = shuffle.WRITE_BUFFER_BYTES
+    shuffle.WRITE_BUFFER_BYTES = 1
+    try:
+      with source.writer(test_writer=fake_writer) as writer:
+        # Each entry fills a buffer. Writing them does not wait for the
+        # blocked shuffle writer.
+        for entry in entries:
+          writer.Write(*entry)
+        self.assertEqual(0, fake_writer.num_writes)
+        fake_writer.unblocked.set()
+    finally:
+      shuffle.WRITE_BUFFER_BYTES = original_buffer_bytes
+    self.assertEqual(3, fake_writer.num_writes)
+    self.assertEqual(entries, fake_writer.values)
+
+  def test_write_error_raised(self):
+
+    class FailingShuffleWriter(FakeShuffleWriter):
+
+      def Write(self, entries):  # pylint: disable=invalid-name
+        raise IOError('Cannot write')
+
+    source = ShuffleSink(config_bytes='not used', coder=Base64Coder())
+    with self.assertRaisesRegexp(IOError, 'Cannot write'):
+      with source.writer(test_writer=FailingShuffleWriter()) as writer:
+        writer.Write('a', '2nd-a', '1')
+
+
+  def test_write_error_is_sticky(self):
+
+    class FailingOnceShuffleWriter(FakeShuffleWriter):
+
+      def __init__(self):
+        super(FailingOnceShuffleWriter, self).__init__()
+        self.num_writes = 0
+        self.closed = False
+
+      def Write(self, entries):  # pylint: disable=invalid-name
+        self.num_writes += 1
+        if self.num_writes == 1:
+          raise IOError('Cannot write')
+        super(FailingOnceShuffleWriter, self).Write(entries)
+
+      def Close(self):  # pylint: disable=invalid-name
+        self.closed = True
+
+    source = ShuffleSink(config_bytes='not used', coder=Base64Coder())
+    fake_writer = FailingOnceShuffleWriter()
+    original_buffer_bytes = shuffle.WRITE_BUFFER_BYTES
+    shuffle.WRITE_BUFFER_BYTES = 1
+    try:
+      writer = source.writer(test_writer=fake_writer)
+      writer.__enter__()
+      writer.Write('a', '2nd-a', '1')
+      # Waits for the failed buffer.
+      with self.assertRaisesRegexp(IOError, 'Cannot write'):
+        writer._async_writer.close()  # pylint: disable=protected-access
+      # Every later write fails, even once the error was raised.
+      for _ in range(2):
+        with self.assertRaisesRegexp(IOError, 'Cannot write'):
+          writer.Write('b', '2nd-b', '1')
+      with self.assertRaisesRegexp(IOError, 'Cannot write'):
+        writer.__exit__(None, None, None)
+    finally:
+      shuffle.WRITE_BUFFER_BYTES = original_buffer_bytes
+    # No buffer is written after the failed one, and the stream is not
+    # committed.
+    self.assertEqual(1, fake_writer.num_writes)
+    self.assertFalse(fake_writer.closed)
+
 
 if __name__ == '__main__':
   logging.getLogger().setLevel(logging.INFO)
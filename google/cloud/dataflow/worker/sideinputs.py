@@ -0,0 +1,485 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Worker utilities for reading side inputs.
+
+The sources of a side input are the same for all the work items of a stage,
+so the values read from each source are cached by the worker and shared by
+all the work items (and DoFns) reading the same source later. The values are
+cached and iterated over as tuples, so the DoFns cannot modify the sequence
+of values seen by the other work items. Singleton side inputs are not cached:
+only their first value is read, for each work item.
+
+The sources of a side input (e.g. the shards of a file) are read concurrently
+on a pool of threads shared by the worker, and the DoFns can start processing
+while they are read (see StreamingSideInput).
+
+Dict and multimap side inputs are not read into memory. Their entries are
+written once per worker to a local file indexed by key (see KeyIndexedView)
+and loaded lazily when the DoFns look them up.
+"""
+
+from __future__ import absolute_import
+
+import anydbm
+import collections
+import cPickle
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+from google.cloud.dataflow import coders
+from google.cloud.dataflow.internal import pickler
+
+
+# Maximum total size of the side input values cached by a worker, in bytes.
+# The size of the values of a source is estimated from their encoded size.
+DEFAULT_MAX_CACHE_BYTES = 512 << 20
+
+# Number of values of a source whose size is estimated to extrapolate the
+# size of all its values.
+NUM_SIZE_SAMPLES = 100
+
+# Maximum number of buckets of a key-indexed view kept in memory.
+DEFAULT_MAX_CACHED_BUCKETS = 10000
+
+# Number of entries buffered in memory while writing a key-indexed view.
+WRITE_BUFFER_ENTRIES = 10000
+
+# Maximum number of key-indexed views kept by a worker.
+MAX_CACHED_VIEWS = 16
+
+# Number of threads of the worker reading side input sources.
+MAX_READ_THREADS = 16
+
+# Number of values read from a side input source before they are made
+# available to the DoFns iterating over the side input.
+STREAMING_BATCH_SIZE = 100
+
+
+def _cache_key(source):
+  """Returns the key of the values of a source, or None if not cacheable."""
+  try:
+    return hashlib.sha1(pickler.dumps(source)).hexdigest()
+  except Exception:  # pylint: disable=broad-except
+    logging.debug('Not caching the values of side input source %s.', source,
+                  exc_info=True)
+    return None
+
+
+def estimate_size(source, values):
+  """Estimates the size of the values read from a source, in bytes."""
+  if not values:
+    return 0
+  coder = getattr(source, 'coder', None) or coders.PickleCoder()
+  step = max(1, len(values) // NUM_SIZE_SAMPLES)
+  samples = values[::step]
+  total = 0
+  for value in samples:
+    try:
+      total += coder.estimate_size(value)
+    except Exception:  # pylint: disable=broad-except
+      total += coders.PickleCoder().estimate_size(value)
+  return total * len(values) // len(samples)
+
+
+class SideInputCache(object):
+  """A thread-safe cache of the values read from side input sources.
+
+  The least recently used sources are evicted when the estimated size of the
+  cached values exceeds max_bytes. The values of a source larger than
+  max_bytes are not cached.
+  """
+
+  def __init__(self, max_bytes=DEFAULT_MAX_CACHE_BYTES):
+    self.max_bytes = max_bytes
+    self.size_bytes = 0
+    # Maps the key of a source to a (values, size) tuple, least recently used
+    # first.
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def get_or_read(self, source, read):
+    """Returns the values of a source, calling read() if they are not cached.
+
+    Args:
+      source: the side input source.
+      read: a function returning the list of the values of the source.
+
+    Returns:
+      The list of the values of the source.
+    """
+    key = _cache_key(source)
+    values = self._get(key)
+    if values is None:
+      values = read()
+      if key is not None:
+        self._put(key, values, estimate_size(source, values))
+    return values
+
+  def get(self, source):
+    """Returns the cached values of a source, or None if not cached."""
+    return self._get(_cache_key(source))
+
+  def put(self, source, values):
+    """Caches the values read from a source."""
+    key = _cache_key(source)
+    if key is not None:
+      self._put(key, values, estimate_size(source, values))
+
+  def _get(self, key):
+    if key is None:
+      return None
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is None:
+        return None
+      self._entries[key] = entry
+      return entry[0]
+
+  def _put(self, key, values, size):
+    if size > self.max_bytes:
+      logging.info('Not caching side input values of about %d bytes.', size)
+      return
+    with self._lock:
+      previous = self._entries.pop(key, None)
+      if previous is not None:
+        self.size_bytes -= previous[1]
+      self._entries[key] = (values, size)
+      self.size_bytes += size
+      while self.size_bytes > self.max_bytes:
+        _, (_, evicted_size) = self._entries.popitem(last=False)
+        self.size_bytes -= evicted_size
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.size_bytes = 0
+
+  def __len__(self):
+    return len(self._entries)
+
+
+def _read_source(source):
+  with source.reader() as reader:
+    for value in reader:
+      yield value
+
+
+class _SourceBuffer(object):
+  """The values of a side input source, appended as they are read."""
+
+  def __init__(self, values=None):
+    self.values = values if values is not None else []
+    self.done = values is not None
+    self.exc_info = None
+
+
+class StreamingSideInput(object):
+  """A reiterable side input whose sources are read on background threads.
+
+  Iterating yields the values of all the sources in order. The values not read
+  yet are waited for, so the DoFns can start processing before the side input
+  is fully read. Errors reading a source are raised when its values are
+  iterated over.
+
+  The values of each source are cached by the worker once read, and the values
+  of the sources already cached are not read again.
+  """
+
+  def __init__(self, sources, read=_read_source, cache=None, pool=None):
+    """Starts reading the sources not cached.
+
+    Args:
+      sources: the side input sources.
+      read: a function returning an iterator over the values of a source.
+      cache: the SideInputCache of the values of the sources. Defaults to the
+        cache of the worker.
+      pool: the ThreadPool reading the sources. Defaults to the pool of the
+        worker.
+    """
+    self._cache = cache if cache is not None else _side_input_cache
+    self._condition = threading.Condition()
+    self._buffers = []
+    self._all_values = None
+    self._num_pending = 0
+    pending = []
+    for source in sources:
+      values = self._cache.get(source)
+      buf = _SourceBuffer(values)
+      self._buffers.append(buf)
+      if values is None:
+        self._num_pending += 1
+        pending.append((source, buf))
+    self._maybe_finish()
+    for source, buf in pending:
+      (pool or _read_pool()).apply_async(self._read_into, (source, read, buf))
+
+  def _read_into(self, source, read, buf):
+    batch = []
+    try:
+      for value in read(source):
+        batch.append(value)
+        if len(batch) >= STREAMING_BATCH_SIZE:
+          with self._condition:
+            buf.values.extend(batch)
+            self._condition.notify_all()
+          batch = []
+    except:  # pylint: disable=bare-except
+      buf.exc_info = sys.exc_info()
+      logging.warning('Error reading side input source %s', source,
+                      exc_info=True)
+    with self._condition:
+      buf.values.extend(batch)
+      buf.done = True
+      self._num_pending -= 1
+      self._maybe_finish()
+      self._condition.notify_all()
+    if buf.exc_info is None:
+      self._cache.put(source, tuple(buf.values))
+
+  def _maybe_finish(self):
+    # Once all the sources are read the values are iterated over as a tuple.
+    # The values of a cached source are a tuple already and are not copied.
+    if self._num_pending == 0 and not any(b.exc_info for b in self._buffers):
+      if len(self._buffers) == 1:
+        self._all_values = tuple(self._buffers[0].values)
+      else:
+        self._all_values = tuple(v for b in self._buffers for v in b.values)
+
+  def __iter__(self):
+    if self._all_values is not None:
+      return iter(self._all_values)
+    return self._iter_buffers()
+
+  def _iter_buffers(self):
+    for buf in self._buffers:
+      index = 0
+      while True:
+        with self._condition:
+          while index >= len(buf.values) and not buf.done:
+            self._condition.wait()
+          end = len(buf.values)
+        while index < end:
+          yield buf.values[index]
+          index += 1
+        if buf.done and index >= len(buf.values):
+          break
+      if buf.exc_info is not None:
+        exc_info = buf.exc_info
+        raise exc_info[0], exc_info[1], exc_info[2]
+
+  def __len__(self):
+    if self._all_values is None:
+      for _ in self._iter_buffers():
+        pass
+    return len(self._all_values)
+
+  def __repr__(self):
+    return '<StreamingSideInput of %d sources>' % len(self._buffers)
+
+
+class KeyIndexedView(collections.Mapping):
+  """A read-only mapping stored in a local file indexed by key.
+
+  The entries are grouped in buckets by the hash of their key and each bucket
+  is pickled in a dbm file under that hash, so a lookup only loads the bucket
+  of the key. The most recently used buckets are kept in memory.
+
+  For a multimap the value of a key is the list of all the values paired with
+  it. For a dict the last value paired with a key wins.
+
+  The views are shared by the work items of the worker, so they cannot be
+  modified, and each lookup of a multimap returns a new list. Besides the
+  read-only methods of dict, copy() returns a dict of all the entries that
+  the DoFns can modify.
+  """
+
+  def __init__(self, pairs, multimap=False,
+               max_cached_buckets=DEFAULT_MAX_CACHED_BUCKETS):
+    """Writes the entries of the view to a new local file.
+
+    Args:
+      pairs: an iterable of the (key, value) pairs of the view.
+      multimap: True if a key is mapped to the list of all its values.
+      max_cached_buckets: number of buckets kept in memory.
+    """
+    self.multimap = multimap
+    self.max_cached_buckets = max_cached_buckets
+    # Maps the hash of a key to its bucket, least recently used first.
+    self._buckets = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self._len = 0
+    self._db = None
+    self._directory = tempfile.mkdtemp(prefix='side-input-')
+    self._db = anydbm.open(os.path.join(self._directory, 'view'), 'n')
+    self._write(pairs)
+
+  def _write(self, pairs):
+    # Buckets are buffered in memory and merged into the file in batches, so
+    # that a bucket is not rewritten for each of its entries.
+    buffered = {}
+    num_buffered = 0
+    for key, value in pairs:
+      entries = buffered.setdefault(hash(key), [])
+      entries.append((key, value))
+      num_buffered += 1
+      if num_buffered >= WRITE_BUFFER_ENTRIES:
+        self._merge(buffered)
+        buffered = {}
+        num_buffered = 0
+    self._merge(buffered)
+
+  def _merge(self, buffered):
+    for key_hash, entries in buffered.iteritems():
+      bucket = self._read_bucket(key_hash)
+      for key, value in entries:
+        for i, (bucket_key, bucket_value) in enumerate(bucket):
+          if bucket_key == key:
+            if self.multimap:
+              bucket_value.append(value)
+            else:
+              bucket[i] = (key, value)
+            break
+        else:
+          bucket.append((key, [value] if self.multimap else value))
+          self._len += 1
+      self._db[str(key_hash)] = cPickle.dumps(bucket, cPickle.HIGHEST_PROTOCOL)
+
+  def _read_bucket(self, key_hash):
+    try:
+      return cPickle.loads(self._db[str(key_hash)])
+    except KeyError:
+      return []
+
+  def _bucket(self, key_hash):
+    with self._lock:
+      bucket = self._buckets.pop(key_hash, None)
+      if bucket is None:
+        bucket = self._read_bucket(key_hash)
+        if len(self._buckets) >= self.max_cached_buckets:
+          self._buckets.popitem(last=False)
+      self._buckets[key_hash] = bucket
+      return bucket
+
+  def __getitem__(self, key):
+    for bucket_key, value in self._bucket(hash(key)):
+      if bucket_key == key:
+        # The list of a multimap is copied since the bucket is cached.
+        return list(value) if self.multimap else value
+    raise KeyError(key)
+
+  def has_key(self, key):  # pylint: disable=invalid-name
+    return key in self
+
+  def copy(self):
+    """Returns a dict of all the entries of the view."""
+    return dict(self.iteritems())
+
+  def __iter__(self):
+    with self._lock:
+      key_hashes = self._db.keys()
+    for key_hash in key_hashes:
+      with self._lock:
+        bucket = self._read_bucket(key_hash)
+      for key, _ in bucket:
+        yield key
+
+  def __len__(self):
+    return self._len
+
+  def __repr__(self):
+    return '<%s of %d keys at %s>' % (
+        'multimap' if self.multimap else 'dict', self._len, self._directory)
+
+  def close(self):
+    """Deletes the file of the view."""
+    with self._lock:
+      if self._db is not None:
+        self._db.close()
+        self._db = None
+        shutil.rmtree(self._directory, ignore_errors=True)
+        self._buckets.clear()
+
+  def __del__(self):
+    self.close()
+
+
+# Side input values shared by all the DoOperations of the worker.
+_side_input_cache = SideInputCache()
+
+# Threads reading side input sources for all the DoOperations of the worker,
+# created when first needed.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _read_pool():
+  global _pool  # pylint: disable=global-statement
+  with _pool_lock:
+    if _pool is None:
+      _pool = ThreadPool(MAX_READ_THREADS)
+    return _pool
+
+# Key-indexed views shared by all the DoOperations of the worker, least
+# recently used first. Evicted views delete their file once no DoFn uses them.
+_views = collections.OrderedDict()
+_views_lock = threading.Lock()
+
+
+def read_values(source, read):
+  """Returns the values of a side input source, cached by the worker."""
+  return _side_input_cache.get_or_read(source, read)
+
+
+def read_view(sources, read, multimap=False):
+  """Returns a key-indexed view of the pairs of side input sources.
+
+  Args:
+    sources: the side input sources of the view.
+    read: a function returning an iterable of the (key, value) pairs of the
+      sources.
+    multimap: True for a multimap view, False for a dict view.
+
+  Returns:
+    A KeyIndexedView, cached by the worker.
+  """
+  keys = [_cache_key(source) for source in sources]
+  key = None if None in keys else (multimap, tuple(keys))
+  if key is not None:
+    with _views_lock:
+      view = _views.pop(key, None)
+      if view is not None:
+        _views[key] = view
+        return view
+  view = KeyIndexedView(read(), multimap=multimap)
+  if key is not None:
+    with _views_lock:
+      _views[key] = view
+      while len(_views) > MAX_CACHED_VIEWS:
+        _views.popitem(last=False)
+  return view
+
+
+def clear_side_input_cache():
+  """Drops all cached side input values and views."""
+  _side_input_cache.clear()
+  with _views_lock:
+    _views.clear()
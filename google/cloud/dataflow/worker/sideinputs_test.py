@@ -0,0 +1,237 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for side input utilities."""
+
+import logging
+import os
+import threading
+import unittest
+
+from google.cloud.dataflow import coders
+from google.cloud.dataflow.io import fileio
+from google.cloud.dataflow.worker import sideinputs
+
+
+def text_source(path):
+  return fileio.TextFileSource(path, coder=coders.BytesCoder())
+
+
+class SideInputCacheTest(unittest.TestCase):
+
+  def test_values_read_once(self):
+    cache = sideinputs.SideInputCache()
+    reads = []
+
+    def read():
+      reads.append(1)
+      return ['a', 'bc']
+
+    for _ in range(3):
+      self.assertEqual(['a', 'bc'],
+                       cache.get_or_read(text_source('/tmp/side'), read))
+    self.assertEqual(1, len(reads))
+    self.assertEqual(3, cache.size_bytes)
+    cache.get_or_read(text_source('/tmp/other'), read)
+    self.assertEqual(2, len(reads))
+
+  def test_least_recently_used_evicted(self):
+    cache = sideinputs.SideInputCache(max_bytes=25)
+    for name in ('a', 'b', 'a', 'c'):
+      cache.get_or_read(text_source(name), lambda: ['x' * 10])
+    self.assertEqual(2, len(cache))
+    self.assertEqual(20, cache.size_bytes)
+    # The source 'b' was evicted, so it is read again.
+    self.assertEqual(['y'], cache.get_or_read(text_source('b'), lambda: ['y']))
+    self.assertEqual(['x' * 10],
+                     cache.get_or_read(text_source('a'), lambda: ['z']))
+
+  def test_too_large_values_not_cached(self):
+    cache = sideinputs.SideInputCache(max_bytes=5)
+    cache.get_or_read(text_source('a'), lambda: ['x' * 10])
+    self.assertEqual(0, len(cache))
+    self.assertEqual(['y'], cache.get_or_read(text_source('a'), lambda: ['y']))
+
+  def test_unpicklable_source_not_cached(self):
+    cache = sideinputs.SideInputCache()
+    source = text_source('a')
+    source.pending_values = (x for x in ['x'])
+    cache.get_or_read(source, lambda: ['x'])
+    self.assertEqual(['y'], cache.get_or_read(source, lambda: ['y']))
+
+  def test_estimate_size_from_samples(self):
+    values = ['x' * 10] * 1000
+    self.assertEqual(10000,
+                     sideinputs.estimate_size(text_source('a'), values))
+    self.assertEqual(0, sideinputs.estimate_size(text_source('a'), []))
+
+
+class StreamingSideInputTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cache = sideinputs.SideInputCache()
+
+  def test_values_of_sources_in_order(self):
+    values = {'a': ['a1', 'a2'], 'b': [], 'c': ['c1']}
+    side_input = sideinputs.StreamingSideInput(
+        [text_source(name) for name in 'abc'],
+        read=lambda source: iter(values[source.file_path]), cache=self.cache)
+    self.assertEqual(['a1', 'a2', 'c1'], list(side_input))
+    # The side input can be iterated over again.
+    self.assertEqual(['a1', 'a2', 'c1'], list(side_input))
+    self.assertEqual(3, len(side_input))
+    # The values are cached and iterated over as tuples, which the DoFns cannot
+    # modify.
+    self.assertEqual(('c1',), self.cache.get(text_source('c')))
+    self.assertIsInstance(side_input._all_values, tuple)
+
+  def test_sources_read_concurrently(self):
+    num_sources = 4
+    started = []
+    all_started = threading.Event()
+
+    def read(source):
+      started.append(source)
+      if len(started) == num_sources:
+        all_started.set()
+      # Every read waits for all the others to start.
+      all_started.wait(10)
+      yield source.file_path
+
+    side_input = sideinputs.StreamingSideInput(
+        [text_source(str(i)) for i in range(num_sources)], read=read,
+        cache=self.cache)
+    self.assertEqual(['0', '1', '2', '3'], list(side_input))
+    self.assertTrue(all_started.is_set())
+
+  def test_values_available_while_reading(self):
+    finish = threading.Event()
+
+    def read(unused_source):
+      for i in range(sideinputs.STREAMING_BATCH_SIZE):
+        yield i
+      finish.wait(10)
+      yield 'last'
+
+    side_input = sideinputs.StreamingSideInput(
+        [text_source('a')], read=read, cache=self.cache)
+    values = iter(side_input)
+    self.assertEqual(0, next(values))
+    self.assertFalse(finish.is_set())
+    finish.set()
+    self.assertEqual('last', list(values)[-1])
+
+  def test_cached_sources_not_read(self):
+    self.cache.put(text_source('a'), ['x', 'y'])
+
+    def read(unused_source):
+      raise AssertionError('Should not be read')
+
+    side_input = sideinputs.StreamingSideInput(
+        [text_source('a')], read=read, cache=self.cache)
+    self.assertEqual(['x', 'y'], list(side_input))
+
+  def test_read_error_raised_when_iterating(self):
+
+    def read(source):
+      yield 'x'
+      raise ValueError('Cannot read %s' % source.file_path)
+
+    side_input = sideinputs.StreamingSideInput(
+        [text_source('a')], read=read, cache=self.cache)
+    with self.assertRaisesRegexp(ValueError, 'Cannot read a'):
+      list(side_input)
+    self.assertIsNone(self.cache.get(text_source('a')))
+
+
+class KeyIndexedViewTest(unittest.TestCase):
+
+  def tearDown(self):
+    sideinputs.clear_side_input_cache()
+
+  def test_dict_view(self):
+    view = sideinputs.KeyIndexedView(
+        [('a', 1), ('b', 2), (3, 'c'), ('a', 4)], max_cached_buckets=1)
+    self.assertEqual(4, view['a'])
+    self.assertEqual(2, view['b'])
+    self.assertEqual('c', view[3])
+    self.assertEqual('c', view[3.0])
+    self.assertNotIn('d', view)
+    self.assertIsNone(view.get('d'))
+    self.assertEqual(3, len(view))
+    self.assertEqual({'a': 4, 'b': 2, 3: 'c'}, dict(view.iteritems()))
+
+  def test_multimap_view(self):
+    view = sideinputs.KeyIndexedView(
+        [('a', 1), ('b', 2), ('a', 3)], multimap=True)
+    self.assertEqual([1, 3], view['a'])
+    self.assertEqual([2], view['b'])
+    self.assertEqual(2, len(view))
+    with self.assertRaises(KeyError):
+      _ = view['c']
+
+  def test_dict_compatible_methods(self):
+    view = sideinputs.KeyIndexedView([('a', 1), ('b', 2)])
+    self.assertTrue(view.has_key('a'))
+    self.assertFalse(view.has_key('c'))
+    copied = view.copy()
+    self.assertEqual({'a': 1, 'b': 2}, copied)
+    copied['c'] = 3
+    self.assertNotIn('c', view)
+    with self.assertRaises(TypeError):
+      view['c'] = 3  # pylint: disable=unsupported-assignment-operation
+
+  def test_multimap_lookups_return_new_lists(self):
+    view = sideinputs.KeyIndexedView([('a', 1), ('a', 2)], multimap=True)
+    view['a'].append(3)
+    self.assertEqual([1, 2], view['a'])
+    self.assertEqual({'a': [1, 2]}, view.copy())
+
+  def test_buckets_merged_across_writes(self):
+    pairs = [(i % 7, i) for i in range(50)]
+    original_buffer_entries = sideinputs.WRITE_BUFFER_ENTRIES
+    sideinputs.WRITE_BUFFER_ENTRIES = 10
+    try:
+      view = sideinputs.KeyIndexedView(pairs, multimap=True)
+    finally:
+      sideinputs.WRITE_BUFFER_ENTRIES = original_buffer_entries
+    self.assertEqual(range(3, 50, 7), view[3])
+    self.assertEqual(7, len(view))
+
+  def test_close_deletes_file(self):
+    view = sideinputs.KeyIndexedView([('a', 1)])
+    directory = view._directory
+    self.assertTrue(os.path.exists(directory))
+    view.close()
+    self.assertFalse(os.path.exists(directory))
+
+  def test_views_cached_per_sources(self):
+    reads = []
+
+    def read():
+      reads.append(1)
+      return [('a', 1)]
+
+    sources = [text_source('a'), text_source('b')]
+    view = sideinputs.read_view(sources, read)
+    self.assertIs(view, sideinputs.read_view(sources, read))
+    self.assertEqual(1, len(reads))
+    multimap = sideinputs.read_view(sources, read, multimap=True)
+    self.assertEqual([1], multimap['a'])
+    self.assertEqual(2, len(reads))
+
+
+if __name__ == '__main__':
+  logging.getLogger().setLevel(logging.INFO)
+  unittest.main()
@@ -0,0 +1,145 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sampling of the time spent by the worker in each step of a map task.
+
+Timing every call of every operation would cost more than most of the calls
+themselves. Instead, operations only record which state (e.g. processing an
+element in some step) the executing thread is in, and a background thread
+periodically attributes the time elapsed since its previous sample to the
+current state.
+"""
+
+from __future__ import absolute_import
+
+import os
+import threading
+import time
+
+from google.cloud.dataflow.utils.counters import Counter
+
+
+# Number of milliseconds between two samples of the current state.
+DEFAULT_SAMPLING_PERIOD_MS = 10
+
+
+def _cpu_time():
+  """Returns the user and system CPU time used by the process, in seconds."""
+  times = os.times()
+  return times[0] + times[1]
+
+
+class ScopedState(object):
+  """A state of execution the time spent in is counted.
+
+  Use as a context manager to make the state current while executing a block,
+  or enter and exit the state directly through the state sampler.
+
+  Attributes:
+    step_name: the name of the step executing while in the state, if any. The
+      worker logs use it as the step of the records logged in the state.
+    msecs_counter: counter of the wall time spent in the state, in msecs.
+    cpu_msecs_counter: counter of the CPU time used by the process while in
+      the state, in msecs.
+  """
+
+  def __init__(self, sampler, name, step_name=None):
+    self.sampler = sampler
+    self.name = name
+    self.step_name = step_name
+    self.msecs_counter = Counter('%s-msecs' % name, Counter.SUM)
+    self.cpu_msecs_counter = Counter('%s-cpu-msecs' % name, Counter.SUM)
+    # Time not yet added to the counters because it is less than a msec.
+    self._msecs_remainder = 0.0
+    self._cpu_msecs_remainder = 0.0
+    self._previous_states = []
+
+  def add_time(self, secs, cpu_secs):
+    """Attributes elapsed wall and CPU time to this state."""
+    msecs = secs * 1000 + self._msecs_remainder
+    self.msecs_counter.update(int(msecs))
+    self._msecs_remainder = msecs - int(msecs)
+    cpu_msecs = cpu_secs * 1000 + self._cpu_msecs_remainder
+    self.cpu_msecs_counter.update(int(cpu_msecs))
+    self._cpu_msecs_remainder = cpu_msecs - int(cpu_msecs)
+
+  def __enter__(self):
+    self._previous_states.append(self.sampler.current_state)
+    self.sampler.current_state = self
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    self.sampler.current_state = self._previous_states.pop()
+
+  def __iter__(self):
+    yield self.msecs_counter
+    yield self.cpu_msecs_counter
+
+  def __repr__(self):
+    return '<%s %s>' % (self.__class__.__name__, self.name)
+
+
+class StateSampler(object):
+  """Samples the state of execution of a thread from a background thread.
+
+  The executing thread assigns current_state (usually through a ScopedState
+  context manager) and the sampling thread started by start() attributes the
+  time elapsed between two samples to the state current at the second one.
+  """
+
+  def __init__(self, sampling_period_ms=DEFAULT_SAMPLING_PERIOD_MS):
+    self.sampling_period_ms = sampling_period_ms
+    self.current_state = None
+    self._stopped = threading.Event()
+    self._thread = None
+    self._last_sample_time = None
+    self._last_sample_cpu_time = None
+
+  def scoped_state(self, name, step_name=None):
+    """Returns a new ScopedState whose time is sampled by this sampler."""
+    return ScopedState(self, name, step_name)
+
+  def sample(self):
+    """Attributes the time elapsed since the last sample to the current state."""
+    now, cpu_now = time.time(), _cpu_time()
+    state = self.current_state
+    if state is not None and self._last_sample_time is not None:
+      state.add_time(max(now - self._last_sample_time, 0),
+                     max(cpu_now - self._last_sample_cpu_time, 0))
+    self._last_sample_time, self._last_sample_cpu_time = now, cpu_now
+
+  def _run(self):
+    while not self._stopped.wait(self.sampling_period_ms / 1000.0):
+      self.sample()
+
+  def start(self):
+    self.sample()
+    self._thread = threading.Thread(target=self._run, name='StateSampler')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    """Stops the sampling thread, attributing the time since its last sample."""
+    if self._thread is not None:
+      self._stopped.set()
+      self._thread.join()
+      self._thread = None
+      self.sample()
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    self.stop()
@@ -0,0 +1,73 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for sampling the time spent in each execution state."""
+
+import logging
+import time
+import unittest
+
+import mock
+
+from google.cloud.dataflow.worker import statesampler
+
+
+class StateSamplerTest(unittest.TestCase):
+
+  def sample_at(self, sampler, secs, cpu_secs):
+    with mock.patch('time.time', return_value=secs):
+      with mock.patch.object(statesampler, '_cpu_time',
+                             return_value=cpu_secs):
+        sampler.sample()
+
+  def test_time_is_attributed_to_current_state(self):
+    sampler = statesampler.StateSampler()
+    process = sampler.scoped_state('step-process')
+    finish = sampler.scoped_state('step-finish')
+    self.sample_at(sampler, 100, 10)
+    with process:
+      self.sample_at(sampler, 100.5, 10.25)
+      with finish:
+        self.sample_at(sampler, 101, 10.5)
+      self.assertIs(process, sampler.current_state)
+      self.sample_at(sampler, 101.25, 10.5)
+    self.assertIsNone(sampler.current_state)
+    # Time elapsed outside of any state is not counted.
+    self.sample_at(sampler, 102, 11)
+    self.assertEqual(['step-process-msecs', 'step-process-cpu-msecs'],
+                     [counter.name for counter in process])
+    self.assertEqual([750, 250], [counter.total for counter in process])
+    self.assertEqual([500, 250], [counter.total for counter in finish])
+
+  def test_fractions_of_msecs_add_up(self):
+    state = statesampler.StateSampler().scoped_state('step-process')
+    for _ in range(10):
+      state.add_time(0.00025, 0.0005)
+    self.assertEqual(2, state.msecs_counter.total)
+    self.assertEqual(5, state.cpu_msecs_counter.total)
+
+  def test_sampling_thread(self):
+    sampler = statesampler.StateSampler(sampling_period_ms=1)
+    state = sampler.scoped_state('step-process')
+    with sampler:
+      with state:
+        time.sleep(0.1)
+    self.assertGreaterEqual(state.msecs_counter.total, 50)
+    self.assertLessEqual(state.msecs_counter.total, 1000)
+    self.assertGreater(state.msecs_counter.elements, 1)
+
+
+if __name__ == '__main__':
+  logging.getLogger().setLevel(logging.INFO)
+  unittest.main()
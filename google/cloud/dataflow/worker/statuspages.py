@@ -0,0 +1,171 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Diagnostic pages served by the worker status server.
+
+Each function returns the plain text body of a page:
+  /threadz: the stacks of all threads.
+  /profilez: a sampling profile of the threads executing work items.
+  /heapz: the number and size of live objects by type.
+  /countersz: the counters of the operations of the current work item.
+
+The profiler samples the stacks of the profiled threads from the thread
+serving the page, so profiling does not require any instrumentation of (or
+restarting) the work being profiled.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import gc
+import os
+import sys
+import threading
+import time
+import traceback
+
+
+# Limits of the duration of a profile requested on /profilez.
+DEFAULT_PROFILE_SECS = 10
+MAX_PROFILE_SECS = 300
+
+# Number of milliseconds between two samples of the profiled stacks.
+PROFILE_SAMPLING_PERIOD_MS = 5
+
+# Number of entries listed in each table of the profile and heap pages.
+MAX_TABLE_ENTRIES = 40
+
+
+def thread_stacks():
+  """Returns the stacks of all threads."""
+  lines = []
+  frames = sys._current_frames()  # pylint: disable=protected-access
+  for t in threading.enumerate():
+    frame = frames.get(t.ident)
+    if frame is None:
+      continue
+    lines.append('--- Thread #%s name: %s ---\n' % (t.ident, t.name))
+    lines.append(''.join(traceback.format_stack(frame)))
+  return ''.join(lines)
+
+
+def _function_name(code):
+  return '%s:%d(%s)' % (os.path.basename(code.co_filename),
+                        code.co_firstlineno, code.co_name)
+
+
+def sample_stacks(thread_idents, seconds,
+                  sampling_period_ms=PROFILE_SAMPLING_PERIOD_MS):
+  """Samples the stacks of threads for a number of seconds.
+
+  Args:
+    thread_idents: the identifiers of the threads to sample, or None to sample
+      all threads except the calling one.
+    seconds: for how long to sample.
+    sampling_period_ms: the number of milliseconds between two samples.
+
+  Returns:
+    A tuple (number of stacks sampled, self counts, cumulative counts) where
+    the counts map function names to the number of sampled stacks in which
+    the function was executing (self) or on the stack (cumulative).
+  """
+  own_ident = threading.current_thread().ident
+  self_counts = collections.Counter()
+  cumulative_counts = collections.Counter()
+  num_samples = 0
+  end_time = time.time() + seconds
+  while True:
+    frames = sys._current_frames()  # pylint: disable=protected-access
+    for ident, frame in frames.iteritems():
+      if thread_idents is None:
+        if ident == own_ident:
+          continue
+      elif ident not in thread_idents:
+        continue
+      num_samples += 1
+      self_counts[_function_name(frame.f_code)] += 1
+      # Recursive functions are counted once per stack.
+      on_stack = set()
+      while frame is not None:
+        on_stack.add(_function_name(frame.f_code))
+        frame = frame.f_back
+      cumulative_counts.update(on_stack)
+    del frames
+    if time.time() >= end_time:
+      break
+    time.sleep(sampling_period_ms / 1000.0)
+  return num_samples, self_counts, cumulative_counts
+
+
+def profile(thread_idents, seconds):
+  """Returns a sampling profile of threads over a number of seconds."""
+  num_samples, self_counts, cumulative_counts = sample_stacks(
+      thread_idents, seconds)
+  lines = ['Sampled %d stacks in %g seconds every %d msecs.\n' % (
+      num_samples, seconds, PROFILE_SAMPLING_PERIOD_MS)]
+  for title, counts in (('self', self_counts),
+                        ('cumulative', cumulative_counts)):
+    lines.append('\n--- Top functions by %s samples ---\n' % title)
+    lines.append('%10s %7s  %s\n' % ('samples', 'percent', 'function'))
+    for name, count in counts.most_common(MAX_TABLE_ENTRIES):
+      lines.append('%10d %6.2f%%  %s\n' % (
+          count, 100.0 * count / max(num_samples, 1), name))
+  return ''.join(lines)
+
+
+def heap_summary():
+  """Returns the number and shallow size of the live objects of each type.
+
+  Only objects tracked by the garbage collector (containers and instances)
+  are counted. If the tracemalloc module is available and tracing, the
+  source lines that allocated the most memory are listed too.
+  """
+  gc.collect()
+  counts = collections.Counter()
+  sizes = collections.Counter()
+  for obj in gc.get_objects():
+    type_name = type(obj).__name__
+    counts[type_name] += 1
+    try:
+      sizes[type_name] += sys.getsizeof(obj)
+    except TypeError:
+      pass
+  lines = ['%d objects tracked by the garbage collector.\n' %
+           sum(counts.itervalues()),
+           '\n--- Top types by shallow size ---\n',
+           '%12s %10s  %s\n' % ('bytes', 'objects', 'type')]
+  for type_name, size in sizes.most_common(MAX_TABLE_ENTRIES):
+    lines.append('%12d %10d  %s\n' % (size, counts[type_name], type_name))
+
+  try:
+    import tracemalloc  # pylint: disable=g-import-not-at-top
+  except ImportError:
+    tracemalloc = None
+  if tracemalloc is not None and tracemalloc.is_tracing():
+    lines.append('\n--- Top allocating source lines ---\n')
+    snapshot = tracemalloc.take_snapshot()
+    for stat in snapshot.statistics('lineno')[:MAX_TABLE_ENTRIES]:
+      lines.append('%s\n' % stat)
+  return ''.join(lines)
+
+
+def counters(operations):
+  """Returns the current values of the counters of a list of operations."""
+  lines = []
+  for op in operations:
+    for counter in op.itercounters():
+      lines.append('%s %s %s/%s\n' % (
+          counter.name, counter.aggregation_kind_str(), counter.total,
+          counter.elements))
+  return ''.join(lines) or 'No counters.\n'
@@ -0,0 +1,98 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the worker status pages."""
+
+import logging
+import threading
+import unittest
+
+from google.cloud.dataflow.utils.counters import Counter
+from google.cloud.dataflow.worker import statuspages
+
+
+def busy_loop(started, stop):
+  started.set()
+  while not stop.is_set():
+    sum(xrange(1000))
+
+
+class FakeOperation(object):
+
+  def __init__(self, counters):
+    self.counters = counters
+
+  def itercounters(self):
+    return iter(self.counters)
+
+
+class StatusPagesTest(unittest.TestCase):
+
+  def test_thread_stacks(self):
+    page = statuspages.thread_stacks()
+    self.assertIn('name: %s' % threading.current_thread().name, page)
+    self.assertIn('test_thread_stacks', page)
+
+  def test_profile_of_a_thread(self):
+    started = threading.Event()
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_loop, args=(started, stop))
+    thread.start()
+    try:
+      self.assertTrue(started.wait(10))
+      num_samples, self_counts, cumulative_counts = statuspages.sample_stacks(
+          [thread.ident], 0.2)
+    finally:
+      stop.set()
+      thread.join()
+    self.assertGreater(num_samples, 1)
+    busy_loop_name = [name for name in cumulative_counts
+                      if name.endswith('(busy_loop)')]
+    self.assertEqual(1, len(busy_loop_name))
+    self.assertEqual(num_samples, cumulative_counts[busy_loop_name[0]])
+    self.assertEqual(num_samples, sum(self_counts.values()))
+    # The sampling thread itself is not profiled.
+    self.assertFalse([name for name in cumulative_counts
+                      if name.endswith('(test_profile_of_a_thread)')])
+
+  def test_profile_page(self):
+    page = statuspages.profile(None, 0.01)
+    self.assertIn('Top functions by self samples', page)
+    self.assertIn('Top functions by cumulative samples', page)
+
+  def test_heap_summary(self):
+    class SomeUniquelyNamedType(object):
+      pass
+    objects = [SomeUniquelyNamedType() for _ in range(100)]
+    page = statuspages.heap_summary()
+    self.assertIn('Top types by shallow size', page)
+    self.assertIn('dict', page)
+    del objects
+
+  def test_counters(self):
+    counter = Counter('step-out0-ElementCount', Counter.SUM)
+    counter.update(3)
+    mean = Counter('step-out0-MeanByteCount', Counter.MEAN)
+    mean.update(10)
+    mean.update(20)
+    page = statuspages.counters([FakeOperation([counter]),
+                                 FakeOperation([mean])])
+    self.assertEqual('step-out0-ElementCount SUM 3/1\n'
+                     'step-out0-MeanByteCount MEAN 30/2\n', page)
+    self.assertEqual('No counters.\n', statuspages.counters([]))
+
+
+if __name__ == '__main__':
+  logging.getLogger().setLevel(logging.INFO)
+  unittest.main()
@@ -44,11 +44,14 @@ class BatchWorkItem(object):
     report_status_interval: Duration (as a string) until a status update for the
       work item should be send back to the service (e.g., '5.000s' or '5s' if
       zero milliseconds).
+    counters: Counters of the worker reported with the status of the work item,
+      in addition to the counters of its operations.
   """
 
   def __init__(self, proto, map_task):
     self.proto = proto
     self.map_task = map_task
+    self.counters = []
     # Lock to be acquired when reporting status (either reporting progress or
     # reporting completion). The attributes following the lock attribute (e.g.,
     # 'done', 'next_report_index', etc.) must be accessed using the lock because
@@ -435,6 +435,24 @@ class WorkItemTest(unittest.TestCase):
                 input=(1, 0),
                 coders=(CODER.key_coder(), CODER.value_coder()))]))
 
+  def test_output_coders(self):
+    def instruction_output(codec_spec):
+      codec = dataflow.InstructionOutput.CodecValue()
+      for k, v in codec_spec.iteritems():
+        codec.additionalProperties.append(
+            dataflow.InstructionOutput.CodecValue.AdditionalProperty(
+                key=k, value=to_json_value(v)))
+      return dataflow.InstructionOutput(name='out', codec=codec)
+
+    message = get_text_source_to_shuffle_sink_message()
+    instructions = message.workItems[0].mapTask.instructions
+    instructions[0].outputs.append(instruction_output(WINDOWED_CODER_SPEC))
+    instructions[1].outputs.append(
+        instruction_output({'@type': 'kind:unknown'}))
+    work = workitem.get_work_items(message)
+    # Windowed value coders are unwrapped and unknown codecs are ignored.
+    self.assertEqual([[CODER], [None], []], work.map_task.output_coders)
+
   def test_shuffle_source_to_text_sink(self):
     work = workitem.get_work_items(
         get_shuffle_source_to_text_sink_message(GROUPING_SHUFFLE_SOURCE_SPEC))